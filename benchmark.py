@@ -0,0 +1,765 @@
+"""
+benchmark.py
+ネットワーク不要のマイクロベンチマーク集。
+
+  python benchmark.py classify [capture.txt ...] [--repeat N]
+  python benchmark.py cookies [--cookies N] [--files N] [--repeat N]
+  python benchmark.py cookiejar [--cookies N] [--domains N] [--repeat N]
+  python benchmark.py dedup [--files N] [--size KB] [--workers N]
+  python benchmark.py history [--rows N]
+  python benchmark.py disk [--target DIR] [--mb N] [--rate MB/s]
+  python benchmark.py startup [--repeat N] [--max-import-ms MS] [--max-frame-ms MS]
+  python benchmark.py metrics [capture.txt ...] [--repeat N]
+  python benchmark.py reader [capture.txt ...] [--frames N] [--repeat N]
+  python benchmark.py profiles [--jobs N] [--profiles N]
+  python benchmark.py replay [recording.jsonl | capture.txt | DIR ...] [--speed X|max] [--engine]
+
+キャプチャファイル（gallery-dl の標準出力をそのまま保存したもの）を指定しない
+場合は、典型的な出力を模した合成データを使う。
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Callable
+
+from gallery_dl_parser import LineClassifier
+from gallery_dl_dedup import DedupIndex, hash_file
+from gallery_dl_history import HistoryStore, KIND_DONE, KIND_ERROR
+from gallery_dl_disk import DiskMonitor, DISK_OK
+from gallery_dl_metrics import Metrics
+from gallery_dl_engine import JobQueue, JOB_RUNNING
+from gallery_dl_record import Recording, ReplayProcess, load_recording
+from gallery_dl_stream import LineReader
+from gallery_dl_profiles import ProfileStore
+from gallery_dl_cookies import (
+    CookieJarCache, convert_batch, convert_file, iter_json_array, netscape_line, write_netscape,
+)
+
+
+def synthetic_capture(n: int = 100000, seed: int = 1) -> List[str]:
+    """gallery-dl の出力を模した行を ``n`` 行生成する。
+
+    警告・エラー行は gallery-dl 1.32 が実際に出す形（downloader.http の
+    "'<code> <reason>' for '<url>' (n/m)"、job の "Failed to download <name>"、
+    抽出器の "HttpError: ..."）にそろえてある。
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(n):
+        r = rnd.random()
+        post = rnd.randrange(10 ** 9, 10 ** 10)
+        if r < 0.70:
+            lines.append(f"DownloadData/twitter/someuser/{post}_{i % 4 + 1}.jpg")
+        elif r < 0.80:
+            lines.append(f"# DownloadData/twitter/someuser/{post}_1.jpg")
+        elif r < 0.85:
+            lines.append(f"# {i} DownloadData/pixiv/{post}/{post}_p0.png  {rnd.uniform(0.1, 20):.1f} MB/s")
+        elif r < 0.90:
+            lines.append(f"[twitter][info] Requesting https://x.com/i/api/graphql/{post}/UserMedia?cursor={i}")
+        elif r < 0.94:
+            lines.append(f"[downloader.http][warning] '503 Service Unavailable' "
+                         f"for 'https://pbs.twimg.com/media/{post}.jpg' ({i % 6 + 1}/6)")
+        elif r < 0.955:
+            lines.append(f"[downloader.http][warning] '404 Not Found' "
+                         f"for 'https://video.twimg.com/{post}.mp4'")
+        elif r < 0.97:
+            lines.append(f"[download][error] Failed to download {post}.mp4")
+        else:
+            lines.append(f"[twitter][error] HttpError: '429 Too Many Requests' "
+                         f"for 'https://x.com/i/api/graphql/{post}/UserMedia'")
+    return lines
+
+
+def load_captures(paths: List[str]) -> List[str]:
+    lines = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines.extend(line.rstrip() for line in f if line.strip())
+    return lines
+
+
+def _timeit(fn: Callable[[], int], repeat: int) -> float:
+    """``fn`` を ``repeat`` 回実行し、最良の 行/秒 を返す。"""
+    best = 0.0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        n = fn()
+        dt = time.perf_counter() - t0
+        best = max(best, n / dt if dt > 0 else 0.0)
+    return best
+
+
+def bench_classify(args) -> None:
+    lines = load_captures(args.captures) if args.captures else synthetic_capture(args.lines)
+
+    def run() -> int:
+        classify = LineClassifier().classify
+        for line in lines:
+            classify(line)
+        return len(lines)
+
+    rate = _timeit(run, args.repeat)
+    print(f"classify: {len(lines)} lines  best of {args.repeat}: {rate:,.0f} lines/s")
+
+
+def synthetic_cookie_export(n: int, seed: int = 1) -> list:
+    """ブラウザ拡張（Cookie-Editor など）のエクスポートを模したクッキーを ``n`` 個作る。"""
+    rnd = random.Random(seed)
+    domains = [".x.com", "x.com", ".pixiv.net", "www.pixiv.net", ".fanbox.cc", ".example.org"]
+    cookies = []
+    for i in range(n):
+        cookies.append({
+            "domain": rnd.choice(domains), "expirationDate": 1.8e9 + rnd.random() * 1e7,
+            "hostOnly": rnd.random() < 0.3, "httpOnly": rnd.random() < 0.5,
+            "name": f"c{i}_{rnd.randrange(1 << 30):x}", "path": "/", "sameSite": "lax",
+            "secure": rnd.random() < 0.8, "session": False, "storeId": "0",
+            "value": "%032x" % rnd.getrandbits(128),
+        })
+    return cookies
+
+
+def _convert_baseline(json_path: str, out_dir: str) -> int:
+    """以前の変換（json.load で全体を読み、1 行ごとに write）。"""
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    with open(json_path, "r", encoding="utf-8") as f:
+        cookies = json.load(f)
+    with open(os.path.join(out_dir, f"{stem}.txt"), "w", encoding="utf-8", newline="\n") as f:
+        f.write("# Netscape HTTP Cookie File\n")
+        f.write("# Converted by Gallery-DL GUI\n\n")
+        for c in cookies:
+            domain  = c.get("domain", "")
+            flag    = "FALSE" if c.get("hostOnly", False) else "TRUE"
+            path    = c.get("path", "/")
+            secure  = "TRUE" if c.get("secure", False) else "FALSE"
+            expiry  = str(int(c.get("expiry") or c.get("expirationDate") or 0))
+            name    = c.get("name", "")
+            value   = c.get("value", "")
+            f.write(f"{domain}\t{flag}\t{path}\t{secure}\t{expiry}\t{name}\t{value}\n")
+    return len(cookies)
+
+
+def bench_cookies(args) -> None:
+    tmp = tempfile.mkdtemp(prefix="gdl-cookie-bench-")
+    try:
+        src = os.path.join(tmp, "src")
+        os.makedirs(src)
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(src, f"site{i}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(synthetic_cookie_export(args.cookies, seed=i), f)
+            paths.append(path)
+        total = args.cookies * args.files
+        size = sum(os.path.getsize(p) for p in paths)
+        print(f"cookies: {args.files} file(s) x {args.cookies:,} cookies ({size / 1e6:.1f} MB)")
+
+        def out_dir() -> str:
+            d = os.path.join(tmp, "out")
+            shutil.rmtree(d, ignore_errors=True)
+            os.makedirs(d)
+            return d
+
+        def baseline() -> int:
+            d = out_dir()
+            return sum(_convert_baseline(p, d) for p in paths)
+
+        def batched() -> int:
+            d = out_dir()
+            return sum(convert_file(p, d, remove_source=False).cookies for p in paths)
+
+        def streaming() -> int:
+            # ファイルの大きさにかかわらず逐次デコードする場合
+            d = out_dir()
+            n = 0
+            for p in paths:
+                with open(p, "r", encoding="utf-8-sig") as f:
+                    stem = os.path.splitext(os.path.basename(p))[0]
+                    n += write_netscape(iter_json_array(f), os.path.join(d, f"{stem}.txt"))[0]
+            return n
+
+        def parallel() -> int:
+            d = out_dir()
+            return sum(r.cookies for r in convert_batch(paths, d, remove_source=False))
+
+        for label, fn in [("json.load + write per row", baseline),
+                          ("batched write, sequential", batched),
+                          ("streaming decode, sequential", streaming),
+                          ("batched write, parallel", parallel)]:
+            rate = _timeit(fn, args.repeat)
+            print(f"  {label:<28} {rate:>12,.0f} cookies/s  ({total / rate:.2f}s)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_cookiejar(args) -> None:
+    """ブラウザの丸ごとのダンプを渡す場合と、サイトごとに絞ったジャーを渡す場合の比較。"""
+    try:
+        from gallery_dl import util
+    except ImportError:
+        util = None
+    rnd = random.Random(1)
+    now = int(time.time())
+    domains = ["pixiv.net"] + [f"site{i}.example" for i in range(args.domains - 1)]
+    tmp = tempfile.mkdtemp(prefix="gdl-cookiejar-bench-")
+    try:
+        cookie_dir = os.path.join(tmp, "cookies")
+        os.makedirs(cookie_dir)
+        path = os.path.join(cookie_dir, "browser.txt")
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.write("# Netscape HTTP Cookie File\n\n")
+            for i in range(args.cookies):
+                # 1 割は期限切れ
+                expiry = now - 3600 if rnd.random() < 0.1 else now + rnd.randrange(1, 10 ** 7)
+                f.write(netscape_line({
+                    "domain": "." + rnd.choice(domains), "path": "/", "secure": True,
+                    "expirationDate": expiry, "name": f"c{i}", "value": "%032x" % rnd.getrandbits(128),
+                }))
+        print(f"cookiejar: {args.cookies:,} cookies over {args.domains:,} domains "
+              f"({os.path.getsize(path) / 1e6:.1f} MB)")
+
+        def best(fn) -> float:
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - t0)
+            return min(times) * 1000.0
+
+        url = "https://www.pixiv.net/users/1"
+        cold = best(lambda: CookieJarCache(cookie_dir).jar_for(path, url))
+        cache = CookieJarCache(cookie_dir)
+        jar = cache.jar_for(path, url)
+        warm = best(lambda: cache.jar_for(path, url))
+        print(f"  index + write jar (cold)       {cold:8.2f} ms")
+        print(f"  jar for next job (warm)        {warm:8.2f} ms")
+        print(f"  jar size                       {os.path.getsize(jar) / 1e3:8.1f} kB")
+        if util is not None:
+            def load(p):
+                with open(p, encoding="utf-8") as f:
+                    util.cookiestxt_load(f)
+            print(f"  gallery-dl load, full file     {best(lambda: load(path)):8.2f} ms")
+            print(f"  gallery-dl load, site jar      {best(lambda: load(jar)):8.2f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _hash_read(path: str) -> str:
+    """比較用: read() でバッファにコピーしながらハッシュする。"""
+    import hashlib
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def bench_dedup(args) -> None:
+    tmp = tempfile.mkdtemp(prefix="gdl-dedup-bench-")
+    try:
+        root = os.path.join(tmp, "DownloadData")
+        rnd = random.Random(1)
+        paths = []
+        for i in range(args.files):
+            d = os.path.join(root, f"gallery{i % 20}")
+            os.makedirs(d, exist_ok=True)
+            path = os.path.join(d, f"{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(rnd.randbytes(args.size * 1024))
+            paths.append(path)
+        total = args.files * args.size * 1024
+        print(f"dedup: {args.files} file(s) x {args.size} kB ({total / 1e6:.0f} MB, in page cache)")
+
+        for label, fn in [("read() + blake2b", _hash_read), ("mmap + blake2b", hash_file)]:
+            t0 = time.perf_counter()
+            for p in paths:
+                fn(p)
+            dt = time.perf_counter() - t0
+            print(f"  {label:<28} {total / dt / 1e6:10.0f} MB/s")
+
+        for n, (label, workers) in enumerate([("re-index, 1 process", 1),
+                                              (f"re-index, {args.workers} processes", args.workers)]):
+            index = DedupIndex(os.path.join(tmp, f"dedup{n}.sqlite3"), root)
+            r = index.reindex(workers=workers)
+            index.close()
+            print(f"  {label:<28} {total / r.seconds / 1e6:10.0f} MB/s  ({r.hashed} files, {r.seconds:.2f}s)")
+
+        index = DedupIndex(os.path.join(tmp, "dedup0.sqlite3"), root)
+        r = index.reindex()
+        index.close()
+        print(f"  {'re-index, unchanged':<28} {r.seconds * 1000:10.1f} ms    ({r.hashed} hashed)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_history(args) -> None:
+    tmp = tempfile.mkdtemp(prefix="gdl-history-bench-")
+    try:
+        store = HistoryStore(os.path.join(tmp, "history.sqlite3"))
+        rnd = random.Random(1)
+        sites = ["x.com", "pixiv.net", "kemono.su", "danbooru.donmai.us"] + \
+                [f"site{i}.example" for i in range(50)]
+        t0 = time.perf_counter()
+        for i in range(args.rows):
+            site = sites[min(int(rnd.expovariate(0.5)), len(sites) - 1)]
+            user = f"user{rnd.randrange(2000)}"
+            post = rnd.randrange(10 ** 9, 10 ** 10)
+            source = f"https://{site}/{user}"
+            if rnd.random() < 0.02:
+                store.add_file(KIND_ERROR, source, f"https://cdn.{site}/{post}.jpg", None,
+                               message="HTTP Error 404: Not Found", job=i // 500)
+            else:
+                store.add_file(KIND_DONE, source, f"https://cdn.{site}/{post}.jpg",
+                               f"DownloadData/{site}/{user}/{post}_p0.jpg",
+                               rnd.randrange(10 ** 5, 10 ** 7), rnd.random() * 3, job=i // 500)
+        queued = time.perf_counter() - t0
+        store.close()
+        total = time.perf_counter() - t0
+        size = os.path.getsize(os.path.join(tmp, "history.sqlite3"))
+        print(f"history: {args.rows:,} rows ({size / 1e6:.0f} MB)")
+        print(f"  {'append (caller side)':<32} {args.rows / queued:12,.0f} rows/s")
+        print(f"  {'append (written to disk)':<32} {args.rows / total:12,.0f} rows/s")
+
+        def ms(fn, repeat=5) -> float:
+            best = float("inf")
+            for _ in range(repeat):
+                t = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - t)
+            return best * 1000.0
+
+        last = store.search()
+        cases = [
+            ("newest page", lambda: store.search()),
+            ("page 50 (keyset)", lambda: store.search(before=last[-1].id - 50 * 200)),
+            ("site filter", lambda: store.search(site="kemono.su")),
+            ("failed only", lambda: store.search(kind=KIND_ERROR)),
+            ("text: common term", lambda: store.search("pixiv")),
+            ("text: rare term", lambda: store.search("user1234")),
+            ("text + site + 7 days", lambda: store.search("user12", site="x.com",
+                                                          since=time.time() - 7 * 86400)),
+        ]
+        for label, fn in cases:
+            print(f"  {label:<32} {ms(fn):12.2f} ms")
+        store.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_disk(args) -> None:
+    """保存先の監視の負荷と、一定速度で書いたときに状態が変わるまでの時間。
+
+    reserve を「今の空き − mb/2」にするので、書き込みの途中で low になる
+    （小さな tmpfs やループバックのボリュームを --target に渡すと実際の状況に近い）。
+    """
+    tmp = tempfile.mkdtemp(prefix="gdl-disk-bench-", dir=args.target)
+    try:
+        monitor = DiskMonitor(tmp, reserve=0, interval=0.2)
+        n = 2000
+        t0 = time.perf_counter()
+        for _ in range(n):
+            monitor.sample()
+        cost = (time.perf_counter() - t0) / n
+        free = monitor.latest.free
+        total = args.mb << 20
+        if free < total:
+            print(f"disk: only {free >> 20} MB free on {tmp}, need {args.mb} MB")
+            return
+        monitor.set_reserve(free - total // 2)
+        print(f"disk: {tmp}  ({free / 1e6:,.0f} MB free, reserve {monitor.reserve / 1e6:,.0f} MB)")
+        print(f"  {'sample()':<32} {cost * 1e6:12.1f} us")
+
+        changes = []
+        monitor.on_change = lambda s: changes.append((time.perf_counter(), s))
+        monitor.start()
+        chunk = b"\0" * (1 << 20)
+        started = time.perf_counter()
+        with open(os.path.join(tmp, "fill.bin"), "wb") as f:
+            for i in range(args.mb):
+                f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+                # 一定の書き込み速度に合わせる
+                delay = started + (i + 1) / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        elapsed = time.perf_counter() - started
+        time.sleep(0.5)
+        monitor.stop()
+        print(f"  {'written':<32} {args.mb:12,} MB in {elapsed:.1f}s ({args.mb / elapsed:.1f} MB/s)")
+        print(f"  {'measured write rate':<32} {monitor.latest.write_rate / (1 << 20):12.1f} MB/s")
+        for at, s in changes:
+            if s.state != DISK_OK:
+                print(f"  {'-> ' + s.state:<32} {at - started:12.1f} s    ({s.free / 1e6:,.0f} MB free)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_metrics(args) -> None:
+    """JobQueue の読み取りループ 1 行あたりのコスト: メトリクスなし / 記録なし / 記録あり。
+
+    gallery-dl を起動する代わりにキャプチャを流すので、測っているのは分類と
+    カウンタ・ヒストグラムの更新だけ（出力待ちと Tk の描画は含まない）。
+    """
+    lines = load_captures(args.captures) if args.captures else synthetic_capture(args.lines)
+    recording = Recording.from_lines(lines)
+    tmp = tempfile.mkdtemp(prefix="gdl-metrics-bench-")
+    try:
+        def run_with(metrics) -> Callable[[], int]:
+            q = JobQueue(os.path.join(tmp, "queue.json"), build_args=lambda job: [],
+                         on_event=lambda job, ev: None, on_message=lambda job, text, tag: None,
+                         on_state=lambda job: None, on_idle=lambda: None, metrics=metrics,
+                         launcher=lambda job, job_args: ReplayProcess(recording))
+
+            def run() -> int:
+                job = q.add(["https://example.com/bench"])[0]
+                job.state = JOB_RUNNING
+                q._run_job(job)
+                q.remove(job.id)
+                return len(lines)
+            return run
+
+        base = None
+        print(f"metrics: {len(lines)} lines through the job reader loop, best of {args.repeat}")
+        for label, metrics in [("no metrics", None), ("counters only (tab closed)", Metrics()),
+                               ("counters + timings (tab open)", Metrics())]:
+            if metrics is not None and "open" in label:
+                metrics.enable("bench")
+            rate = _timeit(run_with(metrics), args.repeat)
+            per_line = 1e6 / rate
+            extra = f"  (+{per_line - base:.2f} us)" if base is not None else ""
+            base = per_line if base is None else base
+            print(f"  {label:<32} {rate:12,.0f} lines/s {per_line:8.2f} us/line{extra}")
+            if metrics is not None and metrics.enabled:
+                n = 200
+                t0 = time.perf_counter()
+                for _ in range(n):
+                    metrics.to_prometheus()
+                prom = (time.perf_counter() - t0) / n
+                t0 = time.perf_counter()
+                for _ in range(n):
+                    metrics.to_json()
+                print(f"  {'export (Prometheus / JSON)':<32} {prom * 1e3:12.2f} ms "
+                      f"{(time.perf_counter() - t0) / n * 1e3:8.2f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_reader(args) -> None:
+    """サブプロセスの出力の読み取り: 以前のテキストモードの for 文と LineReader。
+
+    ``progress`` は 1 ファイルごとに CR で上書きする進捗を ``--frames`` 回書く出力で、
+    LineReader は続けて読めた進捗行を最後の 1 行にまとめる（ログに流す行は同じ）。
+    """
+    lines = load_captures(args.captures) if args.captures else synthetic_capture(args.lines)
+    plain = "".join(line + "\n" for line in lines).encode("utf-8")
+    parts = []
+    for i, line in enumerate(lines[:2000]):
+        parts.append(f"  /tmp/file{i}.jpg")
+        parts.extend(f"\r{p * 100 // args.frames:>3}% {p * 37}kB 1.20MB/s " for p in range(args.frames))
+        parts.append(f"\r{line}\n")
+    progress = "".join(parts).encode("utf-8")
+
+    print(f"reader: input lines per second (progress updates included), best of {args.repeat}")
+    for name, data in [("plain", plain), ("progress", progress)]:
+        reader = LineReader(io.BufferedReader(io.BytesIO(data)))
+        delivered = sum(1 for _line in reader)
+        total = delivered + reader.coalesced
+
+        def text_mode() -> int:
+            stream = io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)),
+                                      encoding="utf-8", errors="replace")
+            for _line in stream:
+                pass
+            return total
+
+        def line_reader() -> int:
+            for _line in LineReader(io.BufferedReader(io.BytesIO(data))):
+                pass
+            return total
+
+        for label, run in [("text mode (for line in stdout)", text_mode), ("LineReader", line_reader)]:
+            print(f"  {name:<9} {label:<32} {_timeit(run, args.repeat):14,.0f} lines/s")
+        print(f"  {name:<9} {'delivered / coalesced':<32} {delivered:14,} {reader.coalesced:,}")
+
+
+def bench_profiles(args) -> None:
+    """ジョブごとの設定ファイルの用意: 毎回読み込んでマージする場合とキャッシュ済みの場合。"""
+    tmp = tempfile.mkdtemp(prefix="gdl-profiles-bench-")
+    try:
+        base = os.path.join(tmp, "gallery-dl.conf")
+        with open(base, "w", encoding="utf-8") as f:
+            json.dump({"extractor": {"base-directory": "DownloadData",
+                                     "postprocessors": [{"name": "metadata", "mode": "json"}] * 20},
+                       "downloader": {"part": True}}, f)
+        profiles = {f"p{i}": {"hosts": [f"site{i}.example"], "per_host": 1,
+                              "config": {"downloader": {"http": {"chunk-size": f"{i + 1}M"}},
+                                         "extractor": {"filename": f"{i}_{{filename}}.{{extension}}"}}}
+                    for i in range(args.profiles)}
+        path = os.path.join(tmp, "profiles.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"profiles": profiles}, f)
+        urls = [f"https://www.site{i % args.profiles}.example/gallery/{i}" for i in range(args.jobs)]
+
+        def per_job(store_for: Callable[[], ProfileStore]) -> float:
+            t0 = time.perf_counter()
+            for url in urls:
+                store = store_for()
+                store.config_for(base, store.profile_for(url))
+            return (time.perf_counter() - t0) / len(urls)
+
+        cold = per_job(lambda: ProfileStore(path))     # 毎回作り直す = 読み込み・マージ・ハッシュ
+        store = ProfileStore(path)
+        cached = per_job(lambda: store)
+        print(f"profiles: {args.jobs} jobs over {args.profiles} site profiles")
+        print(f"  {'parse + merge + hash per job':<32} {cold * 1e6:10.1f} us/job")
+        print(f"  {'cached per job':<32} {cached * 1e6:10.1f} us/job")
+        print(f"  {'generated configs':<32} {len(os.listdir(store.config_dir)):10,}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _load_replay_inputs(paths: List[str]) -> List[Recording]:
+    """記録（.jsonl / .jsonl.gz）、ディレクトリ内の記録、時刻のないキャプチャを読む。"""
+    recordings = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, "*.jsonl")) +
+                           glob.glob(os.path.join(path, "*.jsonl.gz")))
+            recordings += [load_recording(f) for f in files]
+        elif path.endswith((".jsonl", ".jsonl.gz")):
+            recordings.append(load_recording(path))
+        else:
+            recordings.append(Recording.from_lines(load_captures([path]),
+                                                   f"https://example.com/{os.path.basename(path)}"))
+    return recordings
+
+
+def bench_replay(args) -> int:
+    """記録を GUI の解析・描画の経路（スタブの Tk）か JobQueue だけに流して時間を計る。
+
+    記録の最終行のカウンタと再生で数えた値が違えば終了コード 1（パーサーの回帰テスト）。
+    --min-rate を下回ったときも 1 を返す。
+    """
+    from gallery_dl_replay import replay_gui, replay_engine
+    recordings = (_load_replay_inputs(args.inputs) if args.inputs
+                  else [Recording.from_lines(synthetic_capture(args.lines))])
+    if not recordings:
+        print("replay: no recordings found")
+        return 1
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    mode = "engine" if args.engine else "gui (stub Tk)"
+    replay = replay_engine if args.engine else replay_gui
+    print(f"replay: {len(recordings)} recording(s), {sum(len(r.lines) for r in recordings):,} lines, "
+          f"{mode}, {'max speed' if speed <= 0 else f'{speed:g}x'}, best of {args.repeat}")
+
+    best = None
+    for _ in range(args.repeat):
+        result = replay(recordings, speed, args.workers)
+        if best is None or result.seconds < best.seconds:
+            best = result
+    rate = best.lines / best.seconds if best.seconds > 0 else 0.0
+    print(f"  {'total':<24} {best.seconds:10.3f} s  {rate:12,.0f} lines/s")
+    hist = best.metrics["histograms"]
+
+    def fmt(v) -> str:
+        return "" if v is None else f"{v * 1e6:,.1f}"
+    print(f"  {'':<24} {'count':>10} {'p50 us':>10} {'p99 us':>10} {'max us':>12}")
+    for name, label in [("gallery_dl_read_wait_seconds", "wait for output"),
+                        ("gallery_dl_parse_seconds", "classify line"),
+                        ("gallery_dl_dispatch_seconds", "dispatch to log"),
+                        ("gallery_dl_tk_frame_seconds", "Tk log frame")]:
+        h = hist.get(name)
+        if h and h["count"]:
+            print(f"  {label:<24} {h['count']:10,} {fmt(h['p50']):>10} {fmt(h['p99']):>10} "
+                  f"{fmt(h['max']):>12}")
+    backlog = hist.get("gallery_dl_tk_backlog_lines")
+    if backlog and backlog["count"]:
+        print(f"  {'Tk backlog (lines)':<24} {'':>10} {backlog['p50']:10,.0f} {backlog['p99']:10,.0f} "
+              f"{backlog['max']:12,.0f}")
+    if best.text_inserts:
+        print(f"  {'log view redraws':<24} {best.text_inserts:10,}")
+
+    failed = False
+    for m in best.mismatches:
+        print(f"  FAIL: {m}")
+        failed = True
+    if args.min_rate is not None and rate < args.min_rate:
+        print(f"  FAIL: {rate:,.0f} lines/s < {args.min_rate:,.0f}")
+        failed = True
+    if not failed and any(r.result for r in recordings):
+        print("  counts match the recordings")
+    return 1 if failed else 0
+
+
+# GUI の起動で読み込まれてはいけないモジュール（使うときに読み込む）
+DEFERRED_MODULES = ("gallery_dl_api", "http.server", "concurrent.futures", "multiprocessing",
+                    "hashlib", "sqlite3", "ctypes", "glob", "tkinter.messagebox",
+                    "tkinter.filedialog")
+
+_STARTUP_CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import gallery_dl_gui
+result = {"import_ms": (time.perf_counter() - t0) * 1000,
+          "deferred": [m for m in sys.argv[1:] if m in sys.modules]}
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    result["error"] = str(e)
+    print(json.dumps(result))
+    sys.exit(0)
+mapped = []
+root.bind("<Map>", lambda e: mapped.append(time.perf_counter()) if e.widget is root else None)
+t1 = time.perf_counter()
+app = gallery_dl_gui.GalleryDLApp(root)
+result["init_ms"] = (time.perf_counter() - t1) * 1000
+def poll():
+    if mapped and not app._startup_steps:
+        result["first_frame_ms"] = (mapped[0] - t0) * 1000
+        result["ready_ms"] = (time.perf_counter() - t0) * 1000
+        root.quit()
+    else:
+        root.after(2, poll)
+root.after(2, poll)
+root.mainloop()
+app._on_close()
+print(json.dumps(result))
+'''
+
+
+def bench_startup(args) -> int:
+    """GUI の起動時間（毎回新しいプロセス）: import、最初のフレーム、起動処理の完了まで。
+
+    GUI は自分の場所に queue.json などを作るので、ソースを一時ディレクトリにコピーして
+    そこで起動する。ディスプレイがなければ import だけを計る。``--max-*`` を超えたとき、
+    または DEFERRED_MODULES が起動時に読み込まれたときは終了コード 1 を返す（CI 用）。
+    """
+    tmp = tempfile.mkdtemp(prefix="gdl-startup-bench-")
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        for path in glob.glob(os.path.join(here, "*.py")):
+            shutil.copy(path, tmp)
+        subprocess.run([sys.executable, "-m", "compileall", "-q", tmp], check=True)
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, "-c", _STARTUP_CHILD, *DEFERRED_MODULES],
+                                 cwd=tmp, capture_output=True, text=True, timeout=60)
+            if out.returncode != 0:
+                print(out.stderr, file=sys.stderr)
+                return 1
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"startup: best of {args.repeat} (fresh process each)")
+    best = {}
+    for key, label in [("import_ms", "import gallery_dl_gui"), ("init_ms", "GalleryDLApp.__init__"),
+                       ("first_frame_ms", "first frame (window mapped)"),
+                       ("ready_ms", "all tabs and cookie list ready")]:
+        values = [r[key] for r in runs if key in r]
+        if values:
+            best[key] = min(values)
+            print(f"  {label:<32} {best[key]:10.1f} ms")
+    if "error" in runs[0]:
+        print(f"  (no display: {runs[0]['error']})")
+
+    failed = False
+    deferred = sorted({m for r in runs for m in r["deferred"]})
+    if deferred:
+        print(f"  FAIL: imported at startup: {', '.join(deferred)}")
+        failed = True
+    for key, limit in (("import_ms", args.max_import_ms), ("first_frame_ms", args.max_frame_ms)):
+        if limit is not None and key in best and best[key] > limit:
+            print(f"  FAIL: {key} {best[key]:.1f} > {limit:.1f}")
+            failed = True
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Gallery-DL GUI micro benchmarks")
+    sub = parser.add_subparsers(dest="suite", required=True)
+
+    p = sub.add_parser("classify", help="output line classifier throughput")
+    p.add_argument("captures", nargs="*", help="captured gallery-dl output files")
+    p.add_argument("--lines", type=int, default=100000, help="synthetic line count")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_classify)
+
+    p = sub.add_parser("cookies", help="JSON → Netscape cookie conversion throughput")
+    p.add_argument("--cookies", type=int, default=100000, help="cookies per synthetic export")
+    p.add_argument("--files", type=int, default=4, help="number of export files")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_cookies)
+
+    p = sub.add_parser("cookiejar", help="per-site cookie jar vs. whole cookie file")
+    p.add_argument("--cookies", type=int, default=50000, help="cookies in the synthetic dump")
+    p.add_argument("--domains", type=int, default=2000, help="distinct domains in the dump")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_cookiejar)
+
+    p = sub.add_parser("dedup", help="content hashing and re-index throughput")
+    p.add_argument("--files", type=int, default=400)
+    p.add_argument("--size", type=int, default=1024, help="file size in kB")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.set_defaults(func=bench_dedup)
+
+    p = sub.add_parser("history", help="download history append and paged search")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_history)
+
+    p = sub.add_parser("disk", help="download volume monitor: sampling cost and state changes")
+    p.add_argument("--target", metavar="DIR", help="directory on the volume to test (default: temp dir)")
+    p.add_argument("--mb", type=int, default=64, help="megabytes to write")
+    p.add_argument("--rate", type=float, default=16.0, help="write rate in MB/s")
+    p.set_defaults(func=bench_disk)
+
+    p = sub.add_parser("startup", help="GUI cold start: import time and time to first frame")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--max-import-ms", type=float, metavar="MS", help="fail if the import is slower")
+    p.add_argument("--max-frame-ms", type=float, metavar="MS", help="fail if the first frame is later")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("metrics", help="instrumentation overhead in the job reader loop")
+    p.add_argument("captures", nargs="*", help="captured gallery-dl output files")
+    p.add_argument("--lines", type=int, default=100000, help="synthetic line count")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_metrics)
+
+    p = sub.add_parser("reader", help="subprocess output reader: text mode vs. LineReader")
+    p.add_argument("captures", nargs="*", help="captured gallery-dl output files")
+    p.add_argument("--lines", type=int, default=100000, help="synthetic line count")
+    p.add_argument("--frames", type=int, default=50, help="progress updates per file")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=bench_reader)
+
+    p = sub.add_parser("profiles", help="per-site config generation: cold merge vs. cached")
+    p.add_argument("--jobs", type=int, default=5000)
+    p.add_argument("--profiles", type=int, default=20)
+    p.set_defaults(func=bench_profiles)
+
+    p = sub.add_parser("replay", help="replay recorded sessions through the parse-and-render pipeline")
+    p.add_argument("inputs", nargs="*", help="recordings (.jsonl), directories of them, or captures")
+    p.add_argument("--lines", type=int, default=100000, help="synthetic line count without inputs")
+    p.add_argument("--speed", default="max", help="1 = as recorded, 2 = twice as fast, max = no waits")
+    p.add_argument("--engine", action="store_true", help="JobQueue only, without the GUI")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--repeat", type=int, default=1)
+    p.add_argument("--min-rate", type=float, metavar="LINES_PER_SEC",
+                   help="fail if the replay is slower")
+    p.set_defaults(func=bench_replay)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -38,13 +38,16 @@ if (-not (Test-Path "$DIST_DIR\GalleryDL-GUI.exe")) {
 
 # 4. Assets
 Write-Host "[4/5] Copying runtime assets..." -ForegroundColor Yellow
-@("cookies", "json_input", "DownloadData") | ForEach-Object {
+@("cookies", "json_input", "DownloadData", "archives") | ForEach-Object {
     $dir = "$DIST_DIR\$_"
     if (-not (Test-Path $dir)) { New-Item -ItemType Directory $dir | Out-Null }
 }
 
 if (Test-Path "$ROOT\gallery-dl.conf") { Copy-Item "$ROOT\gallery-dl.conf" "$DIST_DIR\" -Force }
+if (Test-Path "$ROOT\profiles.json") { Copy-Item "$ROOT\profiles.json" "$DIST_DIR\" -Force }
 if (Test-Path "$ROOT\convert_cookies.py") { Copy-Item "$ROOT\convert_cookies.py" "$DIST_DIR\" -Force }
+if (Test-Path "$ROOT\gallery_dl_cookies.py") { Copy-Item "$ROOT\gallery_dl_cookies.py" "$DIST_DIR\" -Force }
+if (Test-Path "$ROOT\gallery_dl_runner.py") { Copy-Item "$ROOT\gallery_dl_runner.py" "$DIST_DIR\" -Force }
 
 # Copy python dir (excluding the exe and site-packages if we want to save space, but let's follow the previous script)
 # Since we are using this python to run the script, we should be careful.
@@ -0,0 +1,448 @@
+"""
+gallery_dl_api.py
+ローカル（127.0.0.1）向けの HTTP/JSON 制御 API。
+
+スクリプトやブラウザ拡張から URL を投入し、キューの状態を取得し、進捗を
+Server-Sent Events で受け取り、ジョブを止められるようにする。JobQueue を
+直接操作するので Tk には依存しない（GUI とヘッドレスの両方から使う）。
+リクエストは http.server のスレッドで処理し、Tk のメインループは待たせない。
+
+  GET    /api/status                 キュー全体の状態と進捗
+  GET    /api/jobs[?state=running]   ジョブ一覧
+  POST   /api/jobs                   {"urls": [...], "cookie": "x.txt", "start": true}
+                                     （text/plain なら 1 行 1 URL）
+  GET    /api/jobs/<id>              ジョブ 1 つ
+  POST   /api/jobs/<id>/cancel       ジョブを止める（待機中なら停止状態にする）
+  POST   /api/jobs/<id>/requeue      終わったジョブを待機中に戻す
+  DELETE /api/jobs/<id>              ジョブをキューから外す
+  POST   /api/start | /api/stop      キューの開始 / 一時停止
+  GET    /api/events                 SSE: job / message / progress イベント
+  GET    /api/metrics[?format=json]  メトリクス（既定は Prometheus のテキスト形式）
+                                     最初に取得したときから 1 行ごとの時間の記録も始める
+
+トークンを設定した場合は ``Authorization: Bearer <token>`` か ``?token=`` が必要
+（EventSource はヘッダーを付けられないのでクエリでも受け付ける）。
+"""
+import hmac
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Any, Callable, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from gallery_dl_engine import Job, JobQueue, split_urls, FINISHED_STATES, JOB_RUNNING
+
+API_VERSION     = 1
+API_HOST        = "127.0.0.1"   # 外部には公開しない
+DEFAULT_PORT    = 8777
+MAX_BODY_BYTES  = 1 << 20       # 投入 1 回あたりの本文の上限
+MAX_URLS        = 10000         # 投入 1 回あたりの URL 数の上限
+SSE_PROGRESS_INTERVAL = 1.0     # progress イベントの間隔（秒）
+SSE_KEEPALIVE   = 15.0          # 何も送るものがないときのコメント行の間隔
+SUBSCRIBER_QUEUE = 2000         # 購読者 1 人あたりのイベントのバッファ（溢れたら古いものを捨てる）
+
+_JOB_PATH_RE = re.compile(r"^/api/jobs/(\d+)(?:/(cancel|requeue))?/?$")
+
+
+def load_api_settings(path: str) -> Dict[str, Any]:
+    """api.json を読む。トークンがなければ作って保存する。"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    settings = {
+        "enabled": bool(data.get("enabled", False)),
+        "port": int(data.get("port", DEFAULT_PORT)),
+        "token": data.get("token") or secrets.token_urlsafe(24),
+    }
+    if settings != data:
+        save_api_settings(path, settings)
+    return settings
+
+
+def save_api_settings(path: str, settings: Dict[str, Any]):
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(settings, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def job_info(job: Job) -> Dict[str, Any]:
+    """API で返すジョブの表現（保存形式に実行中の進捗を足したもの）。"""
+    info = job.to_dict()
+    info.pop("partials", None)
+    info["partial"] = bool(job.partials)
+    if job.state == JOB_RUNNING:
+        info.update({
+            "fraction": job.fraction(),
+            "item_num": job.item_num, "item_count": job.item_count,
+            "file_received": job.file_received, "file_total": job.file_total,
+            "current_url": job.current_url, "speed": job.speed,
+            "elapsed": round(job.elapsed, 3),
+        })
+    return info
+
+
+class EventHub:
+    """SSE の購読者ごとのキューにイベントを配る。発行側（ワーカースレッド）は決して待たない。"""
+
+    def __init__(self):
+        self._subscribers: List["queue.Queue[Tuple[str, Dict[str, Any]]]"] = []
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def subscribe(self) -> "queue.Queue[Tuple[str, Dict[str, Any]]]":
+        q: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue(SUBSCRIBER_QUEUE)
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                # 読むのが遅いクライアント: 一番古いイベントを捨てて新しいほうを入れる
+                try:
+                    q.get_nowait()
+                    q.put_nowait((event, data))
+                except (queue.Empty, queue.Full):
+                    pass
+                self.dropped += 1
+
+
+class ApiServer:
+    """JobQueue を操作する HTTP サーバー。start() / stop() で開始・終了する。
+
+    - on_start()    キューを開始するとき（GUI はボタンの状態も合わせる）。None なら queue.start
+    - on_stop()     キューを一時停止するとき。None なら queue.stop_all
+    ``cookie_dir`` を渡すと、投入時の "cookie" はこのフォルダにあるファイル名だけを受け付ける。
+    job_changed() / message() をキューのコールバックから呼ぶと SSE に流れる。
+    """
+
+    def __init__(self, job_queue: JobQueue, port: int = DEFAULT_PORT, token: Optional[str] = None,
+                 on_start: Optional[Callable[[], None]] = None,
+                 on_stop: Optional[Callable[[], None]] = None,
+                 cookie_dir: Optional[str] = None):
+        self.queue = job_queue
+        self.port = port
+        self.token = token
+        self.on_start = on_start or job_queue.start
+        self.on_stop = on_stop or job_queue.stop_all
+        self.cookie_dir = cookie_dir
+        self.hub = EventHub()
+        self.submitted = 0                 # API 経由で投入した URL の数
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._stopped = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{API_HOST}:{self.port}/api/"
+
+    def start(self):
+        """ソケットを開いてサーバースレッドを起動する（ポートが使えなければ OSError）。"""
+        httpd = ThreadingHTTPServer((API_HOST, self.port), _Handler)
+        httpd.daemon_threads = True
+        httpd.api = self                   # type: ignore[attr-defined]
+        self.port = httpd.server_address[1]
+        self._httpd = httpd
+        self._stopped.clear()
+        threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.5},
+                         daemon=True).start()
+        threading.Thread(target=self._progress_loop, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        httpd, self._httpd = self._httpd, None
+        if httpd is not None:
+            httpd.shutdown()
+            httpd.server_close()
+
+    @property
+    def running(self) -> bool:
+        return self._httpd is not None
+
+    # キューからの通知（ワーカースレッドから呼ばれる）
+    # ──────────────────────────────────────────────
+    def job_changed(self, job: Job):
+        if len(self.hub):
+            self.hub.publish("job", job_info(job))
+
+    def message(self, job: Optional[Job], text: str, tag: str):
+        if len(self.hub):
+            self.hub.publish("message", {"job": job.id if job is not None else None,
+                                         "text": text, "tag": tag})
+
+    def _progress_loop(self):
+        while not self._stopped.wait(SSE_PROGRESS_INTERVAL):
+            if len(self.hub) and self.queue.running():
+                self.hub.publish("progress", self.queue.progress())
+
+    # 操作
+    # ──────────────────────────────────────────────
+    def status(self) -> Dict[str, Any]:
+        return {
+            "version": API_VERSION,
+            "active": self.queue.active,
+            "workers": self.queue.workers,
+            "counts": self.queue.counts(),
+            "totals": self.queue.totals(),
+            "progress": self.queue.progress(),
+            "submitted": self.submitted,
+        }
+
+    def jobs(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [job_info(j) for j in self.queue.snapshot(state)]
+
+    def cookie_error(self, cookie: str) -> Optional[str]:
+        """投入された "cookie" が使えない理由（使えるなら None）。"""
+        if cookie in (".", "..") or "/" in cookie or "\\" in cookie or os.path.basename(cookie) != cookie:
+            return "cookie must be a file name in the cookie folder"
+        if self.cookie_dir is not None and not os.path.isfile(os.path.join(self.cookie_dir, cookie)):
+            return f"no cookie file {cookie!r} in the cookie folder"
+        return None
+
+    def submit(self, urls: List[str], cookie: Optional[str], start: bool) -> List[Job]:
+        jobs = self.queue.add(urls, cookie)
+        self.submitted += len(jobs)
+        if start and jobs and not self.queue.active:
+            self.on_start()
+        return jobs
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "GalleryDL-API/1"
+
+    @property
+    def api(self) -> ApiServer:
+        return self.server.api             # type: ignore[attr-defined]
+
+    def log_message(self, format, *args):
+        pass                               # アクセスログは出さない
+
+    # 応答
+    # ──────────────────────────────────────────────
+    def _cors(self):
+        # ブラウザ拡張から呼べるように（トークンがあるので任意のページからは操作できない）
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Headers", "Authorization, Content-Type")
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, DELETE, OPTIONS")
+
+    def _json(self, status: int, data: Any):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self._cors()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str):
+        self._json(status, {"error": message})
+
+    def _authorized(self, query: Dict[str, List[str]]) -> bool:
+        token = self.api.token
+        if not token:
+            return True
+        given = ""
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            given = auth[7:].strip()
+        elif query.get("token"):
+            given = query["token"][0]
+        return hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8"))
+
+    def _route(self, method: str):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if not self._authorized(query):
+            self._error(401, "missing or wrong token")
+            return
+        path = parts.path
+        try:
+            if method == "GET" and path in ("/api", "/api/", "/api/status"):
+                self._json(200, self.api.status())
+            elif method == "GET" and path == "/api/jobs":
+                state = query.get("state", [None])[0]
+                self._json(200, {"jobs": self.api.jobs(state)})
+            elif method == "POST" and path == "/api/jobs":
+                self._submit()
+            elif method == "GET" and path == "/api/events":
+                self._events()
+            elif method == "GET" and path == "/api/metrics":
+                self._metrics(query.get("format", ["prometheus"])[0])
+            elif method == "POST" and path == "/api/start":
+                self.api.on_start()
+                self._json(200, {"active": True})
+            elif method == "POST" and path == "/api/stop":
+                self.api.on_stop()
+                self._json(200, {"active": False})
+            else:
+                m = _JOB_PATH_RE.match(path)
+                if m is None:
+                    self._error(404, "not found")
+                    return
+                self._job(method, int(m.group(1)), m.group(2))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _job(self, method: str, job_id: int, action: Optional[str]):
+        q = self.api.queue
+        job = q.get(job_id)
+        if job is None:
+            self._error(404, f"no job {job_id}")
+        elif method == "GET" and action is None:
+            self._json(200, job_info(job))
+        elif method == "POST" and action == "cancel":
+            if job.state in FINISHED_STATES:
+                self._error(409, f"job {job_id} is already {job.state}")
+                return
+            q.stop(job_id, "API による停止")
+            self._json(202, job_info(job))
+        elif method == "POST" and action == "requeue":
+            if job.state not in FINISHED_STATES:
+                self._error(409, f"job {job_id} is {job.state}")
+                return
+            q.requeue(job_id)
+            self._json(200, job_info(job))
+        elif method == "DELETE" and action is None:
+            q.remove(job_id)
+            self._json(200, {"removed": job_id})
+        else:
+            self._error(405, "method not allowed")
+
+    def _metrics(self, fmt: str):
+        metrics = self.api.queue.metrics
+        if metrics is None:
+            self._error(404, "metrics are not collected")
+            return
+        # ダッシュボードが取得し続ける前提なので、以後はヒストグラムも記録する
+        metrics.enable("api")
+        if fmt == "json":
+            self._json(200, metrics.snapshot())
+            return
+        body = metrics.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self._cors()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> Optional[bytes]:
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            self._error(413, f"body must be at most {MAX_BODY_BYTES} bytes")
+            return None
+        return self.rfile.read(length) if length else b""
+
+    def _submit(self):
+        body = self._read_body()
+        if body is None:
+            return
+        text = body.decode("utf-8", "replace")
+        cookie: Optional[str] = None
+        start = True
+        if "json" in (self.headers.get("Content-Type") or "") or text.lstrip().startswith("{"):
+            try:
+                data = json.loads(text)
+            except ValueError as e:
+                self._error(400, f"invalid JSON: {e}")
+                return
+            if not isinstance(data, dict):
+                self._error(400, "expected a JSON object")
+                return
+            urls = data.get("urls") or []
+            if isinstance(urls, str):
+                urls = split_urls(urls)
+            if data.get("url"):
+                urls = [data["url"]] + list(urls)
+            cookie = data.get("cookie") or None
+            if cookie is not None and not isinstance(cookie, str):
+                self._error(400, "cookie must be a string")
+                return
+            start = bool(data.get("start", True))
+        else:
+            urls = split_urls(text)
+        urls = [u.strip() for u in urls if isinstance(u, str) and u.strip()]
+        if not urls:
+            self._error(400, "no URLs")
+            return
+        if len(urls) > MAX_URLS:
+            self._error(413, f"at most {MAX_URLS} URLs per request")
+            return
+        if cookie is not None:
+            error = self.api.cookie_error(cookie)
+            if error:
+                self._error(400, error)
+                return
+        jobs = self.api.submit(urls, cookie, start)
+        self._json(201, {"jobs": [j.id for j in jobs]})
+
+    def _events(self):
+        """Server-Sent Events。接続直後に全ジョブを送り、その後は変化だけを流す。"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self._cors()
+        self.end_headers()
+        api = self.api
+        sub = api.hub.subscribe()
+        try:
+            self._send_event("status", api.status())
+            for info in api.jobs():
+                self._send_event("job", info)
+            while not api._stopped.is_set():
+                try:
+                    event, data = sub.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                self._send_event(event, data)
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            api.hub.unsubscribe(sub)
+
+    def _send_event(self, event: str, data: Dict[str, Any]):
+        payload = json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._cors()
+        self.send_header("Content-Length", "0")
+        self.end_headers()
@@ -0,0 +1,141 @@
+"""
+gallery_dl_archive.py
+サイト（とクッキー）ごとの gallery-dl ダウンロードアーカイブの管理。
+
+gallery-dl は --download-archive に渡した SQLite ファイルへ取得済みアイテムの
+キーを記録し、次回以降はファイルパスを組み立てる前にスキップする。
+ここではアーカイブを archives/<ホスト>[@<クッキー名>].sqlite3 に分けて置き、
+ジョブごとのヒット数（アーカイブでスキップされたアイテム数）を stats.json に
+積算して、サイズとヒット率を表示できるようにする。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Optional, List, Dict, NamedTuple
+from urllib.parse import urlsplit
+
+ARCHIVE_EXT = ".sqlite3"
+ARCHIVE_TABLE = "archive"      # gallery-dl の既定のテーブル名
+
+_UNSAFE_RE = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def profile_name(url: str, cookie: Optional[str] = None) -> str:
+    """URL のホスト名（www. を除く）とクッキーファイル名からプロファイル名を作る。"""
+    host = (urlsplit(url).hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    name = host or "other"
+    if cookie:
+        name += "@" + os.path.splitext(os.path.basename(cookie))[0]
+    return _UNSAFE_RE.sub("_", name)
+
+
+class ArchiveInfo(NamedTuple):
+    """アーカイブ 1 つぶんの表示用情報。"""
+    profile: str
+    entries: Optional[int]   # 記録済みアイテム数（読めなければ None）
+    size: int                # ファイルサイズ（バイト、-wal を含む）
+    lookups: int             # これまでにアーカイブを照会したアイテム数
+    hits: int                # そのうちアーカイブでスキップされた数
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        return self.hits / self.lookups if self.lookups else None
+
+
+class ArchiveIndex:
+    """archives/ 以下のアーカイブファイルと、その照会・ヒット数の集計。"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._stats_path = os.path.join(directory, "stats.json")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = self._load_stats()
+
+    def _load_stats(self) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(self._stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def path_for(self, url: str, cookie: Optional[str] = None) -> str:
+        """ジョブに渡すアーカイブファイルの絶対パス。"""
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.abspath(os.path.join(self.directory, profile_name(url, cookie) + ARCHIVE_EXT))
+
+    def record(self, url: str, cookie: Optional[str], lookups: int, hits: int):
+        """ジョブ 1 回ぶんの照会数とヒット数を積算する（ワーカースレッドから呼ばれる）。"""
+        if lookups <= 0:
+            return
+        profile = profile_name(url, cookie)
+        with self._lock:
+            st = self._stats.setdefault(profile, {"lookups": 0, "hits": 0})
+            st["lookups"] += lookups
+            st["hits"] += hits
+        self._save_stats()
+
+    def _save_stats(self):
+        with self._lock:
+            data = json.dumps(self._stats, ensure_ascii=False, indent=1)
+        tmp = self._stats_path + ".tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self._stats_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def count_entries(path: str) -> Optional[int]:
+        """アーカイブの記録数。書き込み中のジョブを邪魔しないよう読み取り専用で開く。"""
+        try:
+            con = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+        except sqlite3.Error:
+            return None
+        try:
+            return con.execute(f"SELECT COUNT(*) FROM {ARCHIVE_TABLE}").fetchone()[0]
+        except sqlite3.Error:
+            return None
+        finally:
+            con.close()
+
+    def infos(self) -> List[ArchiveInfo]:
+        """全アーカイブの情報（件数を数えるので Tk スレッド以外で呼ぶ）。"""
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith(ARCHIVE_EXT)]
+        except OSError:
+            names = []
+        with self._lock:
+            stats = {k: dict(v) for k, v in self._stats.items()}
+        out = []
+        for name in sorted(names):
+            path = os.path.join(self.directory, name)
+            size = 0
+            for suffix in ("", "-wal"):
+                try:
+                    size += os.path.getsize(path + suffix)
+                except OSError:
+                    pass
+            profile = name[:-len(ARCHIVE_EXT)]
+            st = stats.get(profile, {})
+            out.append(ArchiveInfo(profile, self.count_entries(path), size,
+                                   st.get("lookups", 0), st.get("hits", 0)))
+        return out
+
+    def delete(self, profile: str):
+        """プロファイルのアーカイブを削除する（次回はすべて再確認される）。"""
+        path = os.path.join(self.directory, profile + ARCHIVE_EXT)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+        with self._lock:
+            self._stats.pop(profile, None)
+        self._save_stats()
@@ -0,0 +1,487 @@
+"""
+gallery_dl_cookies.py
+ブラウザ拡張がエクスポートした JSON クッキーを Netscape 形式（gallery-dl の
+--cookies）に変換する。Tk には依存しない（GUI と convert_cookies.py で共通）。
+
+以前は 1 ファイルずつ json.load で全体を読み込み、1 行ごとに f.write していた。
+ここでは
+  - 巨大な JSON 配列は一定サイズずつ読みながら 1 要素ずつデコードする（メモリは
+    チャンク 1 つぶん + 要素 1 つぶん。普通の大きさのファイルは json.load のほうが速い）
+  - 出力行はまとめて writelines し、一時ファイルから置き換える
+  - 複数ファイルはプロセスプールで並列に変換する
+  - "cookies.json" のような汎用名のファイルも先に変換だけしておき、名前はバッチの
+    最後にまとめて決める（finalize_pending）
+
+CookieJarCache は変換済みの .txt をサイトのドメインごとに索引し、期限切れを除いた
+うえで、ジョブの URL のサイトのぶんだけを cookies/.jars/ に書き出す。gallery-dl は
+--cookies のファイルを毎回全部読むので、ブラウザから丸ごとエクスポートした数 MB の
+ファイルの代わりに数十行のジャーを渡す。gallery-dl が実行後にジャーを更新した
+（cookies-update）場合は、次に使うときに元のファイルへ書き戻す。
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from itertools import islice
+from typing import Optional, List, Dict, Any, Iterator, Iterable, NamedTuple, TextIO, Tuple, Set
+from urllib.parse import urlsplit
+
+CHUNK_CHARS   = 1 << 20      # 1 回に読む文字数
+WRITE_BATCH   = 4096         # まとめて書く行数
+PARALLEL_MIN_BYTES = 4 << 20 # 合計がこれより小さいバッチはプロセスを起動せずに変換する
+STREAM_MIN_BYTES = 64 << 20  # これより大きいファイルだけ逐次デコードする（小さければ json.load が速い）
+GENERIC_NAMES = ("cookies", "cookie")
+PENDING_EXT   = ".pending"   # 名前が決まるまでの変換結果（cookies/ 内）
+HEADER = "# Netscape HTTP Cookie File\n# Converted by Gallery-DL GUI\n\n"
+JAR_DIR       = ".jars"      # サイトごとに絞ったジャーの置き場（cookies/ 内）
+# URL と違うドメインのクッキーを使うサイト（同じサイトとして扱う）
+DOMAIN_ALIASES = {"twitter.com": ("x.com",), "x.com": ("twitter.com",)}
+# "example.co.jp" のように 2 文字の国別ドメインの下に来る第 2 レベル
+_SECOND_LEVEL = ("co", "com", "ne", "or", "ac", "go", "net", "org", "gov", "edu")
+
+_WS = " \t\r\n"
+_WS_RE = re.compile(r"[ \t\r\n]*")
+_SEP_RE = re.compile(r"[ \t\r\n]*([,\]])")
+
+
+class CookieFormatError(ValueError):
+    pass
+
+
+class ConversionResult(NamedTuple):
+    """1 ファイルぶんの変換結果。"""
+    json_path: str
+    txt_path: Optional[str]      # 書き出したファイル（汎用名なら .pending）
+    stem: str                    # 出力名（拡張子なし）
+    cookies: int
+    seconds: float
+    domain: Optional[str]        # いちばん多いドメイン（名前の候補）
+    error: Optional[str] = None
+
+    @property
+    def pending(self) -> bool:
+        return self.error is None and bool(self.txt_path) and self.txt_path.endswith(PENDING_EXT)
+
+
+def is_generic_name(stem: str) -> bool:
+    return stem.lower() in GENERIC_NAMES
+
+
+def sanitize_name(name: str) -> str:
+    """ファイル名に使えない文字を取り除く（英数字・空白・. _ - だけ残す）。"""
+    # 末尾の . は Windows では使えないので落とす
+    return "".join(c for c in name if c.isalnum() or c in (" ", ".", "_", "-")).strip().rstrip(".")
+
+
+def iter_json_array(f: TextIO, chunk_chars: int = CHUNK_CHARS) -> Iterator[Any]:
+    """JSON 配列の要素を 1 つずつ返す。ファイル全体は読み込まない。
+
+    トップレベルがオブジェクトの場合（{"cookies": [...]} のようなラッパー）は
+    全体を読んで "cookies" の配列を返す。
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_chars)
+    pos = 0
+    eof = not buf
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        more = f.read(chunk_chars)
+        if not more:
+            eof = True
+            return False
+        buf = buf[pos:] + more
+        pos = 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WS:
+                pos += 1
+            if pos < len(buf) or eof or not fill():
+                return
+
+    skip_ws()
+    if pos >= len(buf):
+        return
+    if buf[pos] == "{":
+        rest = buf[pos:] + f.read()
+        data = json.loads(rest)
+        items = data.get("cookies") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise CookieFormatError("expected a JSON array of cookies")
+        yield from items
+        return
+    if buf[pos] != "[":
+        raise CookieFormatError("expected a JSON array of cookies")
+    pos += 1
+    # raw_decode を経由せず C のスキャナを直接呼ぶ（要素ごとのオーバーヘッドが大きいので）
+    scan = decoder.scan_once
+    first = True
+    while True:
+        pos = _WS_RE.match(buf, pos).end()
+        if pos >= len(buf):
+            if eof or not fill():
+                raise CookieFormatError("unexpected end of file")
+            continue
+        if first and buf[pos] == "]":
+            return
+        first = False
+        try:
+            item, end = scan(buf, pos)
+        except (StopIteration, json.JSONDecodeError):
+            # チャンクの境目で要素が切れている（か、本当に壊れている）
+            if eof or not fill():
+                raise CookieFormatError(f"invalid JSON near character {pos}") from None
+            continue
+        # 数値などは境目で切れていても成功してしまうので、末尾なら読み足してやり直す
+        if end >= len(buf) and not eof and fill():
+            continue
+        pos = end
+        yield item
+        while True:
+            m = _SEP_RE.match(buf, pos)
+            if m is not None:
+                break
+            if _WS_RE.match(buf, pos).end() < len(buf) or eof or not fill():
+                raise CookieFormatError(f"expected ',' or ']' near character {pos}")
+        pos = m.end()
+        if m.group(1) == "]":
+            return
+
+
+def _load_array(f: TextIO) -> List[Any]:
+    data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("cookies")
+    if not isinstance(data, list):
+        raise CookieFormatError("expected a JSON array of cookies")
+    return data
+
+
+def netscape_line(c: Dict[str, Any]) -> str:
+    """クッキー 1 つを Netscape 形式の 1 行（7 列、タブ区切り）にする。"""
+    domain = c.get("domain", "")
+    # hostOnly: False -> TRUE, True -> FALSE
+    flag = "FALSE" if c.get("hostOnly", False) else "TRUE"
+    path = c.get("path", "/")
+    secure = "TRUE" if c.get("secure", False) else "FALSE"
+    # expiry or expirationDate, default 0
+    expiry = int(c.get("expiry") or c.get("expirationDate") or 0)
+    return f"{domain}\t{flag}\t{path}\t{secure}\t{expiry}\t{c.get('name', '')}\t{c.get('value', '')}\n"
+
+
+def write_netscape(cookies: Iterable[Any], txt_path: str) -> Tuple[int, Counter]:
+    """クッキーを書き出し、(件数, ドメインごとの件数) を返す。一時ファイルに書いてから置き換える。
+
+    ドメインは名前の候補に使うだけなので、最初の WRITE_BATCH 件だけ数える。
+    """
+    count = 0
+    raw: Counter = Counter()
+    tmp = txt_path + ".tmp"
+    it = iter(cookies)
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="\n") as out:
+            out.write(HEADER)
+            while True:
+                chunk = list(islice(it, WRITE_BATCH))
+                if not chunk:
+                    break
+                batch = [c for c in chunk if isinstance(c, dict)]
+                out.writelines(map(netscape_line, batch))
+                if not count:
+                    raw.update(str(c.get("domain") or "") for c in batch)
+                count += len(batch)
+        os.replace(tmp, txt_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    # ".example.com" と "example.com" は同じドメインとして数える
+    domains: Counter = Counter()
+    for domain, n in raw.items():
+        domains[domain.lstrip(".")] += n
+    return count, domains
+
+
+def convert_file(json_path: str, out_dir: str, remove_source: bool = True) -> ConversionResult:
+    """JSON 1 ファイルを変換する（プロセスプールのワーカーで呼ばれる）。
+
+    汎用名のファイルは cookies/.<元のファイル名>.pending に書き、元の JSON も残す。
+    """
+    started = time.perf_counter()
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    generic = is_generic_name(stem)
+    if generic:
+        txt_path = os.path.join(out_dir, f".{os.path.basename(json_path)}{PENDING_EXT}")
+    else:
+        txt_path = os.path.join(out_dir, f"{stem}.txt")
+    try:
+        with open(json_path, "r", encoding="utf-8-sig") as f:
+            if _size(json_path) >= STREAM_MIN_BYTES:
+                cookies: Iterable[Any] = iter_json_array(f)
+            else:
+                cookies = _load_array(f)
+            count, domains = write_netscape(cookies, txt_path)
+        if remove_source and not generic:
+            os.remove(json_path)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        # 型の違う要素（文字列でない name/value など）もこのファイルだけの失敗にする
+        return ConversionResult(json_path, None, stem, 0, time.perf_counter() - started, None,
+                                f"{type(e).__name__}: {e}" if isinstance(e, (TypeError, AttributeError))
+                                else str(e))
+    domain = domains.most_common(1)[0][0] if domains else None
+    return ConversionResult(json_path, txt_path, stem, count,
+                            time.perf_counter() - started, domain)
+
+
+def convert_batch(json_paths: List[str], out_dir: str, workers: Optional[int] = None,
+                  remove_source: bool = True, on_result=None) -> List[ConversionResult]:
+    """複数ファイルを並列に変換する。``on_result(result)`` は終わった順に呼ばれる。"""
+    os.makedirs(out_dir, exist_ok=True)
+    workers = min(len(json_paths), workers or os.cpu_count() or 1)
+    if workers > 1 and sum(_size(p) for p in json_paths) < PARALLEL_MIN_BYTES:
+        workers = 1      # 小さなバッチではプロセス起動のほうが高くつく
+    results: List[ConversionResult] = []
+    if workers <= 1:
+        for path in json_paths:
+            result = convert_file(path, out_dir, remove_source)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+        return results
+    # concurrent.futures（と multiprocessing）は使うときだけ読み込む（GUI の起動を遅くしない）
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_file, path, out_dir, remove_source): path
+                   for path in json_paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:       # ワーカープロセスが落ちた場合など
+                result = ConversionResult(futures[future], None, "", 0, 0.0, None, str(e))
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def finalize_pending(result: ConversionResult, name: Optional[str], out_dir: str,
+                     remove_source: bool = True) -> Optional[str]:
+    """汎用名のファイルの名前が決まった（None なら取りやめ）。出力先のパスを返す。"""
+    if not result.pending:
+        return None
+    stem = sanitize_name(name or "")
+    if not stem:
+        try:
+            os.remove(result.txt_path)
+        except OSError:
+            pass
+        return None
+    txt_path = os.path.join(out_dir, f"{stem}.txt")
+    os.replace(result.txt_path, txt_path)
+    if remove_source:
+        try:
+            os.remove(result.json_path)
+        except OSError:
+            pass
+    return txt_path
+
+
+def summary(results: List[ConversionResult], seconds: float) -> str:
+    cookies = sum(r.cookies for r in results)
+    rate = cookies / seconds if seconds > 0 else 0.0
+    return f"{cookies:,} cookies in {seconds:.2f}s ({rate:,.0f} cookies/s)"
+
+
+# クッキージャーのキャッシュ
+# ──────────────────────────────────────────────
+def registrable_domain(host: str) -> str:
+    """ホスト名からサイトのドメインをざっくり求める（"i.pximg.net" → "pximg.net"）。
+
+    公開サフィックスリストは持たないので、2 文字の国別ドメインの下の co/ne/or などだけ
+    特別扱いする。
+    """
+    labels = host.lower().strip(".").split(".")
+    if labels[-1].isdigit():
+        return ".".join(labels)          # IP アドレス
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def _cookie_key(line: str) -> Optional[Tuple[str, str, str, int]]:
+    """Netscape 形式の 1 行から (ドメイン, パス, 名前, 有効期限) を取り出す。コメント行は None。"""
+    if line.startswith("#HttpOnly_"):
+        fields = line[10:].split("\t")
+    elif not line or line.startswith("#"):
+        return None
+    else:
+        fields = line.split("\t")
+    if len(fields) < 7:
+        return None
+    try:
+        expiry = int(fields[4] or 0)     # gallery-dl はセッションクッキーを空欄で書く
+    except ValueError:
+        expiry = 0
+    return fields[0], fields[2], fields[5], expiry
+
+
+class _Jar:
+    """索引済みのクッキーファイル 1 つ。"""
+
+    __slots__ = ("stamp", "sites", "total", "expired")
+
+    def __init__(self, stamp: Tuple[int, int]):
+        self.stamp = stamp
+        self.sites: Dict[str, List[Tuple[int, str]]] = {}   # サイト → [(有効期限, 行)]
+        self.total = 0
+        self.expired = 0
+
+
+class CookieJarCache:
+    """クッキーファイルをサイトのドメインごとに索引し、ジョブ用の小さなジャーを書き出す。
+
+    ワーカースレッドから呼ばれる。索引はファイルの更新時刻とサイズが変わるまで使い回す。
+    """
+
+    def __init__(self, cookie_dir: str):
+        self.cookie_dir = cookie_dir
+        self.jar_dir = os.path.abspath(os.path.join(cookie_dir, JAR_DIR))
+        self._jars: Dict[str, _Jar] = {}
+        # 書き出したジャー → (元のファイル, 書いたときの (mtime_ns, size), 書いたクッキーのキー)
+        self._written: Dict[str, Tuple[str, Tuple[int, int], Set[Tuple[str, str, str]]]] = {}
+        self._lock = threading.Lock()
+
+    def jar_for(self, cookie_path: str, url: str) -> str:
+        """``url`` のサイトのクッキーだけのジャーのパス。該当がなければ元のファイルを返す。"""
+        host = (urlsplit(url).hostname or "").lower()
+        if not host:
+            return cookie_path
+        site = registrable_domain(host)
+        cookie_path = os.path.abspath(cookie_path)
+        with self._lock:
+            self._merge_back(cookie_path)
+            jar = self._load(cookie_path)
+            entries: List[Tuple[int, str]] = []
+            for s in (site,) + DOMAIN_ALIASES.get(site, ()):
+                entries.extend(jar.sites.get(s, ()))
+            if not entries:
+                # リダイレクト先など別ドメインのクッキーを使うサイトかもしれないので全部渡す
+                return cookie_path
+            now = time.time()
+            lines = [line for expiry, line in entries if not expiry or expiry >= now]
+            stem = os.path.splitext(os.path.basename(cookie_path))[0]
+            out = os.path.join(self.jar_dir, f"{stem}@{site}.txt")
+            self._write_jar(cookie_path, out, lines)
+        return out
+
+    def stats(self, cookie_path: str) -> Optional[Tuple[int, int, int]]:
+        """索引済みなら (有効なクッキー数, 読み込み時に期限切れだった数, サイト数)。"""
+        with self._lock:
+            jar = self._jars.get(os.path.abspath(cookie_path))
+            return (jar.total, jar.expired, len(jar.sites)) if jar is not None else None
+
+    def sync(self):
+        """gallery-dl が更新したジャーをすべて元のファイルへ書き戻す（終了時など）。"""
+        with self._lock:
+            for source in {src for src, _, _ in self._written.values()}:
+                self._merge_back(source)
+
+    # 内部処理（self._lock を持って呼ぶ）
+    # ──────────────────────────────────────────────
+    def _load(self, cookie_path: str) -> _Jar:
+        st = os.stat(cookie_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        jar = self._jars.get(cookie_path)
+        if jar is not None and jar.stamp == stamp:
+            return jar
+        jar = _Jar(stamp)
+        now = time.time()
+        with open(cookie_path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                key = _cookie_key(line)
+                if key is None:
+                    continue
+                domain, _, _, expiry = key
+                if expiry and expiry < now:
+                    jar.expired += 1
+                    continue
+                site = registrable_domain(domain.lstrip("."))
+                jar.sites.setdefault(site, []).append((expiry, line))
+                jar.total += 1
+        self._jars[cookie_path] = jar
+        return jar
+
+    def _write_jar(self, source: str, out: str, lines: List[str]):
+        keys = {k[:3] for k in map(_cookie_key, lines) if k is not None}
+        prev = self._written.get(out)
+        if prev is not None and prev[2] == keys and _stamp(out) == prev[1]:
+            return                       # 内容が同じで、gallery-dl も書き換えていない
+        os.makedirs(self.jar_dir, exist_ok=True)
+        tmp = out + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            f.write(HEADER)
+            f.writelines(line + "\n" for line in lines)
+        os.replace(tmp, out)
+        self._written[out] = (source, _stamp(out), keys)
+
+    def _merge_back(self, source: str):
+        """gallery-dl が書き換えたジャーの内容を元のファイルに反映する。
+
+        ジャーにあったクッキーは上書き・追加し、書き出したのにジャーから消えたものは削除する。
+        """
+        changed = [(out, keys) for out, (src, stamp, keys) in self._written.items()
+                   if src == source and _stamp(out) != stamp]
+        if not changed:
+            return
+        try:
+            merged = _read_cookies(source)
+            for out, keys in changed:
+                updated = _read_cookies(out)
+                for key in keys - updated.keys():
+                    merged.pop(key, None)
+                merged.update(updated)
+                self._written.pop(out, None)     # 次に使うときに書き直す
+            now = time.time()
+            lines = [line for line, expiry in merged.values() if not expiry or expiry >= now]
+            tmp = source + ".tmp"
+            with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+                f.write(HEADER)
+                f.writelines(line + "\n" for line in lines)
+            os.replace(tmp, source)
+        except OSError:
+            pass
+
+
+def _read_cookies(path: str) -> Dict[Tuple[str, str, str], Tuple[str, int]]:
+    """(ドメイン, パス, 名前) → (行, 有効期限)。"""
+    cookies = {}
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            key = _cookie_key(line)
+            if key is not None:
+                cookies[key[:3]] = (line, key[3])
+    return cookies
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
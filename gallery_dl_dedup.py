@@ -0,0 +1,292 @@
+"""
+gallery_dl_dedup.py
+DownloadData の内容ハッシュによる重複排除。
+
+同じ画像が別のギャラリーに再投稿されていると、gallery-dl はそれぞれ別のファイルとして
+保存する（ダウンロードアーカイブはアイテムのキーで判定するので内容までは見ない）。
+ここではファイルの内容ハッシュ（BLAKE2b）を dedup.sqlite3 に記録し、
+  - ジョブが報告したファイル（done イベント）を 1 つずつ索引に追加し、同じ内容の
+    ファイルがすでにあれば、新しいほうを元のファイルへのハードリンクに置き換える
+    （"hardlink"）か、削除する（"skip"）
+  - "Re-index" では保存先全体を走査し、サイズか更新時刻が変わったファイルだけを
+    プロセスプールで並列にハッシュする（読み込みは mmap）
+ジョブのファイルのハッシュは専用のスレッドで計算するので、ワーカーの出力の読み取りは
+止まらない。
+"""
+import mmap
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Dict, Tuple, Callable, NamedTuple
+
+DEDUP_OFF      = "off"
+DEDUP_HARDLINK = "hardlink"
+DEDUP_SKIP     = "skip"
+DEDUP_MODES    = (DEDUP_OFF, DEDUP_HARDLINK, DEDUP_SKIP)
+
+HASH_BLOCK     = 16 << 20    # mmap から一度にハッシュに渡すバイト数
+MIN_SIZE       = 4096        # これより小さいファイル（メタデータ・アイコンなど）は扱わない
+PARALLEL_MIN_FILES = 64      # 再索引でこれより少なければプロセスを起動しない
+SKIP_SUFFIXES  = (".part", ".json", ".txt", ".dedup")
+
+
+def hash_file(path: str) -> Optional[Tuple[str, int, int, str]]:
+    """(パス, サイズ, 更新時刻 ns, ハッシュ)。読めなければ None（プロセスプールから呼ばれる）。"""
+    import hashlib               # OpenSSL を読み込むので、GUI の起動時には読み込まない
+    try:
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            h = hashlib.blake2b(digest_size=20)
+            if st.st_size:
+                # ページキャッシュを直接読むので、バッファへのコピーが要らない
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        for offset in range(0, st.st_size, HASH_BLOCK):
+                            h.update(view[offset:offset + HASH_BLOCK])
+    except (OSError, ValueError):
+        return None
+    return path, st.st_size, st.st_mtime_ns, h.hexdigest()
+
+
+def _wanted(name: str, size: int) -> bool:
+    return size >= MIN_SIZE and not name.lower().endswith(SKIP_SUFFIXES)
+
+
+class DedupResult(NamedTuple):
+    """ジョブのファイル 1 つを索引に加えた結果。"""
+    path: str
+    original: Optional[str]     # 同じ内容の既存ファイル（なければ None）
+    action: Optional[str]       # DEDUP_HARDLINK / DEDUP_SKIP（何もしなければ None）
+    size: int
+
+
+class DedupStats(NamedTuple):
+    files: int                  # 索引にあるファイル数
+    bytes: int                  # その合計サイズ
+    duplicates: int             # これまでにリンク・削除した重複の数
+    saved: int                  # それで節約したバイト数
+
+
+class ReindexResult(NamedTuple):
+    scanned: int
+    hashed: int
+    removed: int                # 索引から消した（ファイルがなくなった）数
+    seconds: float
+
+
+class DedupIndex:
+    """保存先以下のファイルの内容ハッシュの索引（SQLite）。ワーカースレッドから呼ばれる。"""
+
+    def __init__(self, db_path: str, root: str, mode: str = DEDUP_OFF):
+        self.db_path = db_path
+        self.root = os.path.abspath(root)
+        self.mode = mode if mode in DEDUP_MODES else DEDUP_OFF
+        self._lock = threading.Lock()
+        self._con: Optional[sqlite3.Connection] = None
+        self._queue: "queue.Queue[Tuple[str, Optional[Callable]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    # 索引の DB
+    # ──────────────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        if self._con is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            con = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("CREATE TABLE IF NOT EXISTS files ("
+                        "path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                        "mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL)")
+            con.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash, size)")
+            con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            con.commit()
+            self._con = con
+        return self._con
+
+    def _key(self, path: str) -> str:
+        """保存先以下のファイルは相対パスで持つ（ポータブル版のフォルダを移動しても使えるように）。"""
+        path = os.path.abspath(path)
+        try:
+            rel = os.path.relpath(path, self.root)
+        except ValueError:           # Windows で別ドライブ
+            return path
+        return path if rel.startswith(os.pardir) else rel
+
+    def _abs(self, key: str) -> str:
+        return key if os.path.isabs(key) else os.path.join(self.root, key)
+
+    def close(self):
+        """残っているファイルを処理し終えてから閉じる。"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=30.0)
+            self._thread = None
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    # ジョブのファイル
+    # ──────────────────────────────────────────────
+    def submit(self, path: str, callback: Optional[Callable[[DedupResult], None]] = None):
+        """ダウンロードが終わったファイルを索引に加える（ハッシュは専用スレッドで計算する）。"""
+        if self.mode == DEDUP_OFF or not path:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dedup", daemon=True)
+            self._thread.start()
+        self._queue.put((path, callback))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, callback = item
+            try:
+                result = self.add(path)
+            except sqlite3.Error:
+                result = None
+            if result is not None and callback is not None:
+                callback(result)
+
+    def add(self, path: str) -> Optional[DedupResult]:
+        """ファイルを 1 つ索引に加え、重複なら mode に従ってリンク・削除する。"""
+        path = os.path.abspath(path)
+        hashed = hash_file(path)
+        if hashed is None or not _wanted(path, hashed[1]):
+            return None
+        _, size, mtime_ns, digest = hashed
+        key = self._key(path)
+        with self._lock:
+            con = self._db()
+            original = None
+            for (other,) in con.execute("SELECT path FROM files WHERE hash = ? AND size = ? "
+                                        "AND path <> ?", (digest, size, key)).fetchall():
+                other_path = self._abs(other)
+                try:
+                    st = os.stat(other_path)
+                except OSError:
+                    con.execute("DELETE FROM files WHERE path = ?", (other,))
+                    continue
+                if st.st_size == size:
+                    original = other_path
+                    break
+
+            action = None
+            if original is not None and not _same_file(original, path):
+                if self.mode == DEDUP_HARDLINK and _hardlink(original, path):
+                    action = DEDUP_HARDLINK
+                    mtime_ns = os.stat(path).st_mtime_ns
+                elif self.mode == DEDUP_SKIP:
+                    try:
+                        os.remove(path)
+                        action = DEDUP_SKIP
+                    except OSError:
+                        pass
+            if action == DEDUP_SKIP:
+                con.execute("DELETE FROM files WHERE path = ?", (key,))
+            else:
+                con.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                            (key, size, mtime_ns, digest))
+            if action is not None:
+                for name, value in (("duplicates", 1), ("saved", size)):
+                    con.execute("INSERT INTO meta VALUES (?, ?) ON CONFLICT(key) "
+                                "DO UPDATE SET value = value + excluded.value", (name, value))
+            con.commit()
+        return DedupResult(path, original, action, size)
+
+    # 一括の再索引
+    # ──────────────────────────────────────────────
+    def reindex(self, workers: Optional[int] = None,
+                on_progress: Optional[Callable[[int, int], None]] = None) -> ReindexResult:
+        """保存先全体を走査して索引を作り直す。
+
+        サイズと更新時刻が索引と同じファイルはハッシュし直さない。``on_progress(done, total)``
+        はハッシュしたファイル数で呼ばれる。
+        """
+        started = time.perf_counter()
+        found: Dict[str, Tuple[int, int]] = {}
+        stack = [self.root]
+        while stack:
+            d = stack.pop()
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        try:
+                            if e.is_dir(follow_symlinks=False):
+                                stack.append(e.path)
+                            elif e.is_file(follow_symlinks=False):
+                                st = e.stat(follow_symlinks=False)
+                                if _wanted(e.name, st.st_size):
+                                    found[self._key(e.path)] = (st.st_size, st.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+        with self._lock:
+            con = self._db()
+            known = {k: (s, m) for k, s, m in con.execute("SELECT path, size, mtime_ns FROM files")}
+        stale = [k for k in known if k not in found
+                 and (not os.path.isabs(k) or not os.path.exists(k))]
+        todo = [self._abs(k) for k, stamp in found.items() if known.get(k) != stamp]
+
+        rows: List[Tuple[str, int, int, str]] = []
+        workers = min(workers or os.cpu_count() or 1, max(1, len(todo)))
+        if workers > 1 and len(todo) >= PARALLEL_MIN_FILES:
+            from concurrent.futures import ProcessPoolExecutor   # 使うときだけ読み込む
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(hash_file, todo, chunksize=max(1, len(todo) // (workers * 8)))
+                rows = self._collect(results, len(todo), on_progress)
+        else:
+            rows = self._collect(map(hash_file, todo), len(todo), on_progress)
+
+        with self._lock:
+            con = self._db()
+            con.executemany("DELETE FROM files WHERE path = ?", [(k,) for k in stale])
+            con.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                            [(self._key(p), s, m, h) for p, s, m, h in rows])
+            con.commit()
+        return ReindexResult(len(found), len(rows), len(stale), time.perf_counter() - started)
+
+    @staticmethod
+    def _collect(results, total: int, on_progress) -> List[Tuple[str, int, int, str]]:
+        rows = []
+        for i, r in enumerate(results, 1):
+            if r is not None:
+                rows.append(r)
+            if on_progress is not None and (i % 100 == 0 or i == total):
+                on_progress(i, total)
+        return rows
+
+    def stats(self) -> DedupStats:
+        with self._lock:
+            con = self._db()
+            files, total = con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+            meta = dict(con.execute("SELECT key, value FROM meta"))
+        return DedupStats(files, total, meta.get("duplicates", 0), meta.get("saved", 0))
+
+
+def _same_file(a: str, b: str) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _hardlink(original: str, path: str) -> bool:
+    """``path`` を ``original`` へのハードリンクに置き換える（別ドライブや FAT なら False）。"""
+    tmp = path + ".dedup"
+    try:
+        os.link(original, tmp)
+        os.replace(tmp, path)
+        return True
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
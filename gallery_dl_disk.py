@@ -0,0 +1,192 @@
+"""
+gallery_dl_disk.py
+保存先ボリュームの空き容量と書き込みスループットの監視。
+
+ディスクがいっぱいになると、gallery-dl は残りのアイテムをすべて "No space left on device"
+で失敗させるので、失敗の一覧が無意味な行で埋まる。ここでは保存先（DownloadData）の
+ボリュームを SAMPLE_INTERVAL ごとに調べ、
+  - 空きが reserve を下回ったら新しいジョブを始めない（"low"）
+  - 空きが critical を下回ったら実行中のジョブも止め、空きが戻ったら続きから再開する（"full"）
+  - 今の書き込み速度で horizon 秒以内に reserve まで埋まりそうなとき、または
+    ディスクの使用率が BUSY_UTIL 以上のときは、実行中のジョブ以上に増やさない（"slow"）
+書き込み速度は Linux では /proc/diskstats の書き込みセクタ数（ボリュームへの実際の書き込み）、
+それ以外（tmpfs・Windows など）では空き容量の減り方から求める。Tk には依存しない。
+"""
+import math
+import os
+import shutil
+import threading
+import time
+from typing import Optional, Callable, Tuple, NamedTuple
+
+DISK_RESERVE     = 1 << 30      # この空き容量を下回ったら新しいジョブを始めない
+DISK_CRITICAL    = 256 << 20    # これを下回ったら実行中のジョブも止める（reserve の 1/4 が上限）
+DISK_HORIZON     = 60.0         # この秒数以内に reserve まで埋まりそうなら増やさない
+BUSY_UTIL        = 0.9          # ディスクの使用率（io_ticks）がこれ以上なら飽和とみなす
+SAMPLE_INTERVAL  = 1.0          # 監視スレッドが調べる間隔（秒）
+RATE_WINDOW      = 5.0          # 書き込み速度・使用率の平滑化の時定数（秒）
+SECTOR_SIZE      = 512          # /proc/diskstats のセクタは常に 512 バイト
+
+DISK_OK   = "ok"
+DISK_SLOW = "slow"
+DISK_LOW  = "low"
+DISK_FULL = "full"
+
+
+class DiskSample(NamedTuple):
+    free: int                   # 空き容量（バイト）
+    total: int
+    write_rate: float           # 書き込み速度（バイト/秒、平滑化済み）
+    util: Optional[float]       # ディスクの使用率 0〜1（分からなければ None）
+    eta_full: Optional[float]   # reserve まで埋まるまでの秒数（書き込んでいなければ None）
+    state: str                  # DISK_OK / DISK_SLOW / DISK_LOW / DISK_FULL
+
+
+def parse_size(text: str) -> int:
+    """"512M" / "2G" / "1.5g" / "1048576" をバイト数にする。"""
+    text = text.strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text))
+
+
+def _device_stats(dev: int) -> Optional[Tuple[int, int]]:
+    """st_dev のデバイスの (書き込みセクタ数, io_ticks ms)。tmpfs や Linux 以外では None。"""
+    major, minor = os.major(dev), os.minor(dev)
+    try:
+        with open("/proc/diskstats", "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 13 and int(fields[0]) == major and int(fields[1]) == minor:
+                    return int(fields[9]), int(fields[12])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class DiskMonitor:
+    """保存先ボリュームの監視と、新しいジョブを始めてよいかの判定。
+
+    ``on_change(sample)`` は状態（DISK_OK など）が変わったときに監視スレッドから呼ばれる。
+    """
+
+    def __init__(self, path: str, reserve: int = DISK_RESERVE, critical: Optional[int] = None,
+                 horizon: float = DISK_HORIZON, interval: float = SAMPLE_INTERVAL,
+                 on_change: Optional[Callable[[DiskSample], None]] = None):
+        self.path = os.path.abspath(path)
+        self.reserve = 0
+        self.critical = 0
+        self._critical = critical           # None なら reserve から決める
+        self._set_limits(reserve)
+        self.horizon = horizon
+        self.interval = interval
+        self.on_change = on_change
+        self.latest: Optional[DiskSample] = None
+        self.written = 0                    # 監視を始めてからボリュームに書かれたバイト数
+        self._rate = 0.0
+        self._util: Optional[float] = None
+        self._prev: Optional[Tuple[float, int, Optional[Tuple[int, int]]]] = None
+        self._dev: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _set_limits(self, reserve: int):
+        self.reserve = max(0, int(reserve))
+        self.critical = (min(self._critical, self.reserve) if self._critical is not None
+                         else min(DISK_CRITICAL, self.reserve // 4))
+
+    def set_reserve(self, reserve: int):
+        with self._lock:
+            self._set_limits(reserve)
+        if self.latest is not None:
+            self.sample()                   # 状態をすぐに判定し直す
+
+    # 計測
+    # ──────────────────────────────────────────────
+    def _target(self) -> str:
+        """まだ作られていない保存先なら、存在する一番近い親ディレクトリを調べる。"""
+        path = self.path
+        while not os.path.exists(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        return path
+
+    def sample(self, now: Optional[float] = None) -> Optional[DiskSample]:
+        """ボリュームを調べて最新の DiskSample を返す（調べられなければ None）。"""
+        now = time.monotonic() if now is None else now
+        target = self._target()
+        try:
+            usage = shutil.disk_usage(target)
+            dev = os.stat(target).st_dev
+        except OSError:
+            return None
+        io = _device_stats(dev)
+        with self._lock:
+            prev, self._prev = self._prev, (now, usage.free, io)
+            if prev is not None and self._dev == dev and now > prev[0]:
+                dt = now - prev[0]
+                if io is not None and prev[2] is not None:
+                    written = max(0, io[0] - prev[2][0]) * SECTOR_SIZE
+                    util = min(1.0, max(0, io[1] - prev[2][1]) / 1000.0 / dt)
+                else:
+                    written = max(0, prev[1] - usage.free)   # 削除で増えた分は数えない
+                    util = None
+                self.written += written
+                alpha = 1.0 - math.exp(-dt / RATE_WINDOW)
+                self._rate += alpha * (written / dt - self._rate)
+                if util is None:
+                    self._util = None
+                else:
+                    self._util = util if self._util is None else self._util + alpha * (util - self._util)
+            self._dev = dev
+
+            headroom = usage.free - self.reserve
+            eta = headroom / self._rate if self._rate >= 1.0 and headroom > 0 else None
+            if usage.free < self.critical:
+                state = DISK_FULL
+            elif usage.free < self.reserve:
+                state = DISK_LOW
+            elif (eta is not None and eta < self.horizon) or \
+                    (self._util is not None and self._util >= BUSY_UTIL):
+                state = DISK_SLOW
+            else:
+                state = DISK_OK
+            sample = DiskSample(usage.free, usage.total, self._rate, self._util, eta, state)
+            changed = self.latest is None or self.latest.state != state
+            self.latest = sample
+        if changed and self.on_change is not None:
+            self.on_change(sample)
+        return sample
+
+    def admit(self, running: int) -> bool:
+        """新しいジョブを始めてよいか（``running`` は実行中のジョブ数）。"""
+        sample = self.latest                # 監視スレッドの最新の結果（ここでは調べ直さない）
+        if sample is None or sample.state == DISK_OK:
+            return True
+        if sample.state == DISK_SLOW:
+            return running == 0             # 増やさない（何も動いていなければ 1 つは始める）
+        return False
+
+    # 監視スレッド
+    # ──────────────────────────────────────────────
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="disk", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self):
+        self.sample()
+        while not self._stop.wait(self.interval):
+            self.sample()
@@ -0,0 +1,1553 @@
+"""
+gallery_dl_engine.py
+複数 URL のジョブキューと gallery-dl ワーカープール。
+
+Tk には依存しない。GUI はコールバック経由で行イベントと状態変化を受け取り、
+自分のフレームで描画する（コールバックはワーカースレッドから呼ばれる）。
+"""
+import importlib.util
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional, List, Dict, Callable, Iterable, Any, TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from gallery_dl_parser import (
+    LineClassifier, LineEvent, display_event, progress_speed,
+    EV_INFO, EV_DOWNLOAD, EV_RETRY, EV_ERROR, EV_SKIP,
+)
+from gallery_dl_runner import EVENT_PREFIX
+from gallery_dl_throttle import HostScheduler, site_of, DEFAULT_PER_HOST
+from gallery_dl_failures import FailureStore
+from gallery_dl_cookies import CookieJarCache
+from gallery_dl_disk import DiskMonitor, DiskSample, DISK_OK, DISK_SLOW, DISK_LOW, DISK_FULL
+from gallery_dl_metrics import Metrics
+from gallery_dl_record import SessionRecorder
+from gallery_dl_stream import LineReader
+# アーカイブ・重複排除・履歴（sqlite3 を読み込む）とプロファイル（hashlib）は呼び出し側が
+# 作って渡す。GUI はウィンドウを表示してから読み込むので、ここでは型だけにし、定数は
+# 渡されたとき（読み込み済み）にその場で読み込む
+if TYPE_CHECKING:
+    from gallery_dl_archive import ArchiveIndex
+    from gallery_dl_dedup import DedupIndex, DedupResult
+    from gallery_dl_history import HistoryStore
+    from gallery_dl_profiles import ProfileStore
+
+# ジョブ状態
+JOB_QUEUED  = "queued"
+JOB_RUNNING = "running"
+JOB_DONE    = "done"
+JOB_FAILED  = "failed"
+JOB_STOPPED = "stopped"
+
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_STOPPED)
+
+DEFAULT_WORKERS = 3
+MAX_WORKERS     = 16
+TIMEOUT_SECONDS = 120   # 応答なし判定秒数（ホストの実測がないときの既定値）
+STALL_MIN_SECONDS = 30  # 適応タイムアウトの下限
+STALL_MAX_SECONDS = 600 # 適応タイムアウトの上限
+STALL_FACTOR    = 8.0   # 進捗間隔の推定値（srtt + 4·rttvar）の何倍で停止とみなすか
+STALL_MIN_SAMPLES = 5   # 適応タイムアウトを使い始めるまでのサンプル数
+KILL_GRACE_SECONDS = 5  # terminate してから kill するまでの猶予
+MAX_AUTO_RESUME = 3     # タイムアウトで止まったジョブを途中ファイルから自動再開する回数
+PART_SUFFIX     = ".part"   # gallery-dl の書きかけファイル（downloader.part）
+RATE_WINDOW     = 5.0   # スループットの平滑化の時定数（秒）
+METRICS_FLUSH_SECONDS = 0.5   # 読み取りループで数えた行数をメトリクスに足す間隔
+DISK_FULL_ERRORS = ("No space left on device", "[Errno 28]", "[WinError 112]")
+
+
+def app_dir() -> str:
+    """ベースディレクトリ（スクリプトまたはビルド済み exe の場所）。"""
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def gallery_dl_command(args: List[str], base_dir: Optional[str] = None) -> List[str]:
+    """gallery-dl を起動するコマンドラインを組み立てる。
+
+    常に gallery_dl_runner.py を介してサブプロセスで起動し、構造化イベントを受け取る。
+    ポータブル python.exe がなければ GUI と同じインタープリタを使い、そこにも
+    gallery_dl がなければ PATH 上の gallery-dl（テキスト解析）にフォールバックする。
+    """
+    base_dir = base_dir or app_dir()
+    runner = os.path.join(base_dir, "gallery_dl_runner.py")
+    python_exe = os.path.join(base_dir, "python", "python.exe")
+    if os.path.exists(python_exe):
+        if os.path.exists(runner):
+            return [python_exe, runner] + args
+        return [python_exe, "-m", "gallery_dl"] + args
+    if not getattr(sys, "frozen", False) and importlib.util.find_spec("gallery_dl"):
+        return [sys.executable, runner] + args
+    return ["gallery-dl"] + args
+
+
+def build_gallery_dl_args(job: "Job", config_path: str, cookie_dir: str,
+                          retries: int, jars: Optional[CookieJarCache] = None,
+                          profiles: Optional["ProfileStore"] = None) -> List[str]:
+    """ジョブ 1 つぶんの gallery-dl の引数（GUI とヘッドレスで共通）。
+
+    ``jars`` があれば、クッキーファイルの代わりに URL のサイトのぶんだけのジャーを渡す。
+    ``profiles`` があれば、URL のサイトのプロファイルを重ねた設定とリトライ回数を使う。
+    """
+    profile = profiles.profile_for(job.url) if profiles is not None and not job.input_file else None
+    if profile is not None:
+        if profile.retries is not None:
+            retries = profile.retries
+        try:
+            config_path = profiles.config_for(config_path, profile)
+        except (OSError, ValueError):
+            pass     # 基本の設定が JSON でないなど: プロファイルの設定なしで続ける
+    args = ["--config", config_path, "--retries", str(retries)]
+    if job.cookie:
+        cookie_path = os.path.abspath(os.path.join(cookie_dir, job.cookie))
+        # 再試行の入力ファイルはサイトが混ざりうるので元のファイルのまま
+        if jars is not None and not job.input_file:
+            try:
+                cookie_path = jars.jar_for(cookie_path, job.url)
+            except OSError:
+                pass
+        args = ["--cookies", cookie_path] + args
+    # 失敗アイテムの再試行は URL の代わりに入力ファイルを渡す
+    return args + (["--input-file", job.input_file] if job.input_file else [job.url])
+
+
+def host_command(base_dir: Optional[str] = None) -> List[str]:
+    """事前ウォームアップ済みワーカー（gallery_dl_runner.py --host）のコマンドライン。"""
+    base_dir = base_dir or app_dir()
+    python_exe = os.path.join(base_dir, "python", "python.exe")
+    if not os.path.exists(python_exe):
+        # 開発環境: GUI と同じインタープリタ（gallery_dl がインストールされている前提）
+        python_exe = sys.executable
+    return [python_exe, os.path.join(base_dir, "gallery_dl_runner.py"), "--host"]
+
+
+def format_size(n: float) -> str:
+    """バイト数を "1.2 MB" 形式にする。"""
+    for unit in ("B", "kB", "MB", "GB"):
+        if n < 1024.0:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024.0
+    return f"{n:.1f} TB"
+
+
+def format_speed(bps: float) -> str:
+    """バイト/秒を "1.2 MB/s" 形式にする。"""
+    return format_size(bps) + "/s"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """残り秒数を "1:02:03" / "2:03" 形式にする。不明なら空文字。"""
+    if seconds is None or seconds < 0 or seconds != seconds:
+        return ""
+    seconds = int(seconds + 0.5)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
+
+
+class Throughput:
+    """受信バイト数の指数移動平均（時定数 ``window`` 秒）。
+
+    サンプル間隔が不規則でも、経過時間に応じた重み 1 - exp(-dt/window) で
+    瞬間値を混ぜるので、進捗イベントの頻度に関係なく同じ時間窓で平滑化される。
+    受信が途絶えている間は rate_at() が時間に応じて減衰させる。
+    計測開始直後は 0 に引っ張られないよう、累積した重みで割って補正する。
+    """
+
+    __slots__ = ("window", "rate", "total", "_last", "_carry", "_weight")
+
+    def __init__(self, window: float = RATE_WINDOW):
+        self.window = window
+        self.rate = 0.0                 # バイト/秒
+        self.total = 0                  # これまでの受信バイト数
+        self._last: Optional[float] = None
+        self._carry = 0                 # まだ rate に混ぜていないバイト数
+        self._weight = 0.0              # これまでの重みの合計（0 → 1）
+
+    def mark(self, now: Optional[float] = None):
+        """計測区間の始点を置く（すでに計測中なら何もしない）。"""
+        if self._last is None:
+            self._last = time.monotonic() if now is None else now
+
+    def add(self, nbytes: int, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.total += nbytes
+        if self._last is None:
+            self._last = now
+            return
+        self._carry += nbytes
+        dt = now - self._last
+        if dt <= 0:
+            return      # 同じ時刻のサンプルは次の区間にまとめる
+        alpha = 1.0 - math.exp(-dt / self.window)
+        self.rate += alpha * (self._carry / dt - self.rate)
+        self._weight += alpha * (1.0 - self._weight)
+        self._carry = 0
+        self._last = now
+
+    def rate_at(self, now: Optional[float] = None) -> float:
+        """``now`` 時点の平滑化スループット（最後のサンプル以降は受信 0 とみなす）。"""
+        if self._last is None or self._weight <= 0.0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        decay = math.exp(-max(0.0, now - self._last) / self.window)
+        weight = self._weight * decay + (1.0 - decay)
+        return self.rate * decay / weight
+
+    def reset(self):
+        self.rate = 0.0
+        self.total = 0
+        self._last = None
+        self._carry = 0
+        self._weight = 0.0
+
+
+def _popen(cmd: List[str], stdin=None) -> subprocess.Popen:
+    """出力を 1 本のバイト列のストリームにまとめて gallery-dl 系のプロセスを起動する。
+
+    復号と行の区切りは LineReader が行う（CR で上書きする進捗表示もそこで 1 行になる）。
+    """
+    si = None
+    if os.name == "nt":
+        si = subprocess.STARTUPINFO()
+        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    env = os.environ.copy()
+    env.update({"PYTHONIOENCODING": "utf-8", "PYTHONUTF8": "1", "PYTHONUNBUFFERED": "1"})
+
+    return subprocess.Popen(
+        cmd,
+        stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        startupinfo=si, env=env,
+    )
+
+
+class WorkerHostPool:
+    """gallery_dl を import 済みで待機しているワーカープロセスのプール。
+
+    ジョブを受け取ったホストはそのジョブだけを実行して終了する（状態を持ち越さない）。
+    1 つ貸し出すたびに補充用のホストを起動するので、次のジョブが来る頃には
+    import が終わっている。停止は従来どおりそのプロセスを kill するだけ。
+    """
+
+    def __init__(self, command: List[str], size: int):
+        self.command = command
+        self.size = max(0, size)
+        self._idle: List[subprocess.Popen] = []
+        self._lock = threading.Lock()
+
+    def _spawn(self) -> subprocess.Popen:
+        return _popen(self.command, stdin=subprocess.PIPE)
+
+    def fill(self):
+        """アイドルのホストを ``size`` 個まで補充する。"""
+        with self._lock:
+            self._idle = [p for p in self._idle if p.poll() is None]
+            while len(self._idle) < self.size:
+                self._idle.append(self._spawn())
+
+    def resize(self, size: int):
+        with self._lock:
+            self.size = max(0, size)
+            extra = self._idle[self.size:]
+            self._idle = self._idle[:self.size]
+        for proc in extra:
+            self._discard(proc)
+        self.fill()
+
+    def acquire(self, args: List[str]) -> subprocess.Popen:
+        """ウォーム済みのホストにジョブを渡して返す。なければその場で起動する。"""
+        proc = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop(0)
+                if candidate.poll() is None:
+                    proc = candidate
+                    break
+        if proc is None:
+            proc = self._spawn()
+        request = (json.dumps({"args": args}, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            proc.stdin.write(request)
+            proc.stdin.close()
+        except OSError:
+            # 待機中に落ちていた → 新しく起動し直す
+            self._discard(proc)
+            proc = self._spawn()
+            proc.stdin.write(request)
+            proc.stdin.close()
+        threading.Thread(target=self.fill, daemon=True).start()
+        return proc
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for proc in idle:
+            self._discard(proc)
+
+    @staticmethod
+    def _discard(proc: subprocess.Popen):
+        try:
+            proc.stdin.close()   # 空行扱いでホストは正常終了する
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def split_urls(text: str) -> List[str]:
+    """貼り付けやファイルのテキストから URL を取り出す（空白区切り、# 以降はコメント）。"""
+    urls = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        urls.extend(line.split())
+    return urls
+
+
+class Job:
+    """キュー内の 1 URL。カウンタはワーカースレッドだけが書き換える。"""
+
+    def __init__(self, job_id: int, url: str, cookie: Optional[str] = None):
+        self.id = job_id
+        self.url = url
+        self.cookie = cookie                  # cookies/ 内のファイル名
+        self.input_file: Optional[str] = None # 失敗アイテムの再試行ジョブ（--input-file）
+        self.state = JOB_QUEUED
+        self.downloaded = 0
+        self.failed = 0
+        self.retries = 0
+        self.skipped = 0                      # 既存ファイルのスキップ
+        self.bytes = 0                        # 完了したファイルの合計サイズ
+        self.speed = ""
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.added = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.partials: Dict[str, int] = {}    # 残してある書きかけファイル（パス → バイト数）
+        self.resumes = 0                      # 自動再開した回数
+        self.rev = 0                          # 変更のたびに増える（表示側の差分更新用）
+
+        # 実行中だけ使う
+        self.process: Optional[subprocess.Popen] = None
+        self.stop_requested = False
+        self.stop_reason: Optional[str] = None
+        self.current_download_path: Optional[str] = None
+        self.last_activity = 0.0              # 最後に何か出力した時刻
+        self.last_progress = 0.0              # 最後にバイト・アイテムが進んだ時刻
+        self.kill_at: Optional[float] = None  # terminate 後に kill する時刻
+        self.timed_out = False                # 停止検知で止められたか
+        self.disk_wait = False                # 空き容量不足で止められたか（空きが戻ったら再開）
+        self.structured = False               # ワーカーが構造化イベントを出しているか
+        self.current_url: Optional[str] = None
+        self.item_open = False                # current_url のアイテムがまだ完了していないか
+        self.last_http: Optional[int] = None
+        self.last_retry: Optional[str] = None # 直前のリトライの理由（失敗の分類に使う）
+        self.archive_path: Optional[str] = None
+        self.throughput = Throughput()
+        self.file_received = 0                # 転送中ファイルの受信済みバイト数
+        self.file_total: Optional[int] = None # 転送中ファイルのサイズ（不明なら None）
+        self.file_started: Optional[float] = None  # 転送中ファイルの開始時刻（monotonic）
+        self.progress_text: Optional[str] = None   # \r で上書きされた最新の進捗行（テキスト出力のとき）
+        self.item_num = 0                     # ギャラリー内の何番目のファイルか
+        self.item_count: Optional[int] = None # ギャラリーのファイル数（抽出器が報告した場合）
+        self.archive_lookups = 0              # ダウンロードアーカイブを照会したアイテム数
+        self.archive_hits = 0                 # そのうちアーカイブでスキップされた数
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def touch(self):
+        self.rev += 1
+
+    def fraction(self) -> Optional[float]:
+        """ジョブの進み具合（0〜1）。ギャラリーのファイル数もファイルサイズも不明なら None。"""
+        file_part = (min(1.0, self.file_received / self.file_total)
+                     if self.file_total else None)
+        if self.item_count:
+            done = max(0, self.item_num - 1) + (file_part or 0.0)
+            return min(1.0, done / self.item_count)
+        return file_part
+
+    def remaining_bytes(self) -> Optional[int]:
+        """残りバイト数の見積もり。ギャラリーの残りファイルは平均サイズで見積もる。"""
+        if not self.file_total:
+            return None
+        remaining = max(0, self.file_total - self.file_received)
+        if self.item_count and self.item_num < self.item_count:
+            sizes = self.bytes + self.file_total
+            avg = sizes / (self.downloaded + 1)
+            remaining += int(avg * (self.item_count - self.item_num))
+        return remaining
+
+    def reset_progress(self):
+        self.throughput.reset()
+        self.file_received = 0
+        self.file_total = None
+        self.item_num = 0
+        self.item_count = None
+        self.archive_lookups = 0
+        self.archive_hits = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "url": self.url, "cookie": self.cookie, "state": self.state,
+            "input_file": self.input_file,
+            "downloaded": self.downloaded, "failed": self.failed, "retries": self.retries,
+            "skipped": self.skipped, "bytes": self.bytes,
+            "exit_code": self.exit_code, "error": self.error, "added": self.added,
+            "started": self.started, "finished": self.finished,
+            "partials": self.partials, "resumes": self.resumes,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Job":
+        job = cls(int(d["id"]), d["url"], d.get("cookie"))
+        job.input_file = d.get("input_file")
+        job.state = d.get("state", JOB_QUEUED)
+        if job.state == JOB_RUNNING:
+            # 前回の実行中に終了した → 再実行対象に戻す
+            job.state = JOB_QUEUED
+        job.downloaded = d.get("downloaded", 0)
+        job.failed = d.get("failed", 0)
+        job.retries = d.get("retries", 0)
+        job.skipped = d.get("skipped", 0)
+        job.bytes = d.get("bytes", 0)
+        job.exit_code = d.get("exit_code")
+        job.error = d.get("error")
+        job.added = d.get("added") or time.time()
+        job.started = d.get("started")
+        job.finished = d.get("finished")
+        job.partials = {p: n for p, n in (d.get("partials") or {}).items()
+                        if os.path.exists(p + PART_SUFFIX)}
+        job.resumes = d.get("resumes", 0)
+        return job
+
+
+class HostLatency:
+    """ホストごとの進捗間隔（次のバイト・次のアイテムまでの時間）の推定。
+
+    TCP の再送タイマーと同じく平滑化平均 srtt と平均偏差 rttvar を持ち、
+    srtt + 4·rttvar をそのホストで「普通に起こりうる最大の間隔」とみなす。
+    """
+
+    __slots__ = ("srtt", "rttvar", "samples")
+
+    def __init__(self):
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.samples = 0
+
+    def sample(self, gap: float):
+        if self.samples == 0:
+            self.srtt = gap
+            self.rttvar = gap / 2.0
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - gap)
+            self.srtt = 0.875 * self.srtt + 0.125 * gap
+        self.samples += 1
+
+    def timeout(self, default: float) -> float:
+        if self.samples < STALL_MIN_SAMPLES:
+            return default
+        t = STALL_FACTOR * (self.srtt + 4.0 * self.rttvar)
+        return max(STALL_MIN_SECONDS, min(STALL_MAX_SECONDS, t))
+
+
+def _job_host(job: "Job") -> str:
+    return (urlsplit(job.current_url or job.url).hostname or "").lower()
+
+
+class Watchdog:
+    """実行中の全ジョブを 1 本のスレッドで監視する。
+
+    ジョブごとに「次に停止判定すべき時刻」を計算し、いちばん早いものまで
+    Condition で眠る。進捗は締め切りを延ばすだけなので起こす必要はなく、
+    ジョブの登録と強制終了の予約のときだけ起こす。
+
+    生存判定:
+      - ファイル転送中は受信バイト（進捗イベント）だけを生存とみなす。
+        リトライの警告などのログ行が出続けていても、バイトが動かなければ停止。
+      - それ以外（抽出中・テキスト解析モード）は出力行も生存とみなす。
+    停止と判定したら terminate し、KILL_GRACE_SECONDS 後も残っていれば kill する。
+    """
+
+    def __init__(self, queue: "JobQueue"):
+        self.queue = queue
+        self.hosts: Dict[str, HostLatency] = {}
+        self._jobs: List[Job] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, job: Job):
+        now = time.monotonic()
+        job.last_activity = job.last_progress = now
+        job.kill_at = None
+        with self._cond:
+            self._jobs.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def unwatch(self, job: Job):
+        with self._cond:
+            if job in self._jobs:
+                self._jobs.remove(job)
+            job.kill_at = None
+            self._cond.notify()
+
+    def progress(self, job: Job):
+        """バイトやアイテムが進んだ（ワーカースレッドから呼ばれる）。間隔をホストの推定に加える。"""
+        now = time.monotonic()
+        gap = now - job.last_progress
+        job.last_progress = job.last_activity = now
+        host = _job_host(job)
+        with self._cond:
+            latency = self.hosts.get(host)
+            if latency is None:
+                latency = self.hosts[host] = HostLatency()
+            latency.sample(gap)
+
+    def timeout_for(self, job: Job) -> float:
+        latency = self.hosts.get(_job_host(job))
+        default = self.queue.timeout_seconds
+        timeout = latency.timeout(default) if latency is not None else default
+        # 429 を受けたサイトでは gallery-dl が sleep-429 のあいだ何も出力しない
+        return timeout + self.queue.hosts.backoff_for(site_of(job.url))
+
+    def escalate(self, job: Job):
+        """terminate 済みのジョブを猶予後に kill する予約を入れる。"""
+        with self._cond:
+            job.kill_at = time.monotonic() + KILL_GRACE_SECONDS
+            self._cond.notify()
+
+    def _check(self, job: Job, now: float) -> Optional[float]:
+        """1 ジョブを判定し、次に判定すべき時刻を返す（監視不要なら None）。"""
+        proc = job.process
+        if job.kill_at is not None:
+            if proc is None or proc.poll() is not None:
+                job.kill_at = None
+                return None
+            if now >= job.kill_at:
+                job.kill_at = None
+                self.queue.on_message(job, "終了しないため kill します", "warning")
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
+                return None
+            return job.kill_at
+        if job.stop_requested or proc is None:
+            return None
+
+        transferring = job.structured and job.current_download_path is not None
+        alive_at = job.last_progress if transferring else max(job.last_progress, job.last_activity)
+        timeout = self.timeout_for(job)
+        deadline = alive_at + timeout
+        if now < deadline:
+            return deadline
+
+        t = int(timeout)
+        job.timed_out = True
+        if transferring:
+            self.queue.on_message(job, f"⏱ {t}秒間ダウンロードが進まないため自動停止します。", "warning")
+        else:
+            self.queue.on_message(job, f"⏱ {t}秒間応答がないため自動停止します。", "warning")
+        self.queue._stop_job(job, f"タイムアウト ({t}秒)", graceful=True)
+        return job.kill_at
+
+    def _loop(self):
+        with self._cond:
+            while True:
+                if not self._jobs:
+                    # 監視対象がなければスレッドを終える（次の watch で作り直す）
+                    self._thread = None
+                    return
+                now = time.monotonic()
+                deadlines = []
+                for job in list(self._jobs):
+                    d = self._check(job, now)
+                    if d is not None:
+                        deadlines.append(d)
+                wait = (min(deadlines) - time.monotonic()) if deadlines else None
+                if wait is None or wait > 0:
+                    self._cond.wait(wait)
+
+
+class JobQueue:
+    """永続化されるジョブキューと、最大 ``workers`` 個の gallery-dl プロセス。
+
+    - build_args(job) -> gallery-dl の引数（実行ファイル部分は gallery_dl_command が付ける）
+    - on_event(job, LineEvent)      出力 1 行ごと
+    - on_message(job, text, tag)    エンジン自身のメッセージ
+    - on_state(job)                 状態が変わったとき
+    - on_idle()                     実行中のジョブがなくなったとき
+
+    ``archive`` を渡して use_archive を有効にすると、各ジョブに
+    サイト/クッキーごとの --download-archive を付ける。
+    ``failures`` を渡すと失敗したアイテムを記録し、retry_failed() で再試行できる。
+    ``dedup`` を渡すと、ダウンロードしたファイルを内容ハッシュの索引に加え、
+    set_dedup() のモードに従って重複をハードリンク・削除する。
+    ``history`` を渡すと、ファイル・失敗・ジョブの結果を履歴データベースに追記する。
+    ``disk`` を渡すと、保存先ボリュームの空き容量と書き込み速度を見て新しいジョブを控え、
+    空きがほとんどなくなったら実行中のジョブを止めて、空きが戻ってから続きから再開する。
+    ``metrics`` を渡すと、行数・イベント数・受信バイト数・ジョブの所要時間を数え、
+    metrics.enabled の間は 1 行ごとの出力待ち・分類・ディスパッチの時間も記録する。
+    set_record(dir) の間は、ジョブごとの出力を時刻付きで dir に記録する（gallery_dl_record）。
+    ``launcher(job, args)`` を渡すと gallery-dl の代わりにそれが返すプロセス
+    （ReplayProcess など）の出力を読む。
+    ``profiles`` を渡すと、プロファイルで per_host を指定したサイトはその同時実行数で動かす
+    （設定ファイルの生成は build_args 側で build_gallery_dl_args に渡す）。
+    ファイルやデータベースを使う部品（archive〜disk, profiles）は、後から attach() でも渡せる。
+    """
+
+    def __init__(self, store_path: str,
+                 build_args: Callable[[Job], List[str]],
+                 on_event: Callable[[Job, LineEvent], None],
+                 on_message: Callable[[Optional[Job], str, str], None],
+                 on_state: Callable[[Job], None],
+                 on_idle: Callable[[], None],
+                 workers: int = DEFAULT_WORKERS,
+                 archive: Optional["ArchiveIndex"] = None,
+                 failures: Optional[FailureStore] = None,
+                 dedup: Optional["DedupIndex"] = None,
+                 history: Optional["HistoryStore"] = None,
+                 disk: Optional[DiskMonitor] = None,
+                 metrics: Optional[Metrics] = None,
+                 launcher: Optional[Callable[[Job, List[str]], Any]] = None,
+                 profiles: Optional["ProfileStore"] = None):
+        self.store_path = store_path
+        self.build_args = build_args
+        self.on_event = on_event
+        self.on_message = on_message
+        self.on_state = on_state
+        self.on_idle = on_idle
+        self.workers = max(1, min(MAX_WORKERS, workers))
+        self.timeout_seconds = TIMEOUT_SECONDS
+        self.watchdog = Watchdog(self)
+        self.hosts = HostScheduler(DEFAULT_PER_HOST)
+        self._wake_at: Optional[float] = None   # バックオフ明けに _pump を呼ぶ予定時刻
+        self.archive: Optional["ArchiveIndex"] = None
+        self.use_archive = False
+        self.failures: Optional[FailureStore] = None
+        self.dedup: Optional["DedupIndex"] = None
+        self.history: Optional["HistoryStore"] = None
+        self.disk: Optional[DiskMonitor] = None
+        self.disk_held = False       # 空き容量のために待機中のジョブを始めていないか
+        self.metrics = metrics
+        self.launcher = launcher
+        self.profiles: Optional["ProfileStore"] = None
+        self.record_dir: Optional[str] = None   # 出力を記録するディレクトリ（None なら記録しない）
+        self.retry_mode = False      # 失敗アイテムを間隔を空けて自動で再試行し続けるか
+
+        self.jobs: List[Job] = []
+        self.active = False          # False の間は新しいジョブを起動しない
+        self.host_pool: Optional[WorkerHostPool] = None   # 事前ウォームアップ（任意）
+        self.throughput = Throughput()   # 全ジョブ合計の受信スループット
+        self.batch: set = set()          # 今回の実行でまとめて進捗を出すジョブの ID
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._saving = False             # save() が書き込み中か
+        self._save_pending = False       # 書き込み中に次の save() が来たか
+        self._next_id = 1
+        self.attach(archive, failures, dedup, history, disk, profiles)
+        if metrics is not None:
+            metrics.gauge("gallery_dl_receive_rate_bytes", "Smoothed receive rate in bytes/s",
+                          self.throughput.rate_at)
+            metrics.gauge("gallery_dl_running_jobs", "Jobs currently running",
+                          lambda: len(self.running()))
+            metrics.gauge("gallery_dl_queued_jobs", "Jobs waiting to run",
+                          lambda: self.counts()[JOB_QUEUED])
+
+    def attach(self, archive: Optional["ArchiveIndex"] = None,
+               failures: Optional[FailureStore] = None,
+               dedup: Optional["DedupIndex"] = None,
+               history: Optional["HistoryStore"] = None,
+               disk: Optional[DiskMonitor] = None,
+               profiles: Optional["ProfileStore"] = None):
+        """ファイルやデータベースを使う部品を付ける（None のものはそのまま）。
+
+        load() と start() より前に呼ぶ。GUI はウィンドウを表示してから開いて付ける。
+        """
+        if archive is not None:
+            self.archive = archive
+            self.use_archive = True
+        if failures is not None:
+            self.failures = failures
+        if dedup is not None:
+            self.dedup = dedup
+        if history is not None:
+            self.history = history
+        if profiles is not None:
+            self.profiles = profiles
+        if disk is not None:
+            self.disk = disk
+            disk.on_change = self._on_disk
+            disk.start()
+
+    # 永続化
+    # ──────────────────────────────────────────────
+    def load(self):
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.workers = max(1, min(MAX_WORKERS, int(data.get("workers", self.workers))))
+            self.use_archive = self.archive is not None and data.get("archive", True)
+            self.hosts.set_per_host(data.get("per_host", self.hosts.per_host))
+            if self.dedup is not None:
+                from gallery_dl_dedup import DEDUP_MODES
+                if data.get("dedup") in DEDUP_MODES:
+                    self.dedup.mode = data["dedup"]
+            self.record_dir = data.get("record_dir") or None
+            self.jobs = [Job.from_dict(d) for d in data.get("jobs", [])]
+            self._next_id = max((j.id for j in self.jobs), default=0) + 1
+        if self.disk is not None and data.get("min_free") is not None:
+            self.disk.set_reserve(data["min_free"])
+        if data.get("prewarm"):
+            self.set_prewarm(True)
+
+    def save(self):
+        """キューを保存する。
+
+        複数のスレッド（ワーカー・API）から同時に呼ばれたときは、書き込み中のスレッドが
+        終わったあとにもう 1 回だけ最新の状態を書き、ほかの呼び出し側は待たずに戻る。
+        """
+        with self._save_lock:
+            if self._saving:
+                self._save_pending = True
+                return
+            self._saving = True
+        while True:
+            with self._lock:
+                data = {"workers": self.workers, "prewarm": self.host_pool is not None,
+                        "archive": self.use_archive, "per_host": self.hosts.per_host,
+                        "dedup": self.dedup.mode if self.dedup is not None else None,
+                        "min_free": self.disk.reserve if self.disk is not None else None,
+                        "record_dir": self.record_dir,
+                        "jobs": [j.to_dict() for j in self.jobs]}
+            tmp = self.store_path + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+                os.replace(tmp, self.store_path)
+            except OSError as e:
+                self.on_message(None, f"Could not save queue: {e}", "error")
+            with self._save_lock:
+                if not self._save_pending:
+                    self._saving = False
+                    return
+                self._save_pending = False
+
+    # 操作
+    # ──────────────────────────────────────────────
+    def add(self, urls: Iterable[str], cookie: Optional[str] = None) -> List[Job]:
+        added = []
+        with self._lock:
+            for url in urls:
+                url = url.strip()
+                if not url:
+                    continue
+                job = Job(self._next_id, url, cookie)
+                self._next_id += 1
+                self.jobs.append(job)
+                added.append(job)
+                if self.active:
+                    self.batch.add(job.id)
+        for job in added:
+            self.on_state(job)
+        self.save()
+        self._pump()
+        return added
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            for job in self.jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def snapshot(self, state: Optional[str] = None) -> List[Job]:
+        """ジョブ一覧のコピー（``state`` を渡せばその状態のものだけ）。
+
+        ワーカーが一覧を書き換えている最中でも安全に回せるよう、ロックを取ってコピーする。
+        """
+        with self._lock:
+            if state is None:
+                return list(self.jobs)
+            return [j for j in self.jobs if j.state == state]
+
+    def start(self):
+        with self._lock:
+            if not any(j.state == JOB_RUNNING for j in self.jobs):
+                # 新しい実行: 進捗バーはここから待機中のジョブまでを 1 つとして数える
+                self.batch = set()
+                self.throughput.reset()
+            for j in self.jobs:
+                if j.state == JOB_STOPPED and j.partials:
+                    # 書きかけのファイルが残っている停止済みジョブは続きから再開する
+                    j.state = JOB_QUEUED
+                    j.touch()
+            self.batch.update(j.id for j in self.jobs if j.state == JOB_QUEUED)
+        self.active = True
+        self._pump()
+
+    def set_workers(self, n: int):
+        self.workers = max(1, min(MAX_WORKERS, int(n)))
+        if self.host_pool is not None:
+            self.host_pool.resize(self.workers)
+        self.save()
+        self._pump()
+
+    def set_per_host(self, n: int):
+        self.hosts.set_per_host(n)
+        self.save()
+        self._pump()
+
+    def set_archive(self, enabled: bool):
+        self.use_archive = enabled and self.archive is not None
+        self.save()
+
+    def set_dedup(self, mode: str):
+        if self.dedup is None:
+            return
+        from gallery_dl_dedup import DEDUP_MODES
+        if mode in DEDUP_MODES:
+            self.dedup.mode = mode
+            self.save()
+
+    def set_min_free(self, nbytes: int):
+        """新しいジョブを始めるのに必要な保存先の空き容量。"""
+        if self.disk is not None:
+            self.disk.set_reserve(nbytes)
+            self.save()
+            self._pump()
+
+    def set_record(self, directory: Optional[str]):
+        """次に始まるジョブから、出力を ``directory`` に記録する（None で記録しない）。"""
+        self.record_dir = directory or None
+        self.save()
+
+    def set_prewarm(self, enabled: bool, command: Optional[List[str]] = None):
+        """事前ウォームアップ済みワーカーの使用を切り替える。"""
+        if enabled and self.host_pool is None:
+            self.host_pool = WorkerHostPool(command or host_command(), self.workers)
+            threading.Thread(target=self.host_pool.fill, daemon=True).start()
+        elif not enabled and self.host_pool is not None:
+            pool, self.host_pool = self.host_pool, None
+            pool.shutdown()
+
+    def shutdown(self):
+        """アプリ終了時: 待機中のホストと監視スレッドを片付ける（実行中のジョブには触れない）。"""
+        if self.host_pool is not None:
+            self.host_pool.shutdown()
+        if self.disk is not None:
+            self.disk.stop()
+
+    def requeue(self, job_id: int):
+        job = self.get(job_id)
+        if job is None or job.state not in FINISHED_STATES:
+            return
+        job.state = JOB_QUEUED
+        job.exit_code = None
+        job.error = None
+        job.started = job.finished = None
+        job.touch()
+        if self.active:
+            self.batch.add(job.id)
+        self.on_state(job)
+        self.save()
+        self._pump()
+
+    def remove(self, job_id: int):
+        job = self.get(job_id)
+        if job is None:
+            return
+        if job.state == JOB_RUNNING:
+            self.stop(job_id, "removed")
+        with self._lock:
+            self.jobs = [j for j in self.jobs if j.id != job_id]
+            self.batch.discard(job_id)
+        self.save()
+
+    def clear_finished(self):
+        with self._lock:
+            self.jobs = [j for j in self.jobs if j.state not in FINISHED_STATES]
+        self.save()
+
+    def retry_failed(self, force: bool = False) -> Optional[Job]:
+        """再試行してよい失敗アイテムを 1 つの --input-file ジョブにまとめて投入する。
+
+        ``force`` は手動の再試行（間隔を待たない）。再試行ジョブが待機中・実行中なら重ねない。
+        """
+        if self.failures is None:
+            return None
+        with self._lock:
+            if any(j.input_file and j.state in (JOB_QUEUED, JOB_RUNNING) for j in self.jobs):
+                return None
+        records = self.failures.due(force=force)
+        if not records:
+            return None
+        error = None
+        with self._lock:
+            job = Job(self._next_id, f"retry: {len(records)} failed item(s)")
+            self._next_id += 1
+            job.input_file = os.path.join(os.path.dirname(os.path.abspath(self.store_path)),
+                                          "retry", f"retry-{job.id}.txt")
+            try:
+                self.failures.write_input_file(records, job.input_file)
+            except OSError as e:
+                error = f"Could not write retry list: {e}"
+            else:
+                self.jobs.append(job)
+                if self.active:
+                    self.batch.add(job.id)
+        # コールバックはロックの外で呼ぶ（GUI 側のロックと順序が逆になって固まるのを防ぐ）
+        if error is not None:
+            self.on_message(None, error, "error")
+            return None
+        self.on_state(job)
+        self.save()
+        self._pump()
+        return job
+
+    def schedule_retry(self):
+        """再試行モード中、次に再試行できるアイテムが出てくる時刻に次の回を予約する。"""
+        next_due = self.failures.next_due() if self.failures is not None else None
+        if next_due is None:
+            self.retry_mode = False
+            left = len(self.failures) if self.failures is not None else 0
+            if left:
+                self.on_message(None, f"Retry finished: {left} item(s) still failing "
+                                      f"after the maximum number of attempts", "warning")
+            else:
+                self.on_message(None, "Retry finished: all failed items recovered", "success")
+            return
+        delay = max(0.0, next_due - time.time())
+        self.on_message(None, f"Next retry of {len(self.failures)} failed item(s) in {delay:.0f}s", "dim")
+
+        def fire():
+            if self.retry_mode and self.active:
+                if self.retry_failed() is None:
+                    self.schedule_retry()
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        timer.start()
+
+    def stop(self, job_id: int, reason: str = "ユーザーによる停止"):
+        job = self.get(job_id)
+        if job is None:
+            return
+        if job.state == JOB_QUEUED:
+            job.state = JOB_STOPPED
+            job.touch()
+            self.on_state(job)
+            self.save()
+            return
+        if job.state != JOB_RUNNING:
+            return
+        self._stop_job(job, reason)
+
+    def stop_all(self, reason: str = "ユーザーによる停止"):
+        """キューを一時停止し、実行中のジョブをすべて止める。待機中のジョブは残る。"""
+        self.active = False
+        self.retry_mode = False
+        for job in self.running():
+            self._stop_job(job, reason)
+
+    def running(self) -> List[Job]:
+        with self._lock:
+            return [j for j in self.jobs if j.state == JOB_RUNNING]
+
+    def counts(self) -> Dict[str, int]:
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0, JOB_STOPPED: 0}
+        with self._lock:
+            for job in self.jobs:
+                counts[job.state] += 1
+        return counts
+
+    def totals(self) -> Dict[str, int]:
+        """全ジョブの合計カウンタ。"""
+        with self._lock:
+            return {
+                "downloaded": sum(j.downloaded for j in self.jobs),
+                "failed": sum(j.failed for j in self.jobs),
+                "retries": sum(j.retries for j in self.jobs),
+            }
+
+    def progress(self) -> Dict[str, Any]:
+        """進捗表示用のスナップショット。
+
+        スループットの平滑化はワーカースレッドがイベントごとに済ませているので、
+        ここでは実行中のジョブを集計するだけ（GUI が一定のフレーム間隔で呼ぶ）。
+        """
+        now = time.monotonic()
+        with self._lock:
+            running = [j for j in self.jobs if j.state == JOB_RUNNING]
+            batch = [j for j in self.jobs if j.id in self.batch]
+            batch_done = sum(1 for j in batch if j.state in FINISHED_STATES)
+            files = sum(j.downloaded for j in batch)
+            file_received = sum(j.file_received for j in running)
+        rate = self.throughput.rate_at(now)
+
+        fraction: Optional[float] = None
+        if len(batch) > 1:
+            fraction = (batch_done + sum(j.fraction() or 0.0 for j in running)) / len(batch)
+        elif len(running) == 1:
+            fraction = running[0].fraction()
+
+        remaining = [j.remaining_bytes() for j in running]
+        eta = None
+        if running and rate > 0 and all(r is not None for r in remaining):
+            eta = sum(remaining) / rate
+
+        current = running[0] if len(running) == 1 else None
+        return {
+            "running": len(running),
+            "batch_total": len(batch),
+            "batch_done": batch_done,
+            "files": files,
+            "item_num": current.item_num if current else 0,
+            "item_count": current.item_count if current else None,
+            "bytes": self.throughput.total,
+            "in_flight": file_received,
+            "rate": rate,
+            "eta": eta,
+            "fraction": fraction,
+            "disk": self.disk.latest._asdict() if self.disk is not None and self.disk.latest else None,
+        }
+
+    # ディスパッチ
+    # ──────────────────────────────────────────────
+    def _pump(self):
+        """空いているワーカー枠に待機中のジョブを割り当てる。
+
+        サイトごとの上限やバックオフで始められないジョブは飛ばし、別のサイトの
+        ジョブを先に始める。待てば始められるものがあればその時刻に再度呼ぶ。
+        保存先の空き容量が足りない・書き込みが追いつかないときは、状態が戻ったときに
+        _on_disk から再度呼ばれる。
+        """
+        to_start = []
+        wake: Optional[float] = None
+        held = False
+        with self._lock:
+            if self.active:
+                now = time.monotonic()
+                running = [j for j in self.jobs if j.state == JOB_RUNNING]
+                per_site: Dict[str, int] = {}
+                for j in running:
+                    site = site_of(j.url)
+                    per_site[site] = per_site.get(site, 0) + 1
+                free = self.workers - len(running)
+                for job in self.jobs:
+                    if free <= 0:
+                        break
+                    if job.state == JOB_QUEUED:
+                        if self.disk is not None and not self.disk.admit(len(running) + len(to_start)):
+                            held = True
+                            break
+                        site = site_of(job.url)
+                        limit = self.profiles.per_host(site) if self.profiles is not None else None
+                        ok, wait = self.hosts.admit(site, per_site.get(site, 0), now, limit)
+                        if not ok:
+                            if wait is not None:
+                                wake = min(wake, wait) if wake is not None else wait
+                            continue
+                        per_site[site] = per_site.get(site, 0) + 1
+                        job.state = JOB_RUNNING
+                        job.stop_requested = False
+                        job.stop_reason = None
+                        job.timed_out = False
+                        job.disk_wait = False
+                        job.started = time.time()
+                        job.finished = None
+                        job.reset_progress()
+                        job.touch()
+                        to_start.append(job)
+                        free -= 1
+            busy = any(j.state == JOB_RUNNING for j in self.jobs)
+            self.disk_held = held
+
+        for job in to_start:
+            self.on_state(job)
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+        if wake is not None:
+            self._schedule_pump(wake)
+        elif not busy and not held:
+            self.on_idle()
+
+    def _schedule_pump(self, delay: float):
+        """``delay`` 秒後に _pump を呼ぶ（すでにそれより早い予定があれば何もしない）。"""
+        at = time.monotonic() + delay
+        with self._lock:
+            if self._wake_at is not None and self._wake_at <= at:
+                return
+            self._wake_at = at
+
+        def fire():
+            with self._lock:
+                if self._wake_at != at:
+                    return
+                self._wake_at = None
+            self._pump()
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        timer.start()
+
+    def _stop_job(self, job: Job, reason: str, graceful: bool = False):
+        """ジョブのプロセスを止める。graceful なら terminate し、残っていれば後で kill する。"""
+        job.stop_requested = True
+        job.stop_reason = reason
+        proc = job.process
+        if proc:
+            try:
+                if graceful:
+                    self.on_message(job, "終了を要求しています...", "warning")
+                    proc.terminate()
+                    self.watchdog.escalate(job)
+                else:
+                    self.on_message(job, "強制終了を試みています...", "warning")
+                    proc.kill()  # 即座に停止
+            except Exception as e:
+                self.on_message(job, f"プロセス終了エラー: {e}", "error")
+
+        self.on_message(job, f"停止中… ({reason})", "warning")
+
+    def _on_disk(self, sample: DiskSample):
+        """保存先ボリュームの状態が変わったとき（監視スレッドから呼ばれる）。"""
+        if not self.active:
+            return                   # 実行していなければ表示（統計行）だけ
+        free = format_size(sample.free)
+        if sample.state == DISK_FULL:
+            running = self.running()
+            self.on_message(None, f"Disk almost full ({free} free): stopping {len(running)} job(s), "
+                                  f"they resume when space is freed", "error")
+            for job in running:
+                if not job.disk_wait:
+                    job.disk_wait = True
+                    self._stop_job(job, "disk full", graceful=True)
+        elif sample.state == DISK_LOW:
+            self.on_message(None, f"Low disk space ({free} free, {format_size(self.disk.reserve)} "
+                                  f"required): not starting new jobs", "warning")
+        elif sample.state == DISK_SLOW:
+            reason = (f"fills up in {format_eta(sample.eta_full)}" if sample.eta_full is not None
+                      else f"{sample.util:.0%} busy" if sample.util is not None else "busy")
+            self.on_message(None, f"Disk {reason} at {format_speed(sample.write_rate)}: "
+                                  f"not adding jobs", "warning")
+        elif self.disk_held:
+            self.on_message(None, f"Disk OK ({free} free): resuming", "success")
+        if sample.state != DISK_FULL:
+            self._pump()
+
+    def _disk_error(self, job: Job, text: str) -> bool:
+        """空き容量不足のエラーなら、失敗として数えずにジョブを止めて True を返す。"""
+        if self.disk is None or not any(e in text for e in DISK_FULL_ERRORS):
+            return False
+        if not job.disk_wait:
+            job.disk_wait = True
+            self._stop_job(job, "disk full", graceful=True)
+            self.disk.sample()
+        return True
+
+    def _on_http_status(self, job: Job, status: Optional[int]):
+        """429 / 503 を受けたらそのサイトのバックオフを始める。"""
+        if not status:
+            return
+        site = site_of(job.url)
+        backoff = self.hosts.on_http(site, status)
+        if backoff is not None:
+            delay, rate = backoff
+            self.on_message(job, f"HTTP {status}: {site} への新しいジョブを {delay:.0f} 秒控え、"
+                                 f"{rate:.2f} req/s に制限します", "warning")
+
+    def _record_failure(self, job: Job, item_url: Optional[str], message: str,
+                        http: Optional[int], kind: Optional[str] = None):
+        """失敗をストアに記録する。アイテムが特定できない（抽出時の）エラーはギャラリー URL で記録する。"""
+        if self.history is not None:
+            from gallery_dl_history import KIND_ERROR
+            self.history.add_file(KIND_ERROR, job.url, item_url,
+                                  job.current_download_path if item_url else None,
+                                  message=message + (f" [HTTP {http}]" if http else ""), job=job.id)
+        if self.failures is None:
+            return
+        url = item_url or (None if job.input_file else job.url)
+        if not url:
+            return
+        self.failures.record(url, job.url, job.cookie, job.current_download_path if item_url else None,
+                             http, message, kind)
+        job.item_open = False
+
+    def _on_dedup(self, job: Job, result: "DedupResult"):
+        """重複排除のスレッドから呼ばれる。"""
+        from gallery_dl_dedup import DEDUP_HARDLINK
+        if result.action is None:
+            return
+        verb = "hardlinked to" if result.action == DEDUP_HARDLINK else "removed, same as"
+        self.on_message(job, f"Duplicate {os.path.basename(result.path)} {verb} "
+                             f"{result.original} ({format_size(result.size)} saved)", "dim")
+
+    def _resolve_failure(self, job: Job):
+        job.item_open = False
+        if self.failures is not None and len(self.failures):
+            self.failures.resolve(job.current_url)
+
+    def _keep_partial(self, job: Job):
+        """プロセス終了後、転送途中だったファイルの .part を記録する（削除はしない）。
+
+        gallery-dl は次回同じパスに保存するとき .part の続きを Range リクエストで取得する。
+        """
+        path = job.current_download_path
+        job.current_download_path = None
+        if not path:
+            return
+        try:
+            size = os.path.getsize(path + PART_SUFFIX)
+        except OSError:
+            job.partials.pop(path, None)
+            return
+        job.partials[path] = size
+        self.on_message(job, f"途中のファイルを残しました: {os.path.basename(path)} "
+                             f"({format_size(size)}) — 次回の実行で続きから再開します", "dim")
+
+    def _add_bytes(self, job: Job, nbytes: int):
+        """受信バイト数をジョブと全体のスループットに加える（ワーカースレッドで呼ばれる）。"""
+        if nbytes <= 0:
+            return
+        now = time.monotonic()
+        job.throughput.add(nbytes, now)
+        job.speed = format_speed(job.throughput.rate_at(now))
+        with self._lock:
+            self.throughput.add(nbytes, now)
+        if self.metrics is not None:
+            self.metrics.bytes.inc(nbytes)
+
+    def _handle_worker_event(self, job: Job, payload: str) -> Optional[LineEvent]:
+        """ワーカーからの構造化イベント（gallery_dl_runner.emit）を処理する。
+
+        カウンタを更新し、ログに出すものがあれば LineEvent を返す。警告・エラーの
+        テキスト自体は gallery-dl のログ行として別に届くので、ここでは表示しない。
+        """
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return None
+        event = data.get("event")
+
+        if event == "progress":
+            if (data.get("downloaded") or 0) > job.file_received:
+                self.watchdog.progress(job)
+            self._add_bytes(job, (data.get("downloaded") or 0) - job.file_received)
+            job.file_received = data.get("downloaded") or 0
+            job.file_total = data.get("total") or None
+        elif event == "start":
+            self.watchdog.progress(job)
+            job.current_download_path = data.get("path")
+            # 途中から再開する場合、既にあるバイト数は今回の受信に数えない
+            job.file_received = data.get("resume") or 0
+            job.file_total = None
+            job.file_started = time.monotonic()
+        elif event == "done":
+            self.watchdog.progress(job)
+            path = data.get("path")
+            size = data.get("size") or 0
+            job.downloaded += 1
+            job.bytes += size
+            self._add_bytes(job, size - job.file_received)
+            job.file_received = 0
+            job.file_total = None
+            job.current_download_path = None
+            job.partials.pop(path, None)
+            self.hosts.on_success(site_of(job.url))
+            self._resolve_failure(job)
+            if self.dedup is not None and path:
+                self.dedup.submit(path, lambda r, job=job: self._on_dedup(job, r))
+            if self.history is not None:
+                from gallery_dl_history import KIND_DONE
+                duration = time.monotonic() - job.file_started if job.file_started else None
+                self.history.add_file(KIND_DONE, job.url, job.current_url, path, size,
+                                      duration, job=job.id)
+            job.file_started = None
+            return LineEvent(EV_DOWNLOAD, "success", path, job.current_url, path)
+        elif event == "skip":
+            self.watchdog.progress(job)
+            job.skipped += 1
+            self._resolve_failure(job)
+            if data.get("archive"):
+                job.archive_hits += 1
+                return LineEvent(EV_INFO, "dim", f"# archived: {job.current_url}", job.current_url)
+            return LineEvent(EV_INFO, "dim", f"# {data.get('path')}", job.current_url)
+        elif event == "item":
+            job.current_url = data.get("url")
+            job.item_open = True
+            self.watchdog.progress(job)
+            job.last_http = None
+            job.last_retry = None
+            job.item_num = data.get("num") or 0
+            job.item_count = data.get("count") or None
+            if job.archive_path:
+                job.archive_lookups += 1
+        elif event == "http":
+            job.last_http = data.get("status")
+            self._on_http_status(job, job.last_http)
+        elif event == "retry":
+            job.retries += 1
+            job.last_retry = data.get("message")
+        elif event == "error":
+            if self._disk_error(job, data.get("message", "")):
+                return None          # 失敗タブには出さない（ログ行は別に届く）
+            job.failed += 1
+            desc = data.get("message", "")
+            if job.last_http:
+                desc += f" [HTTP {job.last_http}]"
+            url = job.current_url
+            failed_item = f"{desc} | URL: {url}" if url and url not in desc else desc
+            message = data.get("message", "")
+            if job.last_retry and job.item_open:
+                message += f" ({job.last_retry})"
+            if data.get("path"):
+                job.current_download_path = data["path"]
+            self._record_failure(job, url if job.item_open else None,
+                                 message, job.last_http, data.get("kind"))
+            return LineEvent(EV_ERROR, "error", None, url, None, None, job.last_http,
+                             None, failed_item)
+        elif event == "hello":
+            job.structured = True
+        elif event == "host":
+            self.on_message(job, f"Pre-warmed worker (startup {data.get('warmup_ms', 0):.0f} ms skipped)", "dim")
+        return None
+
+    def _parse_line(self, job: Job, classifier: LineClassifier, line: str) -> Optional[LineEvent]:
+        """出力 1 行を解析してジョブのカウンタを更新し、ログに出す LineEvent を返す。"""
+        if line.startswith(EVENT_PREFIX):
+            ev = self._handle_worker_event(job, line[len(EVENT_PREFIX):])
+            job.touch()
+            return ev
+
+        if job.structured:
+            # カウントはイベント側で済んでいる。テキストは表示するだけ
+            return display_event(line)
+
+        # 構造化イベントを出さない gallery-dl（PATH 上の実行ファイル）: テキストを解析する
+        ev = classifier.classify(line)
+        kind = ev.kind
+        if ev.http:
+            self._on_http_status(job, ev.http)
+        if kind == EV_DOWNLOAD:
+            job.downloaded += 1
+            job.progress_text = None
+            if ev.path:
+                job.current_download_path = os.path.abspath(ev.path)
+            if self.history is not None:
+                from gallery_dl_history import KIND_DONE
+                self.history.add_file(KIND_DONE, job.url, ev.url, ev.path, job=job.id)
+        elif kind == EV_RETRY:
+            job.retries += 1
+        elif (kind == EV_ERROR or kind == EV_SKIP) and self._disk_error(job, line):
+            ev = display_event(line)
+        elif kind == EV_ERROR or kind == EV_SKIP:
+            job.failed += 1
+            self._record_failure(job, ev.url or classifier.last_url, ev.text or "", ev.http)
+        if ev.speed:
+            job.speed = ev.speed
+        job.touch()
+        return ev
+
+    def _run_job(self, job: Job):
+        recorder: Optional[SessionRecorder] = None
+        job.last_activity = time.monotonic()
+        job.throughput.mark(job.last_activity)
+        with self._lock:
+            self.throughput.mark(job.last_activity)
+        try:
+            site = site_of(job.url)
+            sleep = self.profiles.sleep_request(site) if self.profiles is not None else None
+            args = self.hosts.options(site, sleep) + self.build_args(job)
+            job.archive_path = None
+            if self.use_archive and self.archive is not None and not job.input_file:
+                job.archive_path = self.archive.path_for(job.url, job.cookie)
+                args = ["--download-archive", job.archive_path] + args
+            self.on_message(job, "─" * 56, "dim")
+            self.on_message(job, f"gallery-dl {' '.join(args)}", "dim")
+            self.on_message(job, "─" * 56, "dim")
+
+            pool = self.host_pool
+            if self.launcher is not None:
+                proc = self.launcher(job, args)
+            elif pool is not None:
+                proc = pool.acquire(args)
+            else:
+                proc = _popen(gallery_dl_command(args))
+            job.process = proc
+            stdout = proc.stdout
+            if not stdout:
+                # 出力を読めなければ進み具合も終わりも分からない: プロセスを止めて失敗にする
+                # （状態の通知・保存・次のジョブの起動は finally で行う）
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
+                job.state = JOB_FAILED
+                job.error = "gallery-dl has no output pipe"
+                self.on_message(job, f"Error: {job.error}", "error")
+                return
+            if self.record_dir:
+                try:
+                    recorder = SessionRecorder.for_job(self.record_dir, job.id, job.url, args)
+                except OSError as e:
+                    self.on_message(job, f"Could not record this session: {e}", "warning")
+
+            # 停止検知（全ジョブ共通の監視スレッド）
+            self.watchdog.watch(job)
+
+            classifier = LineClassifier()
+            reader = LineReader(stdout)
+            metrics = self.metrics
+            # 行数・イベント数は手元で数え、METRICS_FLUSH_SECONDS ごとにまとめて足す
+            n_lines = n_events = n_progress = coalesced = 0
+            flushed = time.monotonic()
+            read_started = 0.0       # 前の行を処理し終えた時刻（計測していなければ 0）
+            for raw_line in reader:
+                if recorder is not None:
+                    recorder.write(raw_line)
+                if job.stop_requested:
+                    break
+                line = raw_line.rstrip()
+                if not line:
+                    continue
+
+                now = job.last_activity = time.monotonic()  # 活動時刻を更新
+
+                if raw_line[-1] == "\r":
+                    # 進捗だけの行: ログには流さず、最新の 1 行を描画側が読みに来る
+                    job.progress_text = line.strip()
+                    speed = progress_speed(line)
+                    if speed:
+                        job.speed = speed
+                    n_progress += 1
+                    continue
+
+                if metrics is None:
+                    ev = self._parse_line(job, classifier, line)
+                    if ev is not None:
+                        self.on_event(job, ev)
+                    continue
+
+                n_lines += 1
+                if now - flushed >= METRICS_FLUSH_SECONDS:
+                    metrics.lines.inc(n_lines)
+                    metrics.events.inc(n_events)
+                    metrics.progress.inc(n_progress)
+                    metrics.coalesced.inc(reader.coalesced - coalesced)
+                    coalesced = reader.coalesced
+                    n_lines = n_events = n_progress = 0
+                    flushed = now
+                if not metrics.enabled:
+                    read_started = 0.0
+                    ev = self._parse_line(job, classifier, line)
+                    if ev is not None:
+                        n_events += 1
+                        self.on_event(job, ev)
+                    continue
+
+                # 計測中: 出力待ち → 分類 → ディスパッチの各時間を記録する
+                parse_started = time.perf_counter()
+                if read_started:
+                    metrics.read_wait.observe(parse_started - read_started)
+                ev = self._parse_line(job, classifier, line)
+                dispatch_started = time.perf_counter()
+                metrics.parse.observe(dispatch_started - parse_started)
+                if ev is not None:
+                    n_events += 1
+                    self.on_event(job, ev)
+                    read_started = time.perf_counter()
+                    metrics.dispatch.observe(read_started - dispatch_started)
+                else:
+                    read_started = dispatch_started
+            if metrics is not None:
+                metrics.lines.inc(n_lines)
+                metrics.events.inc(n_events)
+                metrics.progress.inc(n_progress)
+                metrics.coalesced.inc(reader.coalesced - coalesced)
+
+            # 停止時もここでプロセスの終了を待ち、終了後に書きかけファイルを確認する
+            proc.wait()
+            job.exit_code = proc.returncode
+            self._keep_partial(job)
+            if job.stop_requested:
+                if job.disk_wait:
+                    job.state = JOB_QUEUED
+                    self.on_message(job, "空き容量が戻ったら続きから再開します", "warning")
+                elif job.timed_out and job.partials and job.resumes < MAX_AUTO_RESUME:
+                    job.resumes += 1
+                    job.state = JOB_QUEUED
+                    self.on_message(job, f"途中のファイルから再開します ({job.resumes}/{MAX_AUTO_RESUME})", "warning")
+                else:
+                    job.state = JOB_STOPPED
+                    self.on_message(job, "停止しました", "warning")
+            else:
+                job.state = JOB_DONE if job.exit_code == 0 else JOB_FAILED
+                tag = "success" if job.exit_code == 0 else "warning"
+                self.on_message(job, f"Finished  —  exit code {job.exit_code}", tag)
+            if job.archive_hits:
+                self.on_message(job, f"Download archive: {job.archive_hits}/{job.archive_lookups} "
+                                     f"item(s) already fetched, skipped", "dim")
+
+        except FileNotFoundError:
+            job.state = JOB_FAILED
+            job.error = "gallery-dl not found"
+            self.on_message(job, "Error: gallery-dl not found.", "error")
+        except Exception as exc:
+            job.state = JOB_FAILED
+            job.error = str(exc)
+            self.on_message(job, f"Error: {exc}", "error")
+        finally:
+            self.watchdog.unwatch(job)
+            if recorder is not None:
+                try:
+                    recorder.close({"exit": job.exit_code, "state": job.state, "error": job.error,
+                                    "downloaded": job.downloaded, "skipped": job.skipped,
+                                    "failed": job.failed, "retries": job.retries,
+                                    "bytes": job.bytes})
+                except OSError:
+                    pass
+            job.process = None
+            job.speed = ""
+            job.progress_text = None
+            job.file_received = 0
+            job.file_total = None
+            job.structured = False
+            if job.archive_path and self.archive is not None:
+                self.archive.record(job.url, job.cookie, job.archive_lookups, job.archive_hits)
+            if self.failures is not None:
+                self.failures.save()
+                if job.input_file and self.retry_mode and not job.stop_requested:
+                    self.schedule_retry()
+            job.finished = time.time()
+            if self.metrics is not None:
+                self.metrics.jobs.inc(1, job.state)
+                if job.started is not None:
+                    self.metrics.job_time.observe(job.finished - job.started)
+            if self.history is not None and job.started is not None:
+                self.history.add_job(job.started, job.id, job.url, job.cookie, job.state,
+                                     job.finished, job.downloaded, job.skipped, job.failed,
+                                     job.bytes, job.exit_code, job.error)
+            job.touch()
+            self.on_state(job)
+            self.save()
+            self._pump()
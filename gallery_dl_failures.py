@@ -0,0 +1,172 @@
+"""
+gallery_dl_failures.py
+失敗したアイテムの永続ストアと、再試行用の入力ファイルの生成。
+
+失敗タブのテキストとは別に、失敗 1 件ごとに URL・保存先・HTTP コード・
+エラーの種類・試行回数を failures.json に残す。"Retry Failed" ではこれらの
+アイテムだけを gallery-dl の --input-file 1 つにまとめて再実行するので、
+4 万件中 300 件の失敗を取り直すのにギャラリー全体を再クロールしなくて済む。
+まだ失敗するアイテムは試行回数に応じて指数的に間隔を空けて再試行する。
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional, List, Dict, Any
+
+RETRY_BASE_SECONDS = 30.0   # 1 回目の再試行までの間隔。以後 2 倍ずつ
+RETRY_MAX_SECONDS  = 3600.0
+MAX_ATTEMPTS       = 5      # この回数失敗したアイテムは自動では再試行しない
+
+
+def classify_error(message: str, http: Optional[int] = None, kind: Optional[str] = None) -> str:
+    """エラーの種類を大まかに分類する（表示と再試行の判断用）。"""
+    if http:
+        return f"http-{http // 100}xx"
+    text = f"{kind or ''} {message}".lower()
+    if "timeout" in text or "timed out" in text:
+        return "timeout"
+    if "connection" in text or "connect" in text or "ssl" in text:
+        return "connection"
+    if "permission" in text or "no space" in text or "oserror" in text:
+        return "filesystem"
+    return kind or "other"
+
+
+class FailureRecord:
+    """失敗したアイテム 1 件。キーはアイテムの URL。"""
+
+    def __init__(self, url: str, source: str, cookie: Optional[str] = None):
+        self.url = url                        # ファイル（アイテム）の URL
+        self.source = source                  # 元のギャラリー URL（ジョブの URL）
+        self.cookie = cookie                  # cookies/ 内のファイル名
+        self.path: Optional[str] = None       # 保存先（分かっていれば）
+        self.http: Optional[int] = None
+        self.error_class = "other"
+        self.message = ""
+        self.attempts = 0
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+
+    @property
+    def next_attempt(self) -> float:
+        """次に自動で再試行してよい時刻。"""
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** max(0, self.attempts - 1)))
+        return self.last_seen + delay
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url, "source": self.source, "cookie": self.cookie, "path": self.path,
+            "http": self.http, "error_class": self.error_class, "message": self.message,
+            "attempts": self.attempts, "first_seen": self.first_seen, "last_seen": self.last_seen,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "FailureRecord":
+        rec = cls(d["url"], d.get("source", ""), d.get("cookie"))
+        rec.path = d.get("path")
+        rec.http = d.get("http")
+        rec.error_class = d.get("error_class", "other")
+        rec.message = d.get("message", "")
+        rec.attempts = d.get("attempts", 0)
+        rec.first_seen = d.get("first_seen") or time.time()
+        rec.last_seen = d.get("last_seen") or rec.first_seen
+        return rec
+
+
+class FailureStore:
+    """失敗レコードを failures.json に保存する。ワーカースレッドから呼ばれる。"""
+
+    def __init__(self, path: str, cookie_dir: str = "cookies"):
+        self.path = path
+        self.cookie_dir = cookie_dir
+        self.records: Dict[str, FailureRecord] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.records = {}
+            for d in data.get("failures", []):
+                rec = FailureRecord.from_dict(d)
+                self.records[rec.url] = rec
+
+    def save(self):
+        with self._lock:
+            data = {"failures": [r.to_dict() for r in self.records.values()]}
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def record(self, url: str, source: str, cookie: Optional[str], path: Optional[str],
+               http: Optional[int], message: str, kind: Optional[str] = None) -> FailureRecord:
+        """失敗を 1 件記録する（同じ URL なら試行回数を増やす）。"""
+        with self._lock:
+            rec = self.records.get(url)
+            if rec is None:
+                rec = self.records[url] = FailureRecord(url, source, cookie)
+            rec.path = path or rec.path
+            rec.http = http
+            rec.message = message
+            rec.error_class = classify_error(message, http, kind)
+            rec.attempts += 1
+            rec.last_seen = time.time()
+        return rec
+
+    def resolve(self, url: Optional[str]) -> bool:
+        """アイテムが取得できた（またはすでにある）ので記録を消す。"""
+        if not url:
+            return False
+        with self._lock:
+            return self.records.pop(url, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    def due(self, now: Optional[float] = None, force: bool = False) -> List[FailureRecord]:
+        """今再試行してよいレコード。``force`` なら間隔を無視する（手動の再試行）。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [r for r in self.records.values()
+                    if r.attempts < MAX_ATTEMPTS and (force or r.next_attempt <= now)]
+
+    def next_due(self) -> Optional[float]:
+        """自動再試行の対象が次に出てくる時刻（なければ None）。"""
+        with self._lock:
+            times = [r.next_attempt for r in self.records.values() if r.attempts < MAX_ATTEMPTS]
+        return min(times) if times else None
+
+    def write_input_file(self, records: List[FailureRecord], path: str):
+        """gallery-dl の --input-file を書く。
+
+        保存先が分かっているアイテムは、行ごとのオプション（次の URL にだけ効く）で
+        元と同じフォルダ・ファイル名に保存させる。filename は gallery-dl では書式文字列
+        なので、ファイル名の { } は {{ }} にして文字どおりに使わせる。
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        lines = [f"# {len(records)} failed item(s)\n"]
+        for rec in records:
+            lines.append(f"# {rec.error_class}: {' '.join(rec.message.split())[:200]}\n")
+            if rec.path:
+                lines.append(f"-base-directory={json.dumps(os.path.dirname(rec.path), ensure_ascii=False)}\n")
+                lines.append("-directory=[]\n")
+                filename = os.path.basename(rec.path).replace("{", "{{").replace("}", "}}")
+                lines.append(f"-filename={json.dumps(filename, ensure_ascii=False)}\n")
+            if rec.cookie:
+                cookie_path = os.path.abspath(os.path.join(self.cookie_dir, rec.cookie))
+                lines.append(f"-cookies={json.dumps(cookie_path, ensure_ascii=False)}\n")
+            lines.append(rec.url + "\n")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
@@ -1,17 +1,48 @@
 """
 Gallery-DL GUI  v1.0.0
 gallery-dl のモダンな GUI ラッパー。
+
+  gallery_dl_gui.py --headless <urls.txt> [...]   ウィンドウなしで実行（gallery_dl_headless.py）
 """
+import sys
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--headless"]:
+    # tkinter を読み込む前に分岐する（ディスプレイや Tk のない環境でも動くように）
+    from gallery_dl_headless import main as _headless_main
+    sys.exit(_headless_main(sys.argv[2:]))
+
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-import subprocess
+from tkinter import ttk
 import threading
+import queue
+import time
 import os
-import sys
-import re
-import json
-import glob
-from typing import Optional, List, Any
+import bisect
+from typing import Optional, List, Dict, Any, Callable, TYPE_CHECKING
+
+from gallery_dl_logview import LogBuffer, LogSpill, VirtualLogView
+from gallery_dl_parser import LineEvent
+from gallery_dl_failures import FailureStore
+from gallery_dl_disk import DiskMonitor, DISK_SLOW, DISK_LOW, DISK_FULL
+from gallery_dl_metrics import Metrics, Counter, Gauge, DEPTH_BUCKETS
+from gallery_dl_cookies import (
+    ConversionResult, CookieJarCache, convert_batch, finalize_pending, sanitize_name,
+    summary as cookie_summary,
+)
+from gallery_dl_throttle import MAX_PER_HOST
+from gallery_dl_engine import (
+    Job, JobQueue, app_dir, build_gallery_dl_args, split_urls,
+    format_size, format_speed, format_eta, MAX_WORKERS,
+    JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_STOPPED,
+)
+# ダイアログ（tkinter.messagebox / filedialog）、ローカル API（http.server を読み込む）、
+# アーカイブ・重複排除・履歴（sqlite3）、プロファイル（hashlib）、フォルダの監視は
+# 使うときに読み込む。ウィンドウが出るまでの時間に入れないため
+if TYPE_CHECKING:
+    from gallery_dl_api import ApiServer
+    from gallery_dl_history import HistoryRow
+    from gallery_dl_profiles import ProfileStore
+    from gallery_dl_watch import DirWatcher
 
 APP_VERSION = "v1.0.0"
 
@@ -37,6 +68,23 @@ FONT_SUB   = ("Segoe UI", 9)
 FONT_MONO  = ("Consolas", 9)
 FONT_SMALL = ("Segoe UI", 8)
 
+# ──────────────────────────────────────────────
+# ログパイプライン
+# ──────────────────────────────────────────────
+LOG_QUEUE_MAX      = 20000   # 読み取りスレッド → Tk 間のバッファ上限（行）
+LOG_FRAME_MS       = 50      # Tk 側のドレイン間隔
+LOG_TICK_BUDGET_MS = 12.0    # 1 フレームで Tk 挿入に使ってよい時間
+LOG_TICK_CHUNK     = 256     # 予算チェック間に取り出す行数
+LOG_RING_LINES     = 50000   # ログタブがメモリに保持する行数（全履歴は logs/ に残る）
+FAILED_RING_LINES  = 20000   # 失敗タブがメモリに保持する行数
+PROGRESS_FRAME_MS  = 250     # 進捗バーと統計行の描画間隔（イベント数に関係なく一定）
+HISTORY_SINCE = {"Any time": None, "Last 24 hours": 86400, "Last 7 days": 7 * 86400,
+                 "Last 30 days": 30 * 86400}
+HISTORY_ALL_SITES = "All sites"
+JSON_SETTLE_MS     = 500     # json_input/ に続けて置かれたファイルをまとめて変換するまでの待ち
+METRICS_FRAME_MS   = 1000    # メトリクスタブを開いている間の更新間隔
+METRICS_TAB        = 5
+
 
 def resource_path(relative_path: str) -> str:
     """開発環境と PyInstaller ビルドの両方でパスを解決する。"""
@@ -45,11 +93,61 @@ def resource_path(relative_path: str) -> str:
     return os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_path)
 
 
-def app_dir() -> str:
-    """アプリ（または .exe）が存在するディレクトリ。"""
-    if getattr(sys, "frozen", False):
-        return os.path.dirname(sys.executable)
-    return os.path.dirname(os.path.abspath(__file__))
+def dedup_labels() -> Dict[str, str]:
+    """重複排除のモード → 表示名。"""
+    from gallery_dl_dedup import DEDUP_OFF, DEDUP_HARDLINK, DEDUP_SKIP
+    return {DEDUP_OFF: "Keep all", DEDUP_HARDLINK: "Hardlink to first copy",
+            DEDUP_SKIP: "Delete new copy"}
+
+
+def history_kinds() -> Dict[str, Optional[str]]:
+    """履歴タブの種類の表示名 → 検索に渡す種類。"""
+    from gallery_dl_history import KIND_DONE, KIND_ERROR
+    return {"All": None, "Downloaded": KIND_DONE, "Failed": KIND_ERROR}
+
+
+class LogSink:
+    """読み取りスレッドから Tk スレッドへログ行をまとめて渡す有界バッファ。
+
+    生産側は ``put`` でキューに積むだけで Tk には触れない。キューが満杯の場合は
+    ブロックし、パイプ経由でサブプロセス側へ背圧がかかる。消費側（Tk スレッド）は
+    ``drain`` で一定数ずつ取り出し、1 フレームにまとめて描画する。
+    """
+
+    def __init__(self, maxsize: int = LOG_QUEUE_MAX):
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize)
+
+    def put(self, line: Optional[str], tag: str = "info", failed_item: Optional[str] = None,
+            block: bool = True, stop: Optional[threading.Event] = None) -> bool:
+        """1 行を積む。``block`` の場合は空きが出るまで待つ（``stop`` で中断）。"""
+        item = (line, tag, failed_item)
+        if not block:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                return False
+        while True:
+            try:
+                self._queue.put(item, timeout=0.25)
+                return True
+            except queue.Full:
+                if stop is not None and stop.is_set():
+                    return False
+
+    def drain(self, limit: int) -> List[tuple]:
+        """最大 ``limit`` 行をブロックせずに取り出す。"""
+        items = []
+        get = self._queue.get_nowait
+        try:
+            for _ in range(limit):
+                items.append(get())
+        except queue.Empty:
+            pass
+        return items
+
+    def pending(self) -> int:
+        return self._queue.qsize()
 
 
 class GalleryDLApp:
@@ -72,21 +170,64 @@ class GalleryDLApp:
         os.chdir(app_dir())
 
         # ── 状態 ──
-        self.process: Optional[subprocess.Popen] = None
-        self.fail_count: int = 0
-        self.download_count: int = 0
-        self.retry_count: int = 0
-        self._stop_flag: bool = False
         self.cookie_files: List[str] = []
-        self._worker_thread: Optional[threading.Thread] = None
-        self._last_activity_time: float = 0.0
-        self.TIMEOUT_SECONDS: int = 120  # 応答なし判定秒数
         self.MAX_RETRIES: int = 10        # 最大リトライ回数
-        self.current_download_path: Optional[str] = None # 現在ダウンロード中のパス
+        self._log_sink = LogSink()
+        self.last_tick_ms: float = 0.0         # 直近フレームの Tk 描画時間
+        self._queue_dirty: bool = True         # キュー表示の更新が必要か
+        self._queue_revs: dict = {}            # ジョブ ID → 表示済みの rev
+        self._queue_refreshed: float = 0.0
+        self._bar_pulsing: bool = False        # 進捗バーが不定モードで動いているか
 
         self.cookie_dir    = "cookies"
         self.json_input_dir = "json_input"
         self.download_dir  = "DownloadData"
+        self.archive_dir   = "archives"
+        self.record_dir    = "recordings"
+
+        # ── ファイルやデータベースを使う部品（ウィンドウを表示してから _open_stores で開く） ──
+        self.failures: Optional[FailureStore] = None
+        self.cookie_jars: Optional[CookieJarCache] = None
+        self.profiles: Optional["ProfileStore"] = None
+        self._converting = False               # クッキー変換の実行中
+        self._json_new: List[str] = []         # 監視で見つかった、まだ変換していない JSON
+        self._json_scheduled = False
+
+        # ── メトリクス（1 行ごとの時間はメトリクスタブを開いている間だけ記録する） ──
+        self.metrics = Metrics()
+        self.metrics.gauge("gallery_dl_tk_queue_depth", "Log lines waiting for the Tk thread",
+                           self._log_sink.pending)
+        self._tk_lines = self.metrics.counter("gallery_dl_tk_lines_total",
+                                              "Log lines drawn by the Tk thread")
+        self._tk_frame = self.metrics.histogram("gallery_dl_tk_frame_seconds",
+                                                "Tk time per log frame (ring buffer and redraw)")
+        self._tk_backlog = self.metrics.histogram("gallery_dl_tk_backlog_lines",
+                                                  "Log lines waiting at the start of each frame",
+                                                  DEPTH_BUCKETS)
+        self._metrics_prev: Dict[str, float] = {}   # 前回の更新時の値（毎秒の増分を出す）
+        self._metrics_prev_at = 0.0
+        self._metrics_refreshing = False
+
+        # ── ジョブキュー（app_dir()/queue.json に保存）。保存済みのジョブは _open_stores で読む ──
+        self.queue = JobQueue(
+            os.path.join(app_dir(), "queue.json"),
+            build_args=self._build_args,
+            on_event=self._on_job_event,
+            on_message=self._on_job_message,
+            on_state=self._on_job_state,
+            on_idle=lambda: self.root.after(0, self._finish_download),
+            metrics=self.metrics,
+        )
+
+        # ── ローカル制御 API（app_dir()/api.json に有効/ポート/トークン） ──
+        self.api_settings_path = os.path.join(app_dir(), "api.json")
+        self.api_settings: Optional[Dict[str, Any]] = None   # 最初に使うときに読む
+        self.api: Optional["ApiServer"] = None
+
+        # ── ログモデル（表示は直近だけ、全履歴は app_dir()/logs へ） ──
+        log_dir = os.path.join(app_dir(), "logs")
+        self.log_buffer = LogBuffer(LOG_RING_LINES, LogSpill(os.path.join(log_dir, "session.log")))
+        self.failed_buffer = LogBuffer(FAILED_RING_LINES, LogSpill(os.path.join(log_dir, "failed.log")))
 
         # ── Tkinter 変数 ──
         self.url_var        = tk.StringVar()
@@ -94,6 +235,8 @@ class GalleryDLApp:
         self.cookie_var     = tk.StringVar()
         self.status_var     = tk.StringVar(value="Ready")
         self.stats_var      = tk.StringVar(value="")
+        self.progress_var   = tk.StringVar(value="")
+        self.failures_var   = tk.StringVar(value="")
 
         # ── ウィジェット参照 ──
         self.url_entry:     Any = None
@@ -104,14 +247,108 @@ class GalleryDLApp:
         self.failed_text:   Any = None
         self.notebook:      Any = None
         self.progress_bar:  Any = None
+        self.queue_tree:    Any = None
+        # キューの設定は _open_stores で読み込んだ値に合わせる
+        self.workers_var    = tk.IntVar(value=self.queue.workers)
+        self.prewarm_var    = tk.BooleanVar(value=False)
+        self.per_host_var   = tk.IntVar(value=self.queue.hosts.per_host)
+        self.min_free_var   = tk.DoubleVar()
+        self.archive_var    = tk.BooleanVar(value=True)
+        self.dedup_var      = tk.StringVar()
+        self.dedup_stats_var = tk.StringVar()
+        self._reindexing    = False
+        self.history_query_var = tk.StringVar()
+        self.history_site_var  = tk.StringVar(value=HISTORY_ALL_SITES)
+        self.history_kind_var  = tk.StringVar(value="All")
+        self.history_since_var = tk.StringVar(value="Any time")
+        self.history_status_var = tk.StringVar()
+        self._history_rows: List["HistoryRow"] = []   # 表示中のページ
+        self._history_seq = 0                       # 古い検索結果を捨てるための通し番号
+        self.archive_tree:  Any = None
+        self.history_tree:  Any = None
+        self.history_site_combo: Any = None
+        self.metrics_tree:  Any = None
+        self.metrics_status_var = tk.StringVar()
+        self.record_var     = tk.BooleanVar(value=False)
+        self.api_var        = tk.BooleanVar(value=False)
+        self.cookie_watcher: Optional["DirWatcher"] = None
+        self.json_watcher:  Optional["DirWatcher"] = None
+        self._tab_builders: Dict[int, tuple] = {}    # タブ番号 → (枠, 中身を作る関数)
 
         self._apply_theme()
-        self._create_widgets()
-
-        for d in (self.download_dir, self.cookie_dir, self.json_input_dir):
-            os.makedirs(d, exist_ok=True)
+        self._create_widgets()       # メイン画面とログタブだけ（ほかのタブは _ensure_tab）
+
+        # 残りはウィンドウを表示してから 1 つずつ、イベント処理の合間に進める。
+        # _open_stores は最初の空き時間にほかのイベントより先に実行されるので、
+        # キューを操作できるようになる前に保存済みのジョブが読み込まれる
+        self._startup_steps: List[Callable[[], None]] = [
+            self._open_stores,
+            self._start_file_scan,
+            self._start_api_if_enabled,
+            *(lambda i=i: self._ensure_tab(i) for i in sorted(self._tab_builders)),
+        ]
+        self.root.after_idle(self._run_startup)
+        self.root.after(LOG_FRAME_MS, self._drain_log)
+        self.root.after(PROGRESS_FRAME_MS, self._render_progress)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
-        self._load_cookies()
+    # 起動
+    # ──────────────────────────────────────────────
+    def _run_startup(self):
+        """起動時の残りの処理を 1 つ進める。
+
+        after_idle で 1 ステップずつ呼ぶので、最初のフレームが先に描かれ、その後も
+        クリックや再描画のイベントが各ステップの間に処理される。
+        """
+        if self._startup_steps:
+            self._startup_steps.pop(0)()
+        if self._startup_steps:
+            self.root.after_idle(self._run_startup)
+
+    def _open_stores(self):
+        """失敗アイテム・クッキージャー・プロファイル・アーカイブ・重複排除・履歴・空き容量の
+        監視を開き、保存済みのキューを読み込んで設定を画面に反映する。"""
+        from gallery_dl_archive import ArchiveIndex
+        from gallery_dl_dedup import DedupIndex
+        from gallery_dl_history import HistoryStore
+        from gallery_dl_profiles import ProfileStore, PROFILES_FILE
+
+        # 失敗アイテムのストア（app_dir()/failures.json）
+        self.failures = FailureStore(os.path.join(app_dir(), "failures.json"), self.cookie_dir)
+        self.failures.load()
+        # ジョブにはクッキーファイル全体ではなく、URL のサイトのぶんだけを渡す（cookies/.jars/）
+        self.cookie_jars = CookieJarCache(self.cookie_dir)
+        # サイト別プロファイル（app_dir()/profiles.json、合成した設定は .configs/ に置く）
+        self.profiles = ProfileStore(os.path.join(app_dir(), PROFILES_FILE))
+        q = self.queue
+        q.attach(
+            archive=ArchiveIndex(self.archive_dir),
+            failures=self.failures,
+            dedup=DedupIndex(os.path.join(app_dir(), "dedup.sqlite3"), self.download_dir),
+            history=HistoryStore(os.path.join(app_dir(), "history.sqlite3")),
+            disk=DiskMonitor(self.download_dir),
+            profiles=self.profiles,
+        )
+        q.load()
+
+        self.workers_var.set(q.workers)
+        self.prewarm_var.set(q.host_pool is not None)
+        self.per_host_var.set(q.hosts.per_host)
+        self.min_free_var.set(round(q.disk.reserve / (1 << 30), 1))
+        self.archive_var.set(q.use_archive)
+        self.dedup_var.set(dedup_labels()[q.dedup.mode])
+        self.record_var.set(q.record_dir is not None)
+        self._queue_dirty = True
+
+    def _start_file_scan(self):
+        """フォルダの作成、クッキー一覧の読み込み、監視の開始（ワーカースレッドで行う）。"""
+        def work():
+            for d in (self.download_dir, self.cookie_dir, self.json_input_dir, self.archive_dir):
+                os.makedirs(d, exist_ok=True)
+            self._start_watchers()
+            # 監視している一覧をそのまま使う（以後の変化は監視から届くので取りこぼさない）
+            self.root.after(0, lambda: self._set_cookie_list(sorted(self.cookie_watcher.files)))
+        threading.Thread(target=work, name="startup", daemon=True).start()
 
     # テーマ
     # ──────────────────────────────────────────────
@@ -186,6 +423,16 @@ class GalleryDLApp:
                   background=[("selected", BG_COLOR)],
                   foreground=[("selected", FG_COLOR)])
 
+        # Treeview
+        style.configure("Treeview", background=BG_COLOR, fieldbackground=BG_COLOR,
+                         foreground=FG_COLOR, borderwidth=0, font=FONT_SUB, rowheight=22)
+        style.map("Treeview",
+                  background=[("selected", ACCENT_COLOR)],
+                  foreground=[("selected", "#ffffff")])
+        style.configure("Treeview.Heading", background=PANEL_BG, foreground=DIM_COLOR,
+                         font=FONT_SUB, borderwidth=0, relief="flat")
+        style.map("Treeview.Heading", background=[("active", BORDER_COLOR)])
+
         # Progressbar
         style.configure("TProgressbar", troughcolor=PANEL_BG, background=ACCENT_COLOR,
                          borderwidth=0, thickness=4)
@@ -239,6 +486,8 @@ class GalleryDLApp:
                    command=self._paste_url).pack(side=tk.LEFT, padx=(6, 0))
         ttk.Button(url_input_row, text="Clear", style="Small.TButton",
                    command=lambda: self.url_var.set("")).pack(side=tk.LEFT, padx=(4, 0))
+        ttk.Button(url_input_row, text="Import…", style="Small.TButton",
+                   command=self._import_urls).pack(side=tk.LEFT, padx=(4, 0))
 
         # クッキー行
         ck_row = ttk.Frame(settings)
@@ -274,13 +523,15 @@ class GalleryDLApp:
         self.stop_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(8, 0), ipady=6)
 
         # ── プログレスバー ──
-        self.progress_bar = ttk.Progressbar(outer, mode="indeterminate", style="TProgressbar")
+        self.progress_bar = ttk.Progressbar(outer, mode="determinate", maximum=1000,
+                                            style="TProgressbar")
         self.progress_bar.pack(fill=tk.X, pady=(0, 8))
 
         # ── 統計行 ──
         stats_row = ttk.Frame(outer)
         stats_row.pack(fill=tk.X, pady=(0, 6))
         ttk.Label(stats_row, textvariable=self.stats_var, style="Stat.TLabel").pack(side=tk.LEFT)
+        ttk.Label(stats_row, textvariable=self.progress_var, style="Stat.TLabel").pack(side=tk.RIGHT)
 
         # ── フォルダクイックアクセスボタン ──
         fld = ttk.LabelFrame(outer, text=" Quick Open ", padding=6)
@@ -306,34 +557,248 @@ class GalleryDLApp:
         ttk.Button(log_ctrl, text="Clear Log", style="Small.TButton",
                    command=self._clear_log).pack(side=tk.RIGHT, padx=4)
 
-        self.log_text = scrolledtext.ScrolledText(
-            log_tab, bg=BG_COLOR, fg=FG_COLOR,
+        self.log_text = VirtualLogView(
+            log_tab, self.log_buffer, bg=BG_COLOR, fg=FG_COLOR,
             insertbackground=FG_COLOR, font=FONT_MONO,
-            state="disabled", relief=tk.FLAT, bd=0,
+            relief=tk.FLAT, bd=0,
             selectbackground=ACCENT_COLOR, selectforeground="#ffffff"
         )
         self.log_text.pack(fill=tk.BOTH, expand=True)
         self._configure_log_tags()
 
-        # タブ 2 – 失敗アイテム
-        failed_tab = ttk.Frame(self.notebook)
-        self.notebook.add(failed_tab, text="  Failed Items  ")
-
+        # ほかのタブは枠だけ作り、中身は最初に開いたとき（または起動後の空き時間）に作る
+        for index, (text, build) in enumerate([
+                ("  Failed Items  ", self._build_failed_tab),
+                ("  Queue  ", self._build_queue_tab),
+                ("  Archive  ", self._build_archive_tab),
+                ("  History  ", self._build_history_tab),
+                ("  Metrics  ", self._build_metrics_tab)], start=1):
+            tab = ttk.Frame(self.notebook)
+            self.notebook.add(tab, text=text)
+            self._tab_builders[index] = (tab, build)
+
+    def _ensure_tab(self, index: int):
+        """まだ中身を作っていないタブを作る。"""
+        entry = self._tab_builders.pop(index, None)
+        if entry is not None:
+            tab, build = entry
+            build(tab)
+
+    def _build_failed_tab(self, failed_tab: ttk.Frame):
+        """失敗アイテムのタブ。"""
         failed_ctrl = ttk.Frame(failed_tab)
         failed_ctrl.pack(fill=tk.X, pady=(6, 2))
+        ttk.Button(failed_ctrl, text="Retry Failed", style="Small.TButton",
+                   command=self._retry_failed).pack(side=tk.LEFT, padx=(4, 2))
+        ttk.Button(failed_ctrl, text="Forget", style="Small.TButton",
+                   command=self._forget_failed).pack(side=tk.LEFT, padx=2)
+        ttk.Label(failed_ctrl, textvariable=self.failures_var,
+                  style="Sub.TLabel").pack(side=tk.LEFT, padx=8)
         ttk.Button(failed_ctrl, text="Copy All", style="Small.TButton",
                    command=self._copy_failed).pack(side=tk.RIGHT, padx=4)
         ttk.Button(failed_ctrl, text="Clear", style="Small.TButton",
                    command=self._clear_failed).pack(side=tk.RIGHT, padx=2)
 
-        self.failed_text = scrolledtext.ScrolledText(
-            failed_tab, bg=BG_COLOR, fg=ERROR_COLOR,
+        self.failed_text = VirtualLogView(
+            failed_tab, self.failed_buffer, bg=BG_COLOR, fg=ERROR_COLOR,
             insertbackground=FG_COLOR, font=FONT_MONO,
-            state="disabled", relief=tk.FLAT, bd=0,
+            relief=tk.FLAT, bd=0,
             selectbackground=ACCENT_COLOR, selectforeground="#ffffff"
         )
         self.failed_text.pack(fill=tk.BOTH, expand=True)
 
+    def _build_queue_tab(self, queue_tab: ttk.Frame):
+        """キュータブ。"""
+        queue_ctrl = ttk.Frame(queue_tab)
+        queue_ctrl.pack(fill=tk.X, pady=(6, 2))
+        ttk.Label(queue_ctrl, text="Workers").pack(side=tk.LEFT, padx=(4, 6))
+        workers_spin = tk.Spinbox(
+            queue_ctrl, from_=1, to=MAX_WORKERS, width=3, textvariable=self.workers_var,
+            command=self._on_workers_change,
+            bg=ENTRY_BG, fg=FG_COLOR, buttonbackground=ENTRY_BG, insertbackground=FG_COLOR,
+            font=FONT_MAIN, relief=tk.FLAT, highlightthickness=1,
+            highlightbackground=BORDER_COLOR, highlightcolor=ACCENT_COLOR
+        )
+        workers_spin.pack(side=tk.LEFT)
+        workers_spin.bind("<Return>", lambda _: self._on_workers_change())
+        workers_spin.bind("<FocusOut>", lambda _: self._on_workers_change())
+        ttk.Label(queue_ctrl, text="Per site").pack(side=tk.LEFT, padx=(12, 6))
+        per_host_spin = tk.Spinbox(
+            queue_ctrl, from_=1, to=MAX_PER_HOST, width=3, textvariable=self.per_host_var,
+            command=self._on_per_host_change,
+            bg=ENTRY_BG, fg=FG_COLOR, buttonbackground=ENTRY_BG, insertbackground=FG_COLOR,
+            font=FONT_MAIN, relief=tk.FLAT, highlightthickness=1,
+            highlightbackground=BORDER_COLOR, highlightcolor=ACCENT_COLOR
+        )
+        per_host_spin.pack(side=tk.LEFT)
+        per_host_spin.bind("<Return>", lambda _: self._on_per_host_change())
+        per_host_spin.bind("<FocusOut>", lambda _: self._on_per_host_change())
+        # 保存先の空きがこれを下回ったら新しいジョブを始めない
+        ttk.Label(queue_ctrl, text="Min free (GB)").pack(side=tk.LEFT, padx=(12, 6))
+        min_free_spin = tk.Spinbox(
+            queue_ctrl, from_=0, to=1000, increment=0.5, width=5, textvariable=self.min_free_var,
+            command=self._on_min_free_change,
+            bg=ENTRY_BG, fg=FG_COLOR, buttonbackground=ENTRY_BG, insertbackground=FG_COLOR,
+            font=FONT_MAIN, relief=tk.FLAT, highlightthickness=1,
+            highlightbackground=BORDER_COLOR, highlightcolor=ACCENT_COLOR
+        )
+        min_free_spin.pack(side=tk.LEFT)
+        min_free_spin.bind("<Return>", lambda _: self._on_min_free_change())
+        min_free_spin.bind("<FocusOut>", lambda _: self._on_min_free_change())
+        ttk.Checkbutton(queue_ctrl, text="Pre-warmed workers", variable=self.prewarm_var,
+                        command=self._toggle_prewarm).pack(side=tk.LEFT, padx=(12, 0))
+        ttk.Checkbutton(queue_ctrl, text="Local API", variable=self.api_var,
+                        command=self._toggle_api).pack(side=tk.LEFT, padx=(12, 0))
+        ttk.Button(queue_ctrl, text="Profiles…", style="Small.TButton",
+                   command=self._open_profiles).pack(side=tk.LEFT, padx=(12, 0))
+        for text, cmd in [("Clear Finished", self._clear_finished_jobs),
+                          ("Remove", self._remove_selected_jobs),
+                          ("Requeue", self._requeue_selected_jobs),
+                          ("Stop", self._stop_selected_jobs)]:
+            ttk.Button(queue_ctrl, text=text, style="Small.TButton",
+                       command=cmd).pack(side=tk.RIGHT, padx=2)
+
+        queue_body = ttk.Frame(queue_tab)
+        queue_body.pack(fill=tk.BOTH, expand=True)
+        columns = [("id", "#", 40), ("state", "State", 110), ("downloaded", "Files", 60),
+                   ("failed", "Failed", 60), ("retries", "Retry", 50),
+                   ("size", "Size", 80), ("speed", "Speed", 80),
+                   ("elapsed", "Time", 60), ("url", "URL", 400)]
+        self.queue_tree = ttk.Treeview(queue_body, columns=[c[0] for c in columns],
+                                       show="headings", selectmode="extended")
+        for key, heading, width in columns:
+            self.queue_tree.heading(key, text=heading)
+            self.queue_tree.column(key, width=width, stretch=(key == "url"),
+                                   anchor=tk.W if key == "url" else tk.CENTER)
+        self.queue_tree.tag_configure(JOB_RUNNING, foreground=ACCENT_COLOR)
+        self.queue_tree.tag_configure(JOB_DONE,    foreground=SUCCESS_COLOR)
+        self.queue_tree.tag_configure(JOB_FAILED,  foreground=ERROR_COLOR)
+        self.queue_tree.tag_configure(JOB_STOPPED, foreground=WARNING_COLOR)
+        self.queue_tree.tag_configure(JOB_QUEUED,  foreground=DIM_COLOR)
+        queue_bar = ttk.Scrollbar(queue_body, orient="vertical", command=self.queue_tree.yview)
+        self.queue_tree.configure(yscrollcommand=queue_bar.set)
+        queue_bar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.queue_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._queue_dirty = True
+
+    def _build_archive_tab(self, archive_tab: ttk.Frame):
+        """ダウンロードアーカイブと重複ファイルのタブ。"""
+        archive_ctrl = ttk.Frame(archive_tab)
+        archive_ctrl.pack(fill=tk.X, pady=(6, 2))
+        ttk.Checkbutton(archive_ctrl, text="Skip items already in the download archive",
+                        variable=self.archive_var,
+                        command=self._toggle_archive).pack(side=tk.LEFT, padx=(4, 0))
+        for text, cmd in [("Open Folder", lambda: self._open_folder(self.archive_dir)),
+                          ("Delete", self._delete_selected_archives),
+                          ("Refresh", self._refresh_archive_view)]:
+            ttk.Button(archive_ctrl, text=text, style="Small.TButton",
+                       command=cmd).pack(side=tk.RIGHT, padx=2)
+
+        # 内容ハッシュによる重複ファイルの扱い（DownloadData 全体）
+        dedup_ctrl = ttk.Frame(archive_tab)
+        dedup_ctrl.pack(fill=tk.X, pady=(0, 4))
+        ttk.Label(dedup_ctrl, text="Duplicate files:").pack(side=tk.LEFT, padx=(4, 6))
+        dedup_combo = ttk.Combobox(dedup_ctrl, textvariable=self.dedup_var, state="readonly",
+                                   values=list(dedup_labels().values()), width=22, font=FONT_MAIN)
+        dedup_combo.pack(side=tk.LEFT)
+        dedup_combo.bind("<<ComboboxSelected>>", lambda _: self._set_dedup())
+        ttk.Label(dedup_ctrl, textvariable=self.dedup_stats_var,
+                  style="Sub.TLabel").pack(side=tk.LEFT, padx=8)
+        ttk.Button(dedup_ctrl, text="Re-index", style="Small.TButton",
+                   command=self._reindex_downloads).pack(side=tk.RIGHT, padx=2)
+
+        archive_body = ttk.Frame(archive_tab)
+        archive_body.pack(fill=tk.BOTH, expand=True)
+        columns = [("profile", "Site / Cookie", 260), ("entries", "Items", 80),
+                   ("size", "Size", 80), ("lookups", "Checked", 80),
+                   ("hits", "Skipped", 80), ("rate", "Hit Rate", 70)]
+        self.archive_tree = ttk.Treeview(archive_body, columns=[c[0] for c in columns],
+                                         show="headings", selectmode="extended")
+        for key, heading, width in columns:
+            self.archive_tree.heading(key, text=heading)
+            self.archive_tree.column(key, width=width, stretch=(key == "profile"),
+                                     anchor=tk.W if key == "profile" else tk.CENTER)
+        archive_bar = ttk.Scrollbar(archive_body, orient="vertical", command=self.archive_tree.yview)
+        self.archive_tree.configure(yscrollcommand=archive_bar.set)
+        archive_bar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.archive_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    def _build_history_tab(self, history_tab: ttk.Frame):
+        """ダウンロード履歴のタブ。"""
+        history_ctrl = ttk.Frame(history_tab)
+        history_ctrl.pack(fill=tk.X, pady=(6, 2))
+        query = tk.Entry(history_ctrl, textvariable=self.history_query_var, bg=ENTRY_BG,
+                         fg=FG_COLOR, insertbackground=FG_COLOR, relief=tk.FLAT, font=FONT_MAIN)
+        query.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(4, 6), ipady=3)
+        query.bind("<Return>", lambda _: self._search_history())
+        self.history_site_combo = ttk.Combobox(history_ctrl, textvariable=self.history_site_var,
+                                               state="readonly", width=16, font=FONT_MAIN,
+                                               values=[HISTORY_ALL_SITES])
+        from gallery_dl_history import KIND_ERROR
+        for var, values, width in [(self.history_kind_var, list(history_kinds()), 11),
+                                   (self.history_since_var, list(HISTORY_SINCE), 13)]:
+            combo = ttk.Combobox(history_ctrl, textvariable=var, state="readonly",
+                                 values=values, width=width, font=FONT_MAIN)
+            combo.pack(side=tk.LEFT, padx=(0, 4))
+            combo.bind("<<ComboboxSelected>>", lambda _: self._search_history())
+        self.history_site_combo.pack(side=tk.LEFT, padx=(0, 4))
+        self.history_site_combo.bind("<<ComboboxSelected>>", lambda _: self._search_history())
+        for text, cmd in [("Older ▶", lambda: self._search_history("older")),
+                          ("◀ Newer", lambda: self._search_history("newer")),
+                          ("Search", self._search_history)]:
+            ttk.Button(history_ctrl, text=text, style="Small.TButton",
+                       command=cmd).pack(side=tk.RIGHT, padx=2)
+        ttk.Label(history_tab, textvariable=self.history_status_var,
+                  style="Sub.TLabel").pack(fill=tk.X, padx=4)
+
+        history_body = ttk.Frame(history_tab)
+        history_body.pack(fill=tk.BOTH, expand=True)
+        columns = [("time", "Time", 120), ("kind", "", 30), ("site", "Site", 110),
+                   ("size", "Size", 70), ("duration", "Time Taken", 70), ("item", "File / Error", 420)]
+        self.history_tree = ttk.Treeview(history_body, columns=[c[0] for c in columns],
+                                         show="headings", selectmode="browse")
+        for key, heading, width in columns:
+            self.history_tree.heading(key, text=heading)
+            self.history_tree.column(key, width=width, stretch=(key == "item"),
+                                     anchor=tk.W if key in ("item", "site") else tk.CENTER)
+        self.history_tree.tag_configure(KIND_ERROR, foreground=ERROR_COLOR)
+        self.history_tree.bind("<Double-1>", lambda _: self._open_history_item())
+        history_bar = ttk.Scrollbar(history_body, orient="vertical", command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=history_bar.set)
+        history_bar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    def _build_metrics_tab(self, metrics_tab: ttk.Frame):
+        """カウンタとレイテンシのヒストグラムのタブ。"""
+        metrics_ctrl = ttk.Frame(metrics_tab)
+        metrics_ctrl.pack(fill=tk.X, pady=(6, 2))
+        ttk.Checkbutton(metrics_ctrl, text="Record sessions", variable=self.record_var,
+                        command=self._toggle_record).pack(side=tk.LEFT, padx=(4, 0))
+        ttk.Label(metrics_ctrl, textvariable=self.metrics_status_var,
+                  style="Sub.TLabel").pack(side=tk.LEFT, padx=8)
+        for text, cmd in [("Recordings", lambda: self._open_folder(self.record_dir)),
+                          ("Reset", self._reset_metrics),
+                          ("Export Prometheus…", lambda: self._export_metrics("prom")),
+                          ("Export JSON…", lambda: self._export_metrics("json"))]:
+            ttk.Button(metrics_ctrl, text=text, style="Small.TButton",
+                       command=cmd).pack(side=tk.RIGHT, padx=2)
+
+        metrics_body = ttk.Frame(metrics_tab)
+        metrics_body.pack(fill=tk.BOTH, expand=True)
+        columns = [("metric", "Metric", 260), ("value", "Count / Value", 100),
+                   ("rate", "Per sec", 80), ("mean", "Mean", 80), ("p50", "p50", 80),
+                   ("p99", "p99", 80), ("max", "Max", 80)]
+        self.metrics_tree = ttk.Treeview(metrics_body, columns=[c[0] for c in columns],
+                                         show="headings", selectmode="browse")
+        for key, heading, width in columns:
+            self.metrics_tree.heading(key, text=heading)
+            self.metrics_tree.column(key, width=width, stretch=(key == "metric"),
+                                     anchor=tk.W if key == "metric" else tk.CENTER)
+        metrics_bar = ttk.Scrollbar(metrics_body, orient="vertical", command=self.metrics_tree.yview)
+        self.metrics_tree.configure(yscrollcommand=metrics_bar.set)
+        metrics_bar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.metrics_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
     def _configure_log_tags(self):
         self.log_text.tag_configure("info",    foreground=FG_COLOR)
         self.log_text.tag_configure("success", foreground=SUCCESS_COLOR)
@@ -348,14 +813,9 @@ class GalleryDLApp:
         self.cookie_files = []
         if os.path.isdir(self.cookie_dir):
             try:
-                files = sorted(
-                    f for f in os.listdir(self.cookie_dir)
-                    if os.path.isfile(os.path.join(self.cookie_dir, f)) and f.endswith(".txt")
-                )
-                self.cookie_files = files
-                self.cookie_combo["values"] = files
-                if files:
-                    self.cookie_combo.current(0)
+                with os.scandir(self.cookie_dir) as it:
+                    files = sorted(e.name for e in it if e.name.endswith(".txt") and e.is_file())
+                self._set_cookie_list(files)
                 if feedback:
                     self._log(f"Cookie list refreshed — {len(files)} file(s) found.", "success")
             except Exception as e:
@@ -364,80 +824,173 @@ class GalleryDLApp:
             if feedback:
                 self._log(f"Cookie directory not found: {self.cookie_dir}", "warning")
 
-    def _convert_cookies(self):
-        """JSON クッキーファイルを Netscape 形式にインラインで変換する（外部スクリプト不要）。"""
-        json_files = glob.glob(os.path.join(self.json_input_dir, "*.json"))
+    def _set_cookie_list(self, files: List[str]):
+        self.cookie_files = files
+        self.cookie_combo["values"] = files
+        if self.cookie_var.get() in files:
+            pass                    # 選択中のファイルはそのまま
+        elif files:
+            self.cookie_combo.current(0)
+
+    def _start_watchers(self):
+        """cookies/ と json_input/ の監視を始める（コールバックは Tk スレッドに回す）。"""
+        from gallery_dl_watch import DirWatcher
+        self.cookie_watcher = DirWatcher(
+            self.cookie_dir, ".txt",
+            on_added=lambda name: self.root.after(0, self._cookie_added, name),
+            on_removed=lambda name: self.root.after(0, self._cookie_removed, name))
+        self.json_watcher = DirWatcher(
+            self.json_input_dir, ".json",
+            on_added=lambda name: self.root.after(0, self._json_added, name))
+        self.cookie_watcher.start()
+        self.json_watcher.start()
+
+    def _cookie_added(self, name: str):
+        """クッキーファイルが増えた: 一覧に差し込む（選択はそのまま）。"""
+        if name in self.cookie_files:
+            return
+        bisect.insort(self.cookie_files, name)
+        self.cookie_combo["values"] = self.cookie_files
+        if not self.cookie_var.get():
+            self.cookie_var.set(name)
+        self._log(f"Cookie file added: {name}", "dim")
+
+    def _cookie_removed(self, name: str):
+        if name not in self.cookie_files:
+            return
+        self.cookie_files.remove(name)
+        self.cookie_combo["values"] = self.cookie_files
+        if self.cookie_var.get() == name:
+            self.cookie_var.set(self.cookie_files[0] if self.cookie_files else "")
+        self._log(f"Cookie file removed: {name}", "dim")
+
+    def _json_added(self, name: str):
+        """json_input/ に JSON が置かれた: 少し待ってから、まとめて変換する。"""
+        self._json_new.append(os.path.join(self.json_input_dir, name))
+        if not self._json_scheduled:
+            self._json_scheduled = True
+            self.root.after(JSON_SETTLE_MS, self._auto_convert)
+
+    def _auto_convert(self):
+        self._json_scheduled = False
+        if self._converting:
+            return                          # 終わったら _finish_cookie_conversion から呼ばれる
+        paths = [p for p in dict.fromkeys(self._json_new) if os.path.isfile(p)]
+        self._json_new.clear()
+        if paths:
+            self._convert_cookies(paths, auto=True)
+
+    def _convert_cookies(self, paths: Optional[List[str]] = None, auto: bool = False):
+        """json_input/ の JSON クッキーを Netscape 形式に一括変換する（外部スクリプト不要）。
+
+        変換はワーカースレッド（大きなバッチはプロセスプール）で行い、汎用名の
+        ファイルの名前は最後に 1 つのダイアログでまとめて聞く。``auto`` は監視から
+        呼ばれた場合で、完了のメッセージボックスは出さない。
+        """
+        if self._converting:
+            self._log("Cookie conversion is already running.", "warning")
+            return
+        if paths is None:
+            import glob
+            paths = glob.glob(os.path.join(self.json_input_dir, "*.json"))
+        json_files = sorted(paths)
         if not json_files:
             self._log(f"No JSON files found in {self.json_input_dir}/", "warning")
             return
 
         os.makedirs(self.cookie_dir, exist_ok=True)
+        self._converting = True
         self._log(f"Found {len(json_files)} JSON file(s). Starting conversion…", "accent")
 
+        def _report(r: ConversionResult):
+            if r.error:
+                self.root.after(0, lambda: self._log(f"Error converting {r.json_path}: {r.error}", "error"))
+            elif not r.pending:
+                self.root.after(0, lambda: self._log(
+                    f"Converted → cookies/{r.stem}.txt  ({r.cookies:,} cookies)", "success"))
+
         def _run():
-            converted = {"count": 0}
-            for json_path in json_files:
-                try:
-                    filename = os.path.basename(json_path)
-                    stem = os.path.splitext(filename)[0]
-
-                    # ファイル名が汎用的な場合のみ名前変更を促す
-                    if stem.lower() in ("cookies", "cookie"):
-                        new_name = self._ask_string(
-                            "Rename Cookie",
-                            f'"{filename}" is a generic name.\nEnter a descriptive name (no extension):'
-                        )
-                        if not new_name:
-                            self.root.after(0, lambda p=filename: self._log(f"Skipped: {p} (no name given)", "dim"))
-                            continue
-                        stem = "".join(
-                            c for c in new_name if c.isalnum() or c in (" ", ".", "_", "-")
-                        ).strip() or stem
-
-                    txt_path = os.path.join(self.cookie_dir, f"{stem}.txt")
-                    with open(json_path, "r", encoding="utf-8") as f:
-                        cookies = json.load(f)
-
-                    with open(txt_path, "w", encoding="utf-8", newline="\n") as f:
-                        f.write("# Netscape HTTP Cookie File\n")
-                        f.write("# Converted by Gallery-DL GUI\n\n")
-                        for c in cookies:
-                            domain  = c.get("domain", "")
-                            flag    = "FALSE" if c.get("hostOnly", False) else "TRUE"
-                            path    = c.get("path", "/")
-                            secure  = "TRUE" if c.get("secure", False) else "FALSE"
-                            expiry  = str(int(c.get("expiry") or c.get("expirationDate") or 0))
-                            name    = c.get("name", "")
-                            value   = c.get("value", "")
-                            f.write(f"{domain}\t{flag}\t{path}\t{secure}\t{expiry}\t{name}\t{value}\n")
-
-                    os.remove(json_path)
-                    converted["count"] += 1
-                    self.root.after(0, lambda s=stem: self._log(f"Converted → cookies/{s}.txt", "success"))
-
-                except Exception as e:
-                    self.root.after(0, lambda p=json_path, err=e: self._log(f"Error converting {p}: {err}", "error"))
-
-            self.root.after(0, self._load_cookies)
-            n = converted["count"]
-            msg = f"{n} cookie file(s) converted successfully."
-            self.root.after(0, lambda m=msg: messagebox.showinfo("Conversion Complete", m))
+            started = time.perf_counter()
+            try:
+                results = convert_batch(json_files, self.cookie_dir, on_result=_report)
+            except Exception as e:
+                self.root.after(0, lambda err=e: self._log(f"Cookie conversion failed: {err}", "error"))
+                results = []
+            elapsed = time.perf_counter() - started
+            self.root.after(0, lambda: self._finish_cookie_conversion(results, elapsed, auto))
 
         threading.Thread(target=_run, daemon=True).start()
 
-    def _ask_string(self, title: str, prompt: str) -> Optional[str]:
-        """tk.simpledialog を使用したスレッドセーフな文字列ダイアログ。"""
-        result: List[Optional[str]] = [None]
-        done = threading.Event()
-
-        def _show():
-            from tkinter import simpledialog
-            result[0] = simpledialog.askstring(title, prompt, parent=self.root)
-            done.set()
-
-        self.root.after(0, _show)
-        done.wait(timeout=120)
-        return result[0]
+    def _finish_cookie_conversion(self, results: List[ConversionResult], elapsed: float,
+                                  auto: bool = False):
+        """変換の後始末（Tk スレッド）。汎用名のファイルに名前を付けて一覧を更新する。"""
+        pending = [r for r in results if r.pending]
+        names = self._ask_cookie_names(pending) if pending else {}
+        for r in results:
+            if r.error is None and not r.pending:
+                self._cookie_added(os.path.basename(r.txt_path))
+        for r in pending:
+            path = finalize_pending(r, names.get(r.json_path), self.cookie_dir)
+            if path:
+                self._log(f"Converted → cookies/{os.path.basename(path)}  ({r.cookies:,} cookies)", "success")
+                self._cookie_added(os.path.basename(path))
+            else:
+                self._log(f"Skipped: {os.path.basename(r.json_path)} (no name given)", "dim")
+
+        ok = [r for r in results if r.error is None and (not r.pending or names.get(r.json_path))]
+        self._converting = False
+        if ok:
+            self._log(f"Cookie conversion: {cookie_summary(ok, elapsed)}", "dim")
+        if not auto:
+            msg = f"{len(ok)} cookie file(s) converted successfully."
+            if ok:
+                msg += f"\n{cookie_summary(ok, elapsed)}"
+            from tkinter import messagebox
+            messagebox.showinfo("Conversion Complete", msg)
+        if self._json_new and not self._json_scheduled:
+            self._json_scheduled = True     # 変換中に置かれたファイル
+            self.root.after(JSON_SETTLE_MS, self._auto_convert)
+
+    def _ask_cookie_names(self, pending: List[ConversionResult]) -> Dict[str, str]:
+        """汎用名のファイルの名前を 1 つのダイアログでまとめて聞く（空欄はスキップ）。"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Name Cookie Files")
+        dialog.configure(bg=BG_COLOR)
+        dialog.transient(self.root)
+        dialog.resizable(False, False)
+
+        ttk.Label(dialog, text="These files have generic names. Enter a name for each "
+                               "(no extension), or leave it empty to skip.",
+                  style="Sub.TLabel", wraplength=460).grid(
+            row=0, column=0, columnspan=3, sticky=tk.W, padx=12, pady=(12, 8))
+        entries: Dict[str, tk.StringVar] = {}
+        for row, r in enumerate(pending, start=1):
+            ttk.Label(dialog, text=os.path.basename(r.json_path)).grid(
+                row=row, column=0, sticky=tk.W, padx=(12, 8), pady=2)
+            ttk.Label(dialog, text=f"{r.cookies:,} cookies · {r.domain or '?'}",
+                      style="Sub.TLabel").grid(row=row, column=1, sticky=tk.W, padx=(0, 8))
+            var = tk.StringVar(value=sanitize_name(r.domain or ""))
+            tk.Entry(dialog, textvariable=var, width=28, bg=ENTRY_BG, fg=FG_COLOR,
+                     insertbackground=FG_COLOR, relief=tk.FLAT, font=FONT_MAIN).grid(
+                row=row, column=2, sticky=tk.EW, padx=(0, 12), pady=2)
+            entries[r.json_path] = var
+
+        result: Dict[str, str] = {}
+
+        def _save():
+            result.update({path: var.get().strip() for path, var in entries.items()})
+            dialog.destroy()
+
+        btns = ttk.Frame(dialog)
+        btns.grid(row=len(pending) + 1, column=0, columnspan=3, sticky=tk.E, padx=12, pady=12)
+        ttk.Button(btns, text="Skip All", style="Small.TButton",
+                   command=dialog.destroy).pack(side=tk.RIGHT, padx=(6, 0))
+        ttk.Button(btns, text="Save", style="Small.TButton", command=_save).pack(side=tk.RIGHT)
+        dialog.bind("<Return>", lambda _: _save())
+        dialog.bind("<Escape>", lambda _: dialog.destroy())
+        dialog.grab_set()
+        self.root.wait_window(dialog)
+        return result
 
     def _toggle_cookie(self):
         state = "readonly" if self.use_cookie_var.get() else "disabled"
@@ -445,370 +998,716 @@ class GalleryDLApp:
 
     # ダウンロード
     # ──────────────────────────────────────────────
+    def _build_args(self, job: Job) -> List[str]:
+        """gallery-dl の引数を構築する（ワーカースレッドから呼ばれる）。"""
+        return build_gallery_dl_args(job, os.path.abspath("gallery-dl.conf"),
+                                     self.cookie_dir, self.MAX_RETRIES, self.cookie_jars,
+                                     self.profiles)
+
+    def _selected_cookie(self) -> Optional[str]:
+        if not self.use_cookie_var.get():
+            return None
+        cookie_file = self.cookie_var.get()
+        if not cookie_file:
+            self._log("Warning: no cookie file selected, continuing without cookies.", "warning")
+            return None
+        return cookie_file
+
+    def _enqueue(self, urls: List[str]):
+        jobs = self.queue.add(urls, self._selected_cookie())
+        if len(jobs) > 1:
+            self._log(f"Queued {len(jobs)} URLs.", "accent")
+
     def _start_download(self):
-        url = self.url_var.get().strip()
-        if not url:
+        urls = split_urls(self.url_var.get())
+        has_queued = any(j.state == JOB_QUEUED for j in self.queue.jobs)
+        if not urls and not has_queued:
+            from tkinter import messagebox
             messagebox.showwarning("Input Error", "Please enter a URL.")
             return
 
-        # gallery-dl の引数を構築
-        conf_path = os.path.abspath("gallery-dl.conf")
-        gallery_dl_args = [
-            "--config", conf_path,
-            "--retries", str(self.MAX_RETRIES),
-            url,
-        ]
+        # 何も実行していなければ新しいバッチとしてログをリセット
+        if not self.queue.running():
+            self._reset_log()
+            self._reset_failed()
+
+        if urls:
+            self._enqueue(urls)
+            self.url_var.set("")
 
-        if self.use_cookie_var.get():
-            cookie_file = self.cookie_var.get()
-            if cookie_file:
-                cookie_path = os.path.abspath(os.path.join(self.cookie_dir, cookie_file))
-                gallery_dl_args = ["--cookies", cookie_path] + gallery_dl_args
-            else:
-                self._log("Warning: no cookie file selected, continuing without cookies.", "warning")
-
-        # UIをリセット
-        self.fail_count = 0
-        self.download_count = 0
-        self.retry_count = 0
-        self._stop_flag = False
-        self.stats_var.set("")
-        self.start_btn.configure(state="disabled")
         self.stop_btn.configure(state="normal")
         self.status_var.set("Downloading…")
+        self.queue.start()
 
-        self._reset_log()
-        self._reset_failed()
+    def _retry_failed(self):
+        """記録済みの失敗アイテムだけを 1 つのジョブで取り直し、残りは間隔を空けて再試行する。"""
+        if not len(self.failures):
+            self._log("No failed items recorded.", "dim")
+            return
+        job = self.queue.retry_failed(force=True)
+        if job is None:
+            self._log("Failed items are already being retried "
+                      "(or all of them reached the attempt limit).", "dim")
+            return
+        self._log(f"Retrying failed items: {job.url}", "accent")
+        self.queue.retry_mode = True
+        self.stop_btn.configure(state="normal")
+        self.status_var.set("Retrying failed items…")
+        self.queue.start()
 
-        self._log("─" * 56, "dim")
-        self._log(f"gallery-dl {' '.join(gallery_dl_args)}", "dim")
-        self._log("─" * 56, "dim")
+    def _forget_failed(self):
+        n = len(self.failures)
+        self.failures.clear()
+        self.failures.save()
+        self._log(f"Forgot {n} failed item(s).", "dim")
 
-        self.progress_bar.start(12)
+    def _stop_download(self, reason: str = "ユーザーによる停止"):
+        """キューを一時停止して実行中のジョブをすべて止める。"""
+        self.queue.stop_all(reason)
+        self.stop_btn.configure(state="disabled")
 
-        # 実行モードの選択: 常にポータブル python.exe 経由でサブプロセスを使用
-        # ベースディレクトリ（スクリプトまたはビルド済み exe）を解決
-        if getattr(sys, "frozen", False):
-            base_dir = os.path.dirname(sys.executable)
-        else:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
+    def _import_urls(self):
+        from tkinter import filedialog
+        path = filedialog.askopenfilename(
+            title="Import URL list",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, "r", encoding="utf-8-sig") as f:
+                urls = split_urls(f.read())
+        except OSError as e:
+            self._log(f"Could not read {path}: {e}", "error")
+            return
+        if not urls:
+            self._log(f"No URLs found in {os.path.basename(path)}", "warning")
+            return
+        self._enqueue(urls)
+        self._log(f"Imported {len(urls)} URL(s) from {os.path.basename(path)}. "
+                  f"Press Start to run the queue.", "success")
 
-        python_exe = os.path.join(base_dir, "python", "python.exe")
-        if os.path.exists(python_exe):
-            cmd = [python_exe, "-m", "gallery_dl"] + gallery_dl_args
-        else:
-            # バンドルされた Python がない開発環境用のフォールバック
-            cmd = ["gallery-dl"] + gallery_dl_args
+    # キュー操作（キュータブ）
+    def _selected_job_ids(self) -> List[int]:
+        return [int(iid) for iid in self.queue_tree.selection()]
 
-        threading.Thread(target=self._run_process, args=(cmd,), daemon=True).start()
+    def _stop_selected_jobs(self):
+        for job_id in self._selected_job_ids():
+            self.queue.stop(job_id)
 
-    def _stop_download(self, reason: str = "ユーザーによる停止"):
-        self._stop_flag = True
-        if self.process:
-            try:
-                self._log("強制終了を試みています...", "warning")
-                self.process.kill() # 即座に停止
-            except Exception as e:
-                self._log(f"プロセス終了エラー: {e}", "error")
+    def _requeue_selected_jobs(self):
+        for job_id in self._selected_job_ids():
+            self.queue.requeue(job_id)
 
-        # 書きかけのファイルを削除
-        if self.current_download_path and os.path.exists(self.current_download_path):
-            try:
-                # 削除を試みる。使用中の場合は少し待つ
-                import time
-                time.sleep(0.1)
-                os.remove(self.current_download_path)
-                self._log(f"不完全なファイルを削除しました: {os.path.basename(self.current_download_path)}", "dim")
-            except Exception as e:
-                self._log(f"ファイル削除に失敗: {e}", "dim")
-            finally:
-                self.current_download_path = None
+    def _remove_selected_jobs(self):
+        for job_id in self._selected_job_ids():
+            self.queue.remove(job_id)
+        self._queue_dirty = True
 
-        self._log(f"停止中… ({reason})", "warning")
-        self.stop_btn.configure(state="disabled")
+    def _clear_finished_jobs(self):
+        self.queue.clear_finished()
+        self._queue_dirty = True
 
-        # _run_gallery_dl_inprocess は、ビルド済み EXE ではサブプロセスモードの方が信頼性が高いため削除されました。
-
-    _HTTP_ERR_RE = re.compile(r'\b([45]\d{2})\b')
-    _RETRY_RE    = re.compile(r'Retrying\s+(\d+)/(\d+)', re.IGNORECASE)
-    _SKIP_RE     = re.compile(r'\bskipping\b|\bskipped\b',  re.IGNORECASE)
-    # パス判定 (gallery-dlのパス出力形式に合わせる。絶対・相対パス両方考慮)
-    _PATH_RE     = re.compile(r'(?:#\s*\d+\s+)([^\s\'"<>{}|\\^~\[\]`]+)')
-
-    def _process_output_line(self, line: str, last_url: Optional[str]):
-        """単一の出力行を分類して UI に送る共通ロジック。"""
-        url_match = re.search(r'https?://[^\s\'"<>{}|\\^~\[\]`]+', line)
-        low = line.lower()
-
-        # リトライ検出
-        retry_m = self._RETRY_RE.search(line)
-        if retry_m:
-            cur   = int(retry_m.group(1))
-            total = int(retry_m.group(2))
-            self.retry_count += 1
-            http_m   = self._HTTP_ERR_RE.search(line)
-            code_str = f" (HTTP {http_m.group(1)})" if http_m else ""
-            rline = f"🔄 リトライ {cur}/{total}{code_str} — {line.strip()}"
-            stats = (f"Downloaded: {self.download_count}  |  "
-                     f"Failed: {self.fail_count}  |  Retry: {self.retry_count}")
-            self.root.after(0, lambda l=rline: self._log(l, "warning"))
-            self.root.after(0, lambda s=stats: self.stats_var.set(s))
-            return
+    def _on_workers_change(self):
+        try:
+            n = int(self.workers_var.get())
+        except (tk.TclError, ValueError):
+            n = self.queue.workers
+        self.queue.set_workers(n)
+        self.workers_var.set(self.queue.workers)
 
-        # パス捕捉 (ダウンロード開始)
-        path_m = self._PATH_RE.search(line)
-        if path_m:
-            captured_path = path_m.group(1)
-            # 実際にダウンロード対象のファイルっぽいか簡易チェック
-            if "." in os.path.basename(captured_path):
-                self.current_download_path = os.path.abspath(captured_path)
-
-        # スキップ検出（10回失敗後にgallery-dlが自動スキップ）
-        if self._SKIP_RE.search(line) and "[" in line:
-            http_m   = self._HTTP_ERR_RE.search(line)
-            code_str = f" HTTP {http_m.group(1)}" if http_m else ""
-            sline    = f"⏭ Skip{code_str}: {line.strip()}"
-            cur_url  = url_match.group(0) if url_match else last_url
-            fi       = f"{sline} | URL: {cur_url}" if cur_url else sline
-            self.fail_count += 1
-            stats = (f"Downloaded: {self.download_count}  |  "
-                     f"Failed: {self.fail_count}  |  Retry: {self.retry_count}")
-            self.root.after(0, lambda l=sline: self._log(l, "error"))
-            self.root.after(0, lambda f=fi, s=stats:
-                            (self._log_failed(f), self.stats_var.set(s)))
+    def _on_per_host_change(self):
+        try:
+            n = int(self.per_host_var.get())
+        except (tk.TclError, ValueError):
+            n = self.queue.hosts.per_host
+        self.queue.set_per_host(n)
+        self.per_host_var.set(self.queue.hosts.per_host)
+
+    def _open_profiles(self):
+        """profiles.json を開く（保存すれば次に始めるジョブから使われる）。"""
+        profiles = self.profiles.profiles()
+        if self.profiles.error:
+            self._log(f"Site profiles: {self.profiles.error}", "error")
+        elif profiles:
+            self._log("Site profiles: " + ", ".join(
+                f"{p.name} ({', '.join(p.hosts)})" for p in profiles), "dim")
+        if not os.path.exists(self.profiles.path):
+            self._log(f"{os.path.basename(self.profiles.path)} not found in {app_dir()}", "warning")
             return
+        self._open_path(self.profiles.path)
 
-        # 通常のエラー判定（エラーキーワード or HTTP 4xx/5xx）
-        http_m   = self._HTTP_ERR_RE.search(line)
-        is_error = ("[error]" in low or "failed" in low
-                    or "exception" in low or http_m is not None)
-
-        if re.match(r"#\s*\d+", line):
-            self.download_count += 1
-
-        failed_item = None
-        if is_error:
-            self.fail_count += 1
-            code_str = f" [HTTP {http_m.group(1)}]" if http_m else ""
-            m = re.search(r"'(.*?)'", line)
-            if m:
-                desc = m.group(1) + code_str
-            elif "[error]" in low:
-                desc = line.split("[error]", 1)[1].strip() + code_str
-            else:
-                desc = line + code_str
-            cur_url = url_match.group(0) if url_match else last_url
-            if cur_url:
-                failed_item = (f"URL: {cur_url}" if (not desc or cur_url in desc)
-                               else f"{desc} | URL: {cur_url}")
-            else:
-                failed_item = desc
-            if http_m and http_m.group(1) not in line:
-                line = f"{line.rstrip()}  [HTTP {http_m.group(1)}]"
-
-        if is_error:
-            tag = "error"
-        elif "[warning]" in low:
-            tag = "warning"
-        elif line.startswith("#"):
-            tag = "success"
-        elif line.startswith("─") or line.startswith("-"):
-            tag = "dim"
-        else:
-            tag = "info"
-
-        speed_m = re.search(r'(\d+\.?\d*\s*\w+/s)', line)
-        speed = speed_m.group(1) if speed_m else ""
-        stats = f"Failed: {self.fail_count}  |  Retry: {self.retry_count}"
-        if speed:
-            stats += f"  |  {speed}"
-
-        self.root.after(0, lambda l=line, t=tag, fi=failed_item, s=stats:
-                        self._update_all(l, t, fi, s))
-
-    def _watch_timeout(self, worker_thread: threading.Thread, proc):
-        """応答なし・ダウンロード停止を監視して自動停止する。"""
-        import time
-        while worker_thread.is_alive() and not self._stop_flag:
-            time.sleep(1)
-            if self._stop_flag:
-                break
-            elapsed = time.monotonic() - self._last_activity_time
-            if elapsed >= self.TIMEOUT_SECONDS:
-                msg = f"\u23f1 {self.TIMEOUT_SECONDS}\u79d2\u9593\u5fdc\u7b54\u304c\u306a\u3044\u305f\u3081\u81ea\u52d5\u505c\u6b62\u3057\u307e\u3059\u3002"
-                self.root.after(0, lambda m=msg: self._log(m, "warning"))
-                self._stop_download(reason=f"\u30bf\u30a4\u30e0\u30a2\u30a6\u30c8 ({self.TIMEOUT_SECONDS}\u79d2)")
-                _p = proc
-                if _p is not None:
-                    try:
-                        _p.terminate()
-                    except Exception:
-                        pass
-                break
-
-    def _run_process(self, cmd: List[str]):
-        import time
-        self._last_activity_time = time.monotonic()
+    def _on_min_free_change(self):
         try:
-            si = None
-            if os.name == "nt":
-                si = subprocess.STARTUPINFO()
-                si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-
-            env = os.environ.copy()
-            env.update({"PYTHONIOENCODING": "utf-8", "PYTHONUTF8": "1", "PYTHONUNBUFFERED": "1"})
-
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                text=True, bufsize=1, universal_newlines=True,
-                startupinfo=si, env=env,
-                encoding="utf-8", errors="replace"
-            )
-            proc = self.process
-            stdout = proc.stdout
-            if not stdout:
+            gb = max(0.0, float(self.min_free_var.get()))
+        except (tk.TclError, ValueError):
+            gb = self.queue.disk.reserve / (1 << 30)
+        self.queue.set_min_free(int(gb * (1 << 30)))
+        self.min_free_var.set(round(self.queue.disk.reserve / (1 << 30), 1))
+
+    def _toggle_prewarm(self):
+        enabled = self.prewarm_var.get()
+        self.queue.set_prewarm(enabled)
+        self.queue.save()
+        if enabled:
+            self._log(f"Pre-warming {self.queue.workers} gallery-dl worker(s)…", "dim")
+
+    # ローカル制御 API
+    def _api_config(self) -> Dict[str, Any]:
+        if self.api_settings is None:
+            from gallery_dl_api import load_api_settings
+            self.api_settings = load_api_settings(self.api_settings_path)
+        return self.api_settings
+
+    def _start_api_if_enabled(self):
+        if self.api is None and self._api_config()["enabled"]:
+            self.api_var.set(True)
+            self._toggle_api()
+
+    def _toggle_api(self):
+        from gallery_dl_api import ApiServer, save_api_settings
+        settings = self._api_config()
+        enabled = self.api_var.get()
+        if enabled and self.api is None:
+            api = ApiServer(self.queue, settings["port"], settings["token"],
+                            on_start=lambda: self.root.after(0, self._api_start),
+                            on_stop=lambda: self.root.after(0, self._stop_download),
+                            cookie_dir=self.cookie_dir)
+            try:
+                api.start()
+            except OSError as e:
+                self._log(f"Could not start the local API on port {api.port}: {e}", "error")
+                self.api_var.set(False)
                 return
+            self.api = api
+            self._log(f"Local API listening on {api.url}  (token in api.json)", "accent")
+        elif not enabled and self.api is not None:
+            api, self.api = self.api, None
+            api.stop()
+            self._log("Local API stopped.", "dim")
+        settings["enabled"] = self.api is not None
+        save_api_settings(self.api_settings_path, settings)
+
+    def _api_start(self):
+        """API から投入されたジョブでキューを開始する（Tk スレッド）。ログは消さない。"""
+        self.stop_btn.configure(state="normal")
+        self.status_var.set("Downloading…")
+        self.queue.start()
 
-            # タイムアウト監視スレッド
-            wt = threading.current_thread()
-            threading.Thread(
-                target=self._watch_timeout,
-                args=(wt, proc),
-                daemon=True
-            ).start()
+    # ダウンロードアーカイブ（アーカイブタブ）
+    def _toggle_archive(self):
+        self.queue.set_archive(self.archive_var.get())
 
-            last_url: Optional[str] = None
+    def _refresh_archive_view(self):
+        """件数を数えるのに時間がかかることがあるので、集計は別スレッドで行う。"""
+        index = self.queue.archive
+        if index is None:
+            return
 
-            for raw_line in stdout:
-                if self._stop_flag:
-                    break
-                line = raw_line.rstrip()
-                if not line:
-                    continue
-
-                self._last_activity_time = time.monotonic()  # 活動時刻を更新
-
-                # 最後に確認したURLを追跡
-                url_match = re.search(r'https?://[^\s\'"<>{}|\\^~\[\]`]+', line)
-                if url_match:
-                    last_url = url_match.group(0)
-
-                low = line.lower()
-                is_error = "[error]" in low or "failed" in low or "exception" in low
-
-                # ダウンロードを検出（gallery-dl はダウンロード時に "#" プレフィックスを出力する）
-                if re.match(r"#\s*\d+", line):
-                    self.download_count += 1
-
-                failed_item = None
-                if is_error:
-                    self.fail_count += 1
-                    m = re.search(r"'(.*?)'", line)
-                    if m:
-                        desc = m.group(1)
-                    elif "[error]" in low:
-                        desc = line.split("[error]", 1)[1].strip()
-                    else:
-                        desc = line
-
-                    cur_url = url_match.group(0) if url_match else last_url
-                    if cur_url:
-                        failed_item = (f"URL: {cur_url}" if (not desc or cur_url in desc)
-                                       else f"{desc} | URL: {cur_url}")
-                    else:
-                        failed_item = desc
-
-                # タグを選択
-                if is_error:
-                    tag = "error"
-                elif "[warning]" in low:
-                    tag = "warning"
-                elif line.startswith("#"):
-                    tag = "success"
-                elif line.startswith("─") or line.startswith("-"):
-                    tag = "dim"
-                else:
-                    tag = "info"
+        def work():
+            infos = index.infos()
+            self.root.after(0, lambda: self._fill_archive_view(infos))
+            if not self._reindexing:
+                text = self._dedup_text()
+                self.root.after(0, lambda: self.dedup_stats_var.set(text))
+        threading.Thread(target=work, daemon=True).start()
 
-                # 速度検出
-                speed_m = re.search(r'(\d+\.?\d*\s*\w+/s)', line)
-                speed = speed_m.group(1) if speed_m else ""
+    def _dedup_text(self) -> str:
+        try:
+            st = self.queue.dedup.stats()
+        except Exception as e:
+            return f"Index unavailable: {e}"
+        return (f"{st.files:,} files indexed ({format_size(st.bytes)})  ·  "
+                f"{st.duplicates:,} duplicates, {format_size(st.saved)} saved")
+
+    def _set_dedup(self):
+        from gallery_dl_dedup import DEDUP_OFF
+        mode = next(m for m, label in dedup_labels().items() if label == self.dedup_var.get())
+        self.queue.set_dedup(mode)
+        if mode != DEDUP_OFF and not self.queue.dedup.stats().files:
+            self._log("Duplicate detection only knows files downloaded from now on. "
+                      "Use \"Re-index\" on the Archive tab to index existing downloads.", "dim")
+
+    def _reindex_downloads(self):
+        """保存先全体を再索引する（ハッシュはプロセスプールで並列に計算する）。"""
+        if self._reindexing:
+            return
+        self._reindexing = True
+        dedup = self.queue.dedup
+        self.dedup_stats_var.set("Scanning…")
+
+        def progress(done: int, total: int):
+            self.root.after(0, lambda: self.dedup_stats_var.set(f"Hashing {done:,}/{total:,}…"))
 
-                stats = f"Failed: {self.fail_count}"
-                if speed:
-                    stats += f"  |  {speed}"
+        def work():
+            try:
+                r = dedup.reindex(on_progress=progress)
+                msg, tag = (f"Re-indexed {self.download_dir}: {r.scanned:,} files, {r.hashed:,} hashed, "
+                            f"{r.removed:,} removed in {r.seconds:.1f}s"), "success"
+            except Exception as e:
+                msg, tag = f"Re-index failed: {e}", "error"
+            self._reindexing = False
+            text = self._dedup_text()
+            self.root.after(0, lambda: (self._log(msg, tag), self.dedup_stats_var.set(text)))
+        threading.Thread(target=work, daemon=True).start()
+
+    def _fill_archive_view(self, infos):
+        tree = self.archive_tree
+        tree.delete(*tree.get_children())
+        for info in infos:
+            rate = info.hit_rate
+            tree.insert("", tk.END, iid=info.profile, values=(
+                info.profile,
+                info.entries if info.entries is not None else "?",
+                format_size(info.size), info.lookups, info.hits,
+                f"{rate * 100:.0f}%" if rate is not None else ""))
+
+    # ダウンロード履歴
+    # ──────────────────────────────────────────────
+    def _search_history(self, page: Optional[str] = None):
+        """履歴を 1 ページ検索する（別スレッド）。``page`` は "older" / "newer"。"""
+        rows = self._history_rows
+        before = after = None
+        if page == "older":
+            if not rows:
+                return
+            before = rows[-1].id
+        elif page == "newer":
+            if not rows:
+                return
+            after = rows[0].id
+        site = self.history_site_var.get()
+        since = HISTORY_SINCE.get(self.history_since_var.get())
+        kwargs = dict(text=self.history_query_var.get(),
+                      site=None if site == HISTORY_ALL_SITES else site,
+                      kind=history_kinds().get(self.history_kind_var.get()),
+                      since=time.time() - since if since else None,
+                      before=before, after=after)
+        self._history_seq += 1
+        seq = self._history_seq
+        history = self.queue.history
+        self.history_status_var.set("Searching…")
+
+        def work():
+            started = time.perf_counter()
+            try:
+                found = history.search(**kwargs)
+                sites = [s for s, _ in history.sites()] if page is None else None
+                error = None
+            except Exception as e:
+                found, sites, error = [], None, str(e)
+            ms = (time.perf_counter() - started) * 1000.0
+            self.root.after(0, lambda: self._fill_history(seq, page, found, sites, ms, error))
+        threading.Thread(target=work, daemon=True).start()
+
+    def _fill_history(self, seq: int, page: Optional[str], rows: List["HistoryRow"],
+                      sites: Optional[List[str]], ms: float, error: Optional[str]):
+        from gallery_dl_history import KIND_DONE
+        if seq != self._history_seq:
+            return                          # 後から出した検索がある
+        if error is not None:
+            self.history_status_var.set(f"History unavailable: {error}")
+            return
+        if sites is not None:
+            self.history_site_combo["values"] = [HISTORY_ALL_SITES] + sites
+        if not rows and page is not None:
+            self.history_status_var.set(f"No {'older' if page == 'older' else 'newer'} entries.")
+            return
+        self._history_rows = rows
+        tree = self.history_tree
+        tree.delete(*tree.get_children())
+        for r in rows:
+            tree.insert("", tk.END, iid=str(r.id), tags=(r.kind,), values=(
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(r.time)),
+                "✓" if r.kind == KIND_DONE else "✗",
+                r.site,
+                format_size(r.size) if r.size else "",
+                f"{r.duration:.1f}s" if r.duration is not None else "",
+                (r.path or r.url or r.source) if r.kind == KIND_DONE
+                else f"{r.message or ''}  |  {r.url or r.source}"))
+        self.history_status_var.set(f"{len(rows)} entr{'y' if len(rows) == 1 else 'ies'} "
+                                    f"({ms:.0f} ms)" if rows else "No matching entries.")
+
+    def _open_history_item(self):
+        sel = self.history_tree.selection()
+        row = next((r for r in self._history_rows if str(r.id) in sel), None)
+        if row is None or not row.path:
+            return
+        self._open_folder(os.path.dirname(os.path.abspath(row.path)))
 
-                self.root.after(0, lambda l=line, t=tag, fi=failed_item, s=stats:
-                                self._update_all(l, t, fi, s))
+    def _delete_selected_archives(self):
+        profiles = list(self.archive_tree.selection())
+        if not profiles:
+            return
+        from tkinter import messagebox
+        if not messagebox.askyesno(
+                "Delete archive",
+                f"Delete {len(profiles)} download archive(s)?\n"
+                "Items in these galleries will be checked again on the next run."):
+            return
+        for profile in profiles:
+            self.queue.archive.delete(profile)
+        self._refresh_archive_view()
+
+    # メトリクス（メトリクスタブ）
+    def _refresh_metrics(self):
+        """タブを開いている間、METRICS_FRAME_MS ごとに表を描き直す。"""
+        if self.notebook.index(self.notebook.select()) != METRICS_TAB or self.metrics_tree is None:
+            self._metrics_refreshing = False
+            return
+        self._metrics_refreshing = True
+        now = time.monotonic()
+        dt = now - self._metrics_prev_at if self._metrics_prev_at else 0.0
+        prev, self._metrics_prev, self._metrics_prev_at = self._metrics_prev, {}, now
+        tree = self.metrics_tree
+
+        def row(key: str, name: str, value: float, counted: bool, *stats: str):
+            self._metrics_prev[key] = value
+            rate = ""
+            if counted and dt > 0 and key in prev:
+                per_sec = max(0.0, value - prev[key]) / dt
+                rate = format_speed(per_sec) if "bytes" in name else f"{per_sec:,.1f}"
+            values = (key.replace("gallery_dl_", "", 1), self._metric_value(name, value),
+                      rate, *stats)
+            if tree.exists(key):
+                tree.item(key, values=values)
+            else:
+                tree.insert("", tk.END, iid=key, values=values)
 
-            proc.wait()
-            code = proc.returncode
-            if self._stop_flag:
-                msg = "停止しました"
-                final_tag = "warning"
-                final_status = "Stopped"
+        for m in self.metrics:
+            if isinstance(m, Counter):
+                if m.label:
+                    for label_value, v in sorted(m.values().items()):
+                        row(f'{m.name}{{{m.label}="{label_value}"}}', m.name, v, True)
+                else:
+                    row(m.name, m.name, m.value, True)
+            elif isinstance(m, Gauge):
+                v = m.value
+                if v is not None:
+                    row(m.name, m.name, v, False)
             else:
-                msg = f"Finished  —  exit code {code}"
-                final_tag = "success" if code == 0 else "warning"
-                final_status = "Done" if code == 0 else f"Done with errors (code {code})"
-            final_stats = f"Failed: {self.fail_count}"
-
-            self.root.after(0, lambda: self._update_all(msg, final_tag, None, final_stats))
-            self.root.after(0, lambda: self.status_var.set(final_status))
-
-        except FileNotFoundError:
-            self.root.after(0, lambda: self._log("Error: gallery-dl not found.", "error"))
-            self.root.after(0, lambda: self.status_var.set("Error"))
-        except Exception as exc:
-            msg = str(exc)
-            self.root.after(0, lambda m=msg: self._log(f"Error: {m}", "error"))
-            self.root.after(0, lambda: self.status_var.set("Error"))
+                state = m.state()
+                _counts, count, total, largest = state
+                unit = m.name
+                row(m.name, "count", count, True,
+                    self._metric_value(unit, total / count if count else None),
+                    self._metric_value(unit, m.quantile(0.5, state)),
+                    self._metric_value(unit, m.quantile(0.99, state)),
+                    self._metric_value(unit, largest if count else None))
+        self.metrics_status_var.set(
+            f"Per-line timings are recorded while this tab is open  ·  "
+            f"since {time.strftime('%H:%M:%S', time.localtime(self.metrics.started))}")
+        self.root.after(METRICS_FRAME_MS, self._refresh_metrics)
+
+    @staticmethod
+    def _metric_value(name: str, v: Optional[float]) -> str:
+        if v is None:
+            return ""
+        if name.endswith("_seconds"):
+            if v < 1e-3:
+                return f"{v * 1e6:.1f} µs"
+            if v < 1.0:
+                return f"{v * 1e3:.1f} ms"
+            return f"{v:.2f} s"
+        if name.endswith("_rate_bytes"):
+            return format_speed(v)
+        if "bytes" in name:
+            return format_size(v)
+        return f"{v:,.0f}" if float(v).is_integer() else f"{v:,.1f}"
+
+    def _toggle_record(self):
+        """ジョブの出力を recordings/ に記録するか（benchmark.py replay で再生できる）。"""
+        if self.record_var.get():
+            self.queue.set_record(os.path.abspath(self.record_dir))
+            self._log(f"Recording gallery-dl output of new jobs to {self.record_dir}/", "dim")
+        else:
+            self.queue.set_record(None)
+
+    def _reset_metrics(self):
+        self.metrics.reset()
+        self._metrics_prev = {}
+        if self.metrics_tree is not None:
+            self.metrics_tree.delete(*self.metrics_tree.get_children())
+
+    def _export_metrics(self, fmt: str):
+        from tkinter import filedialog
+        if fmt == "json":
+            filetypes = [("JSON", "*.json"), ("All files", "*.*")]
+        else:
+            filetypes = [("Prometheus text", "*.prom"), ("All files", "*.*")]
+        path = filedialog.asksaveasfilename(
+            title="Export metrics", defaultextension="." + fmt,
+            initialfile=f"gallery-dl-metrics.{fmt}", filetypes=filetypes)
+        if not path:
+            return
+        try:
+            self.metrics.write(path, fmt)
+        except OSError as e:
+            self._log(f"Could not export metrics: {e}", "error")
+            return
+        self._log(f"Metrics exported to {path}", "success")
+
+    # エンジンのコールバック（ワーカースレッドから呼ばれる。Tk には触れない）
+    def _job_prefix(self, job: Optional[Job]) -> str:
+        return f"[{job.id}] " if job is not None and self.queue.workers > 1 else ""
+
+    def _on_job_event(self, job: Job, ev: LineEvent):
+        text = self._job_prefix(job) + ev.text if ev.text is not None else None
+        self._log_sink.put(text, ev.tag, ev.failed_item)
+        self._queue_dirty = True
+
+    def _on_job_message(self, job: Optional[Job], text: str, tag: str):
+        if self.api is not None:
+            self.api.message(job, text, tag)
+        text = self._job_prefix(job) + text
+        if threading.current_thread() is threading.main_thread():
+            # Tk スレッドから（停止ボタンなど）: ブロックする put は使えない
+            self._log(text, tag)
+        else:
+            self._log_sink.put(text, tag)
+
+    def _on_job_state(self, job: Job):
+        self._queue_dirty = True
+        if self.api is not None:
+            self.api.job_changed(job)
+
+    def _stats_text(self) -> str:
+        t = self.queue.totals()
+        c = self.queue.counts()
+        stats = (f"Downloaded: {t['downloaded']}  |  "
+                 f"Failed: {t['failed']}  |  Retry: {t['retries']}")
+        if c[JOB_RUNNING] or c[JOB_QUEUED]:
+            stats += f"  |  Jobs: {c[JOB_RUNNING]} running, {c[JOB_QUEUED]} queued"
+        for site, rate, wait in self.queue.hosts.throttled():
+            stats += f"  |  {site}: {rate:.2f} req/s"
+            if wait >= 1:
+                stats += f", wait {int(wait)}s"
+        disk = self._disk_text()
+        if disk:
+            stats += f"  |  {disk}"
+        return stats
+
+    def _disk_text(self) -> str:
+        """保存先ボリュームの空き容量・書き込み速度・使用率。"""
+        d = self.queue.disk.latest if self.queue.disk is not None else None
+        if d is None:
+            return ""
+        text = f"Disk: {format_size(d.free)} free"
+        if d.write_rate >= 1024:
+            text += f", {format_speed(d.write_rate)} write"
+        if d.util is not None and d.util >= 0.05:
+            text += f", {d.util:.0%} busy"
+        if d.state == DISK_SLOW:
+            text += " (not adding jobs)"
+        elif d.state == DISK_LOW:
+            text += " (low — new jobs held)"
+        elif d.state == DISK_FULL:
+            text += " (full — jobs stopped)"
+        return text
+
+    def _progress_text(self, p: dict) -> str:
+        parts = []
+        if p["batch_total"] > 1:
+            parts.append(f"Jobs {p['batch_done']}/{p['batch_total']}")
+        if p["item_count"]:
+            parts.append(f"File {p['item_num']}/{p['item_count']}")
+        elif p["files"]:
+            parts.append(f"{p['files']} files")
+        received = p["bytes"]
+        if received:
+            parts.append(format_size(received))
+        if p["running"]:
+            if p["rate"] >= 1.0:
+                parts.append(format_speed(p["rate"]))
+            else:
+                # 構造化イベントのない gallery-dl: \r で上書きされる最新の進捗行か、
+                # 出力行から拾った速度をそのまま出す
+                live = [j.progress_text or j.speed for j in self.queue.running()
+                        if j.progress_text or j.speed]
+                if live:
+                    parts.append(live[0])
+            eta = format_eta(p["eta"])
+            if eta:
+                parts.append(f"ETA {eta}")
+        return "  ·  ".join(parts)
+
+    def _render_progress(self):
+        """一定間隔で進捗バーと統計行を描き直す。
+
+        集計値はワーカースレッドが更新しているので、ここではスナップショットを
+        読んで描くだけ。ファイル数やサイズが分からないときはバーを不定モードにする。
+        """
+        try:
+            p = self.queue.progress()
+            bar = self.progress_bar
+            if bar is not None:
+                fraction = p["fraction"]
+                if p["running"] and fraction is None:
+                    if not self._bar_pulsing:
+                        bar.configure(mode="indeterminate")
+                        bar.start(12)
+                        self._bar_pulsing = True
+                else:
+                    if self._bar_pulsing:
+                        bar.stop()
+                        bar.configure(mode="determinate")
+                        self._bar_pulsing = False
+                    if p["running"]:
+                        bar.configure(value=int(fraction * 1000))
+            self.progress_var.set(self._progress_text(p))
+            self.failures_var.set(self._failures_text())
+            self.stats_var.set(self._stats_text())
         finally:
-            self.process = None
-            self.root.after(0, self._finish_download)
+            self.root.after(PROGRESS_FRAME_MS, self._render_progress)
+
+    def _failures_text(self) -> str:
+        if self.failures is None:
+            return ""
+        n = len(self.failures)
+        if not n:
+            return ""
+        text = f"{n} item(s) stored"
+        next_due = self.failures.next_due() if self.queue.retry_mode else None
+        if next_due is not None:
+            text += f"  ·  next retry in {format_eta(max(0.0, next_due - time.time()))}"
+        return text
+
+    def _refresh_queue_view(self):
+        """rev が変わったジョブの行だけ更新する。"""
+        tree = self.queue_tree
+        if not tree:
+            return
+        jobs = self.queue.snapshot()
+        seen = set()
+        for job in jobs:
+            iid = str(job.id)
+            seen.add(iid)
+            if self._queue_revs.get(iid) == job.rev and job.state != JOB_RUNNING:
+                continue
+            self._queue_revs[iid] = job.rev
+            files = (f"{job.item_num}/{job.item_count}"
+                     if job.state == JOB_RUNNING and job.item_count else job.downloaded)
+            state = job.state
+            if job.partials and job.state != JOB_RUNNING:
+                state += " · partial"   # 書きかけのファイルが残っている（次回続きから）
+            values = (job.id, state, files, job.failed, job.retries,
+                      format_size(job.bytes + job.file_received) if job.started else "",
+                      job.speed, f"{int(job.elapsed)}s" if job.started else "", job.url)
+            if tree.exists(iid):
+                tree.item(iid, values=values, tags=(job.state,))
+            else:
+                tree.insert("", tk.END, iid=iid, values=values, tags=(job.state,))
+        for iid in set(self._queue_revs) - seen:
+            if tree.exists(iid):
+                tree.delete(iid)
+            del self._queue_revs[iid]
 
     def _finish_download(self):
-        self.progress_bar.stop()
-        self.start_btn.configure(state="normal")
-        self.stop_btn.configure(state="disabled")
-
-    def _update_all(self, line: str, tag: str, failed_item: Optional[str], stats: str):
-        self._log(line, tag)
-        if failed_item:
-            self._log_failed(failed_item)
-        self.stats_var.set(stats)
+        """実行中のジョブがなくなったときに Tk スレッドで呼ばれる。"""
+        if self.queue.running():
+            return
+        if self._bar_pulsing:
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate")
+            self._bar_pulsing = False
+        # 再試行の待ち時間中はまだ停止できるようにしておく
+        self.stop_btn.configure(state="normal" if self.queue.retry_mode else "disabled")
+        self.log_buffer.spill.flush()
+        self.failed_buffer.spill.flush()
+
+        c = self.queue.counts()
+        if self.queue.retry_mode:
+            self.status_var.set(f"Waiting to retry {len(self.failures)} failed item(s)")
+        elif c[JOB_QUEUED]:
+            self.status_var.set(f"Paused  —  {c[JOB_QUEUED]} queued")
+        elif c[JOB_FAILED]:
+            self.status_var.set(f"Done with errors ({c[JOB_FAILED]} failed job(s))")
+        elif c[JOB_STOPPED]:
+            self.status_var.set("Stopped")
+        elif c[JOB_DONE]:
+            self.status_var.set("Done")
+        if not c[JOB_QUEUED]:
+            self.progress_bar.configure(value=1000)
+        if self.notebook.index(self.notebook.select()) == 3:
+            self._refresh_archive_view()
+        self._queue_dirty = True
 
     # ログヘルパー
     # ──────────────────────────────────────────────
     def _log(self, message: str, tag: str = "info"):
-        if not self.log_text:
-            return
-        self.log_text.configure(state="normal")
-        self.log_text.insert(tk.END, message + "\n", tag)
-        self.log_text.see(tk.END)
-        self.log_text.configure(state="disabled")
+        """Tk スレッド用。読み取りスレッドの行と順序が入れ替わらないようシンク経由で流す。"""
+        if not self._log_sink.put(message, tag, block=False):
+            self._drain_log(reschedule=False, budget_ms=None)
+            self._log_sink.put(message, tag, block=False)
+
+    def _drain_log(self, reschedule: bool = True,
+                   budget_ms: Optional[float] = LOG_TICK_BUDGET_MS):
+        """シンクに溜まった行を 1 フレーム分まとめて描画する。
+
+        行はリングバッファに追加するだけで、ビューは表示範囲だけを
+        フレームごとに 1 回描き直す。``budget_ms`` を超えたら残りは次のフレームに回す。
+        """
+        started = time.perf_counter()
+        deadline = None if budget_ms is None else started + budget_ms / 1000.0
+        timed = self.metrics.enabled
+        if timed:
+            self._tk_backlog.observe(self._log_sink.pending())
+        drawn = 0
+        try:
+            wrote_log = False
+            wrote_failed = False
+            while True:
+                items = self._log_sink.drain(LOG_TICK_CHUNK)
+                if not items:
+                    break
+                drawn += len(items)
 
-    def _log_failed(self, message: str):
-        if not self.failed_text:
-            return
-        self.failed_text.configure(state="normal")
-        self.failed_text.insert(tk.END, message + "\n")
-        self.failed_text.see(tk.END)
-        self.failed_text.configure(state="disabled")
-        # アクティブでない場合はタブにマークを付ける
-        if self.notebook.index(self.notebook.select()) != 1:
-            self.notebook.tab(1, text="  ⚠ Failed Items  ")
+                self.log_buffer.extend((line, tag) for line, tag, _fi in items if line is not None)
+                failed = [(fi, "") for _line, _tag, fi in items if fi]
+                if failed:
+                    self.failed_buffer.extend(failed)
+                    wrote_failed = True
+                wrote_log = True
+
+                if len(items) < LOG_TICK_CHUNK:
+                    break
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+
+            if wrote_log and self.log_text:
+                self.log_text.refresh()
+            if wrote_failed:
+                if self.failed_text:
+                    self.failed_text.refresh()
+                # アクティブでない場合はタブにマークを付ける
+                if self.notebook.index(self.notebook.select()) != 1:
+                    self.notebook.tab(1, text="  ⚠ Failed Items  ")
+
+            # キュー表示は変更があったとき、または経過時間の更新のため 1 秒ごと
+            now = time.monotonic()
+            if self._queue_dirty or now - self._queue_refreshed >= 1.0:
+                self._queue_dirty = False
+                self._queue_refreshed = now
+                self._refresh_queue_view()
+        finally:
+            elapsed = time.perf_counter() - started
+            self.last_tick_ms = elapsed * 1000.0
+            if drawn:
+                self._tk_lines.inc(drawn)
+                if timed:
+                    self._tk_frame.observe(elapsed)
+            if reschedule:
+                self.root.after(LOG_FRAME_MS, self._drain_log)
 
     def _reset_log(self):
-        self.log_text.configure(state="normal")
-        self.log_text.delete("1.0", tk.END)
-        self.log_text.configure(state="disabled")
+        # 前回の実行でキューに残った行を先に描画してから消す
+        self._drain_log(reschedule=False, budget_ms=None)
+        self.log_text.clear()
 
     def _reset_failed(self):
-        self.failed_text.configure(state="normal")
-        self.failed_text.delete("1.0", tk.END)
-        self.failed_text.configure(state="disabled")
+        if self.failed_text:
+            self.failed_text.clear()
+        else:
+            self.failed_buffer.clear()     # タブがまだ作られていない
         self.notebook.tab(1, text="  Failed Items  ")
 
     def _clear_log(self):
@@ -819,7 +1718,7 @@ class GalleryDLApp:
         self._reset_failed()
 
     def _copy_failed(self):
-        content = self.failed_text.get("1.0", tk.END).strip()
+        content = self.failed_buffer.text().strip()
         if content:
             self.root.clipboard_clear()
             self.root.clipboard_append(content)
@@ -829,31 +1728,73 @@ class GalleryDLApp:
 
     def _on_tab_change(self, _event=None):
         # ユーザーが確認したときに失敗タブの通知マークをリセットする
-        if self.notebook.index(self.notebook.select()) == 1:
+        index = self.notebook.index(self.notebook.select())
+        self._ensure_tab(index)
+        if index == METRICS_TAB:
+            self.metrics.enable("tab")
+            if not self._metrics_refreshing:
+                self._refresh_metrics()
+        else:
+            self.metrics.disable("tab")
+        if index == 1:
             self.notebook.tab(1, text="  Failed Items  ")
+        elif index == 3:
+            self._refresh_archive_view()
+        elif index == 4 and not self._history_rows:
+            self._search_history()
 
     # その他
     # ──────────────────────────────────────────────
     def _paste_url(self):
         try:
             text = self.root.clipboard_get()
-            self.url_var.set(text.strip())
         except Exception:
-            pass
+            return
+        urls = split_urls(text)
+        if len(urls) > 1:
+            # 複数 URL はそのままキューへ
+            self._enqueue(urls)
+            self._log(f"Pasted {len(urls)} URLs into the queue. Press Start to run it.", "success")
+        else:
+            self.url_var.set(text.strip())
+
+    def _on_close(self):
+        if self.api is not None:
+            self.api.stop()
+        for watcher in (self.cookie_watcher, self.json_watcher):
+            if watcher is not None:
+                watcher.stop()
+        self.queue.shutdown()
+        # 起動の途中で閉じたときは、まだ開いていない部品がある
+        for store in (self.queue.dedup, self.queue.history):
+            if store is not None:
+                store.close()
+        if self.cookie_jars is not None:
+            self.cookie_jars.sync()
+        self.log_buffer.spill.close()
+        self.failed_buffer.spill.close()
+        self.root.destroy()
 
     def _open_folder(self, folder: str):
         path = os.path.abspath(folder)
         os.makedirs(path, exist_ok=True)
+        self._open_path(path)
+
+    def _open_path(self, path: str):
         try:
             if os.name == "nt":
                 os.startfile(path)
             else:
+                import subprocess
                 subprocess.Popen(["open", path])
         except Exception as e:
-            self._log(f"Could not open folder: {e}", "error")
+            self._log(f"Could not open {path}: {e}", "error")
 
 
 if __name__ == "__main__":
+    # クッキー変換のプロセスプールが exe 自身を子プロセスとして起動するため
+    import multiprocessing
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = GalleryDLApp(root)
     root.mainloop()
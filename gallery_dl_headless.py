@@ -0,0 +1,463 @@
+"""
+gallery_dl_headless.py
+Tk を使わないコマンドライン / 常駐実行。
+
+  python gallery_dl_headless.py urls.txt [--stats stats.json] [--workers N] ...
+  python gallery_dl_gui.py --headless urls.txt ...      （同じもの）
+
+GUI と同じ JobQueue（並列実行・サイトごとの抑制・停止検知・途中ファイルからの
+再開・ダウンロードアーカイブ・失敗アイテムの記録）をそのまま使う。ログは標準
+エラー出力に流し、終了時にジョブごとの結果と合計を JSON で書き出す（既定は
+標準出力）。--watch を付けると URL リストを一定間隔で読み直し、新しく増えた
+URL を投入し続ける。--api を付けるとローカル制御 API（gallery_dl_api.py）も開き、
+中断されるまで API から投入されたジョブを処理し続ける。--metrics を付けると
+1 行ごとの処理時間も記録し、統計と同じタイミングでメトリクスを書き出す
+（.json なら JSON、それ以外は Prometheus のテキスト形式）。--record を付けると
+gallery-dl の出力を時刻付きで記録する（benchmark.py replay で再生できる）。tkinter は import
+しないので、ディスプレイのない Linux サーバーや cron からでも動く。
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Optional, List, Dict, Any, Set
+
+from gallery_dl_parser import LineEvent
+from gallery_dl_archive import ArchiveIndex
+from gallery_dl_failures import FailureStore
+from gallery_dl_api import ApiServer, load_api_settings, DEFAULT_PORT
+from gallery_dl_cookies import CookieJarCache
+from gallery_dl_dedup import DedupIndex, DEDUP_MODES, DEDUP_OFF
+from gallery_dl_disk import DiskMonitor, DISK_OK, parse_size
+from gallery_dl_history import HistoryStore
+from gallery_dl_metrics import Metrics
+from gallery_dl_engine import (
+    Job, JobQueue, app_dir, build_gallery_dl_args, split_urls,
+    format_size, format_speed, format_eta, DEFAULT_WORKERS, MAX_WORKERS, TIMEOUT_SECONDS,
+    JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_STOPPED,
+)
+from gallery_dl_throttle import DEFAULT_PER_HOST, MAX_PER_HOST
+from gallery_dl_profiles import ProfileStore, PROFILES_FILE
+
+STATS_VERSION   = 1
+DEFAULT_RETRIES = 10      # GUI の MAX_RETRIES と同じ
+STATUS_INTERVAL = 10.0    # 進捗行を出す間隔（秒）
+
+_TAG_PREFIX = {"error": "E ", "warning": "W ", "success": "  ", "accent": "  ",
+               "info": "  ", "dim": "  "}
+
+
+def read_url_file(path: str) -> List[str]:
+    """URL リストを読む（"-" なら標準入力）。空行と # で始まる行は無視する。"""
+    if path == "-":
+        return split_urls(sys.stdin.read())
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return split_urls(f.read())
+
+
+def job_stats(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id, "url": job.url, "state": job.state,
+        "downloaded": job.downloaded, "skipped": job.skipped, "failed": job.failed,
+        "retries": job.retries, "bytes": job.bytes, "resumes": job.resumes,
+        "elapsed": round(job.elapsed, 3), "exit_code": job.exit_code, "error": job.error,
+    }
+
+
+class HeadlessRunner:
+    """JobQueue のコールバックを標準エラー出力と統計 JSON につなぐ。"""
+
+    def __init__(self, opts: argparse.Namespace):
+        self.opts = opts
+        self.config_path = os.path.abspath(opts.config)
+        self.cookie_dir = os.path.abspath(opts.cookie_dir)
+        self.directory = os.path.abspath(opts.directory) if opts.directory else None
+        self.cookie_jars = None if opts.full_cookies else CookieJarCache(self.cookie_dir)
+        self.profiles = None if opts.no_profiles else ProfileStore(opts.profiles)
+        os.makedirs(opts.state_dir, exist_ok=True)
+
+        self.failures = FailureStore(os.path.join(opts.state_dir, "headless-failures.json"),
+                                     self.cookie_dir)
+        self.failures.load()
+        self.metrics = Metrics()
+        if opts.metrics:
+            self.metrics.enable("headless")
+        self.queue = JobQueue(
+            os.path.join(opts.state_dir, "headless-queue.json"),
+            build_args=self._build_args,
+            on_event=self._on_event,
+            on_message=self._on_message,
+            on_state=self._on_state,
+            on_idle=self._on_idle,
+            workers=opts.workers,
+            archive=ArchiveIndex(opts.archive_dir),
+            failures=self.failures,
+            dedup=DedupIndex(os.path.join(opts.state_dir, "headless-dedup.sqlite3"),
+                             self.directory or base_directory(self.config_path)),
+            # GUI と同じ名前なので、既定の --state-dir では GUI の History タブで検索できる
+            history=HistoryStore(os.path.join(opts.state_dir, "history.sqlite3")),
+            disk=DiskMonitor(self.directory or base_directory(self.config_path)),
+            metrics=self.metrics,
+            profiles=self.profiles,
+        )
+        self._idle = threading.Event()
+        self._out_lock = threading.Lock()
+        self._interrupted = False
+        self.started = time.time()
+        self.seen: Set[str] = set()          # 投入済みの URL（--watch で重複させない）
+        self.run_ids: Set[int] = set()       # この実行で扱ったジョブの ID
+        self.api: Optional[ApiServer] = None
+
+    # コールバック（ワーカースレッドから呼ばれる）
+    # ──────────────────────────────────────────────
+    def _build_args(self, job: Job) -> List[str]:
+        args = build_gallery_dl_args(job, self.config_path, self.cookie_dir, self.opts.retries,
+                                     self.cookie_jars, self.profiles)
+        if self.directory:
+            args = ["--directory", self.directory] + args
+        return args
+
+    def _write(self, text: str, tag: str = "info", job: Optional[Job] = None):
+        if self.opts.quiet and tag not in ("error", "warning"):
+            return
+        prefix = _TAG_PREFIX.get(tag, "  ")
+        if job is not None:
+            prefix += f"[{job.id}] "
+        with self._out_lock:
+            sys.stderr.write(prefix + text + "\n")
+            sys.stderr.flush()
+
+    def _on_event(self, job: Job, ev: LineEvent):
+        if ev.failed_item:
+            self._write(f"FAILED {ev.failed_item}", "error", job)
+        elif ev.text is not None:
+            self._write(ev.text, ev.tag, job)
+
+    def _on_message(self, job: Optional[Job], text: str, tag: str):
+        if self.api is not None:
+            self.api.message(job, text, tag)
+        self._write(text, tag, job)
+
+    def _on_state(self, job: Job):
+        if self.api is not None:
+            self.api.job_changed(job)
+
+    def _on_idle(self):
+        self._idle.set()
+
+    # 実行
+    # ──────────────────────────────────────────────
+    def enqueue(self, urls: List[str]) -> List[Job]:
+        new = []
+        for url in urls:
+            if url not in self.seen:
+                self.seen.add(url)
+                new.append(url)
+        if not new:
+            return []
+        jobs = self.queue.add(new, self.opts.cookie)
+        self.run_ids.update(j.id for j in jobs)
+        self._write(f"Queued {len(jobs)} URL(s).", "accent")
+        return jobs
+
+    def interrupt(self, *_args):
+        """SIGINT / SIGTERM: 実行中のジョブを止め（途中ファイルは残す）、統計を書いて終わる。"""
+        if self._interrupted:
+            return
+        self._interrupted = True
+        self._write("Interrupted — stopping running jobs…", "warning")
+        threading.Thread(target=self.queue.stop_all, args=("シグナルによる停止",), daemon=True).start()
+
+    def _status_line(self) -> str:
+        p = self.queue.progress()
+        c = self.queue.counts()
+        parts = [f"Jobs {p['batch_done']}/{p['batch_total']}",
+                 f"{c[JOB_RUNNING]} running", f"{p['files']} files"]
+        if p["bytes"]:
+            parts.append(format_size(p["bytes"]))
+        if p["running"]:
+            parts.append(format_speed(p["rate"]))
+            if p["eta"] is not None:
+                parts.append(f"ETA {format_eta(p['eta'])}")
+        disk = p["disk"]
+        if disk:
+            parts.append(f"disk {format_size(disk['free'])} free, {format_speed(disk['write_rate'])} write"
+                         + (f" ({disk['state']})" if disk["state"] != DISK_OK else ""))
+        return "  ·  ".join(parts)
+
+    def _wait_idle(self):
+        """キューが空になるまで待つ（再試行モード中は次の回も待つ）。"""
+        last_status = time.monotonic()
+        while True:
+            if self._idle.wait(1.0):
+                self._idle.clear()
+                if self._interrupted or not self.queue.retry_mode:
+                    if not self.queue.running():
+                        return
+            if self._interrupted and not self.queue.running():
+                return
+            now = time.monotonic()
+            if now - last_status >= STATUS_INTERVAL:
+                last_status = now
+                self._write(self._status_line(), "dim")
+
+    def _retry_failed(self):
+        """失敗アイテムを間隔を空けて再試行する（上限に達するか全部取れるまで）。"""
+        if self._interrupted or not len(self.failures):
+            return
+        self._write(f"Retrying {len(self.failures)} failed item(s)…", "accent")
+        self._idle.clear()
+        self.queue.retry_mode = True
+        job = self.queue.retry_failed()
+        if job is not None:
+            self.run_ids.add(job.id)
+        else:
+            self.queue.schedule_retry()
+        self._wait_idle()
+
+    def stats(self) -> Dict[str, Any]:
+        # 前回から引き継いだジョブと、この実行で追加されたジョブ（自動再試行を含む）
+        jobs = [j for j in self.queue.snapshot() if j.id in self.run_ids or j.added >= self.started]
+        elapsed = time.time() - self.started
+        total_bytes = sum(j.bytes for j in jobs)
+        states = {s: 0 for s in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_STOPPED)}
+        disk = self.queue.disk.latest
+        for j in jobs:
+            states[j.state] += 1
+        return {
+            "version": STATS_VERSION,
+            "started": self.started,
+            "finished": time.time(),
+            "elapsed": round(elapsed, 3),
+            "interrupted": self._interrupted,
+            "totals": {
+                "jobs": len(jobs),
+                **states,
+                "downloaded": sum(j.downloaded for j in jobs),
+                "skipped": sum(j.skipped for j in jobs),
+                "failed_items": sum(j.failed for j in jobs),
+                "retries": sum(j.retries for j in jobs),
+                "bytes": total_bytes,
+                "bytes_per_second": round(total_bytes / elapsed, 1) if elapsed > 0 else 0.0,
+            },
+            "failures_stored": len(self.failures),
+            **({"dedup": self.queue.dedup.stats()._asdict()}
+               if self.queue.dedup.mode != DEDUP_OFF else {}),
+            **({"disk": {**disk._asdict(), "reserve": self.queue.disk.reserve,
+                         "written": self.queue.disk.written}}
+               if disk is not None else {}),
+            "jobs": [job_stats(j) for j in jobs],
+        }
+
+    def write_stats(self):
+        if self.opts.metrics:
+            try:
+                self.metrics.write(self.opts.metrics)
+            except OSError as e:
+                self._write(f"Could not write metrics: {e}", "error")
+        stats = self.stats()
+        path = self.opts.stats
+        if path == "-":
+            # 標準出力には 1 行 1 オブジェクト（--watch では実行のたびに 1 行増える）
+            with self._out_lock:
+                sys.stdout.write(json.dumps(stats, ensure_ascii=False) + "\n")
+                sys.stdout.flush()
+            return
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(stats, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, path)
+        except OSError as e:
+            self._write(f"Could not write stats: {e}", "error")
+
+    def run(self) -> int:
+        opts = self.opts
+        q = self.queue
+        q.load()
+        # 前回の実行で終わったジョブは捨て、途中のもの（待機中・途中ファイルあり）は続ける
+        q.clear_finished()
+        leftover = [j for j in q.snapshot() if not j.input_file]
+        self.run_ids.update(j.id for j in leftover)
+        self.seen.update(j.url for j in leftover)
+        if leftover:
+            self._write(f"Resuming {len(leftover)} job(s) from the previous run.", "accent")
+        q.set_workers(opts.workers)
+        q.set_per_host(opts.per_site)
+        q.set_archive(not opts.no_archive)
+        q.timeout_seconds = opts.timeout
+        q.set_dedup(opts.dedup)
+        if opts.min_free is not None:
+            q.set_min_free(opts.min_free)
+        q.set_record(os.path.abspath(opts.record) if opts.record else None)
+        if opts.prewarm:
+            q.set_prewarm(True)
+        if self.profiles is not None:
+            names = [p.name for p in self.profiles.profiles()]
+            if self.profiles.error:
+                self._write(f"Site profiles: {self.profiles.error}", "error")
+            elif names:
+                self._write(f"Site profiles: {', '.join(names)}", "dim")
+
+        if opts.api is not None:
+            settings = load_api_settings(os.path.join(opts.state_dir, "api.json"))
+            api = ApiServer(q, opts.api, settings["token"], cookie_dir=self.cookie_dir)
+            try:
+                api.start()
+            except OSError as e:
+                self._write(f"Could not start the local API on port {opts.api}: {e}", "error")
+                return 2
+            self.api = api
+            self._write(f"Local API listening on {api.url}  "
+                        f"(token in {os.path.join(opts.state_dir, 'api.json')})", "accent")
+
+        if opts.reindex:
+            self._write(f"Re-indexing {q.dedup.root} …", "accent")
+            r = q.dedup.reindex()
+            self._write(f"Re-indexed {r.scanned:,} files ({r.hashed:,} hashed, "
+                        f"{r.removed:,} removed) in {r.seconds:.1f}s", "success")
+            if not opts.urls and self.api is None:
+                return 0
+
+        if opts.urls:
+            try:
+                self.enqueue(read_url_file(opts.urls))
+            except OSError as e:
+                self._write(f"Could not read URL list: {e}", "error")
+                return 2
+        if not self.run_ids and self.api is None:
+            self._write("No URLs to download.", "warning")
+            self.write_stats()
+            return 0
+
+        try:
+            self._idle.clear()
+            q.start()
+            self._wait_idle()
+            if opts.retry_failed:
+                self._retry_failed()
+            # --watch / --api: 中断されるまで続ける
+            while (opts.watch or self.api is not None) and not self._interrupted:
+                self.write_stats()
+                deadline = time.monotonic() + (opts.watch or STATUS_INTERVAL)
+                while time.monotonic() < deadline and not self._interrupted:
+                    time.sleep(0.5)
+                if self._interrupted or not (opts.watch and opts.urls):
+                    continue
+                try:
+                    jobs = self.enqueue(read_url_file(opts.urls))
+                except OSError as e:
+                    self._write(f"Could not read URL list: {e}", "error")
+                    continue
+                if jobs:
+                    self._idle.clear()
+                    q.start()
+                    self._wait_idle()
+                    if opts.retry_failed:
+                        self._retry_failed()
+        finally:
+            if self.api is not None:
+                self.api.stop()
+            q.shutdown()
+            q.save()
+            q.dedup.close()
+            q.history.close()
+            self.failures.save()
+            if self.cookie_jars is not None:
+                self.cookie_jars.sync()
+
+        stats = self.stats()
+        t = stats["totals"]
+        self._write(f"Finished: {t['done']} done, {t['failed']} failed, {t['stopped']} stopped  ·  "
+                    f"{t['downloaded']} files, {format_size(t['bytes'])}, "
+                    f"{t['failed_items']} failed item(s)", "accent")
+        self.write_stats()
+        if self._interrupted:
+            return 130
+        return 1 if t["failed"] or t["stopped"] or t["queued"] else 0
+
+
+def base_directory(config_path: str) -> str:
+    """設定ファイルの extractor.base-directory（gallery-dl と同じくカレントからの相対）。"""
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            base = json.load(f).get("extractor", {}).get("base-directory")
+    except (OSError, ValueError, AttributeError):
+        base = None
+    return os.path.abspath(os.path.expanduser(base or "gallery-dl"))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    base = app_dir()
+    p = argparse.ArgumentParser(
+        prog="gallery_dl_headless",
+        description="Run the GalleryDL-GUI download queue without a window.")
+    p.add_argument("urls", nargs="?",
+                   help="URL list file, one or more URLs per line ('-' for stdin)")
+    p.add_argument("--stats", default="-", metavar="PATH",
+                   help="write JSON stats to PATH ('-' for stdout, the default)")
+    p.add_argument("--metrics", metavar="PATH",
+                   help="record per-line timings and write metrics to PATH with the stats "
+                        "(JSON if PATH ends in .json, Prometheus text format otherwise)")
+    p.add_argument("--record", metavar="DIR",
+                   help="save each job's raw gallery-dl output with timestamps to DIR "
+                        "(replay with: benchmark.py replay DIR/*.jsonl)")
+    p.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                   help=f"concurrent gallery-dl processes (1-{MAX_WORKERS}, default {DEFAULT_WORKERS})")
+    p.add_argument("--per-site", type=int, default=DEFAULT_PER_HOST,
+                   help=f"concurrent jobs per site (1-{MAX_PER_HOST}, default {DEFAULT_PER_HOST})")
+    p.add_argument("--cookie", metavar="NAME", help="cookie file name in the cookie directory")
+    p.add_argument("--cookie-dir", default=os.path.join(base, "cookies"), metavar="DIR")
+    p.add_argument("--config", default=os.path.join(base, "gallery-dl.conf"), metavar="PATH",
+                   help="gallery-dl config file")
+    p.add_argument("--profiles", default=os.path.join(base, PROFILES_FILE), metavar="PATH",
+                   help="per-site profiles merged into the config for matching URLs")
+    p.add_argument("--no-profiles", action="store_true", help="ignore the per-site profiles")
+    p.add_argument("-d", "--directory", metavar="DIR",
+                   help="download directory (default: base-directory from the config)")
+    p.add_argument("--archive-dir", default=os.path.join(base, "archives"), metavar="DIR")
+    p.add_argument("--no-archive", action="store_true", help="do not use the download archive")
+    p.add_argument("--full-cookies", action="store_true",
+                   help="pass the whole cookie file instead of only the target site's cookies")
+    p.add_argument("--min-free", type=parse_size, metavar="SIZE",
+                   help="do not start jobs while the download volume has less than SIZE free "
+                        "(e.g. 512M, 2G; default: the saved setting, 1G)")
+    p.add_argument("--dedup", choices=DEDUP_MODES, default=DEDUP_OFF,
+                   help="what to do with downloaded files whose content already exists: "
+                        "keep them (off), replace them with a hardlink, or delete them (skip)")
+    p.add_argument("--reindex", action="store_true",
+                   help="hash the whole download directory into the duplicate index first")
+    p.add_argument("--state-dir", default=base, metavar="DIR",
+                   help="where the headless queue and failure store are kept")
+    p.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    p.add_argument("--timeout", type=float, default=TIMEOUT_SECONDS,
+                   help="stall timeout before per-host estimates exist (seconds)")
+    p.add_argument("--retry-failed", action="store_true",
+                   help="after the batch, retry failed items with growing intervals")
+    p.add_argument("--watch", type=float, default=0, metavar="SECONDS",
+                   help="keep running and re-read the URL list every SECONDS")
+    p.add_argument("--api", type=int, nargs="?", const=DEFAULT_PORT, metavar="PORT",
+                   help=f"serve the local control API on 127.0.0.1:PORT (default {DEFAULT_PORT}) "
+                        f"and keep running until interrupted")
+    p.add_argument("--prewarm", action="store_true", help="keep pre-warmed worker processes")
+    p.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+    return p
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    opts = parser.parse_args(argv)
+    if not opts.urls and opts.api is None and not opts.reindex:
+        parser.error("a URL list file is required unless --api or --reindex is given")
+    runner = HeadlessRunner(opts)
+    signal.signal(signal.SIGINT, runner.interrupt)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, runner.interrupt)
+    return runner.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
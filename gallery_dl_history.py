@@ -0,0 +1,251 @@
+"""
+gallery_dl_history.py
+ダウンロード履歴の SQLite データベース（history.sqlite3）。
+
+ログタブは次の実行で消えるので、ジョブごとのファイル（パス・サイズ・所要時間・
+アイテムの URL・元のギャラリー URL）と失敗、ジョブ自体の結果をここに残す。
+  - 書き込みは専用スレッドでまとめて 1 トランザクションにする（追記のみ、WAL）
+  - URL・サイト・時刻に索引を張り、パスと URL は FTS5 の全文索引にも入れる
+  - 検索はキーセット方式のページング（id の範囲 + LIMIT）なので、何百万行あっても
+    1 ページぶんしか読まない
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Tuple, Any, NamedTuple
+
+from gallery_dl_throttle import site_of
+
+PAGE_SIZE      = 200
+FLUSH_SECONDS  = 1.0         # 書き込みスレッドがまとめて書く間隔
+FLUSH_ROWS     = 1000        # これだけたまったら間隔を待たずに書く
+
+KIND_DONE  = "done"
+KIND_ERROR = "error"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    site TEXT NOT NULL,
+    source TEXT NOT NULL,
+    url TEXT,
+    path TEXT,
+    size INTEGER,
+    duration REAL,
+    message TEXT,
+    job INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_time   ON files (time);
+CREATE INDEX IF NOT EXISTS files_site   ON files (site);
+CREATE INDEX IF NOT EXISTS files_kind   ON files (kind);
+CREATE INDEX IF NOT EXISTS files_url    ON files (url);
+CREATE INDEX IF NOT EXISTS files_source ON files (source);
+CREATE TABLE IF NOT EXISTS sites (site TEXT PRIMARY KEY, files INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS jobs (
+    started REAL NOT NULL,
+    job INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    site TEXT NOT NULL,
+    cookie TEXT,
+    state TEXT NOT NULL,
+    finished REAL,
+    downloaded INTEGER,
+    skipped INTEGER,
+    failed INTEGER,
+    bytes INTEGER,
+    exit_code INTEGER,
+    error TEXT,
+    PRIMARY KEY (started, job)
+);
+CREATE INDEX IF NOT EXISTS jobs_url ON jobs (url);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    path, url, source, content='files', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, path, url, source) VALUES (new.id, new.path, new.url, new.source);
+END;
+"""
+
+
+class HistoryRow(NamedTuple):
+    id: int
+    time: float
+    kind: str
+    site: str
+    source: str
+    url: Optional[str]
+    path: Optional[str]
+    size: Optional[int]
+    duration: Optional[float]
+    message: Optional[str]
+    job: Optional[int]
+
+
+class HistoryStore:
+    """履歴の追記と検索。追記はどのスレッドからでもよい（書き込みは専用スレッド）。"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.fts = False             # FTS5 が使えるか（使えなければ LIKE で探す）
+        self._queue: "queue.Queue[Optional[Tuple[str, tuple]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._reader: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        con = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.executescript(_SCHEMA)
+        try:
+            con.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False         # FTS5 なしでビルドされた sqlite3
+        con.commit()
+        return con
+
+    # 追記
+    # ──────────────────────────────────────────────
+    def add_file(self, kind: str, source: str, url: Optional[str], path: Optional[str],
+                 size: Optional[int] = None, duration: Optional[float] = None,
+                 message: Optional[str] = None, job: Optional[int] = None):
+        self._put("file", (time.time(), kind, site_of(source), source, url, path,
+                           size, duration, message, job))
+
+    def add_job(self, started: float, job: int, url: str, cookie: Optional[str], state: str,
+                finished: Optional[float], downloaded: int, skipped: int, failed: int,
+                nbytes: int, exit_code: Optional[int], error: Optional[str]):
+        self._put("job", (started, job, url, site_of(url), cookie, state, finished,
+                          downloaded, skipped, failed, nbytes, exit_code, error))
+
+    def _put(self, kind: str, row: tuple):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="history", daemon=True)
+                    self._thread.start()
+        self._queue.put((kind, row))
+
+    def _run(self):
+        con = self._connect()
+        stop = False
+        while not stop:
+            batch: List[Tuple[str, tuple]] = []
+            deadline = time.monotonic() + FLUSH_SECONDS
+            while len(batch) < FLUSH_ROWS:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(con, batch)
+                except sqlite3.Error:
+                    pass             # 履歴が書けなくてもダウンロードは続ける
+        con.close()
+
+    @staticmethod
+    def _write(con: sqlite3.Connection, batch: List[Tuple[str, tuple]]):
+        files = [row for kind, row in batch if kind == "file"]
+        jobs = [row for kind, row in batch if kind == "job"]
+        with con:
+            if files:
+                con.executemany("INSERT INTO files (time, kind, site, source, url, path, size, "
+                                "duration, message, job) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", files)
+                counts: dict = {}
+                for row in files:
+                    counts[row[2]] = counts.get(row[2], 0) + 1
+                con.executemany("INSERT INTO sites VALUES (?, ?) ON CONFLICT(site) "
+                                "DO UPDATE SET files = files + excluded.files", counts.items())
+            if jobs:
+                con.executemany("INSERT OR REPLACE INTO jobs VALUES "
+                                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", jobs)
+
+    def close(self):
+        """たまっている行を書き終えてから止める。"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=30.0)
+            self._thread = None
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    # 検索（Tk スレッド以外から呼ぶ）
+    # ──────────────────────────────────────────────
+    def _read(self) -> sqlite3.Connection:
+        if self._reader is None:
+            self._reader = self._connect()
+        return self._reader
+
+    def search(self, text: str = "", site: Optional[str] = None, kind: Optional[str] = None,
+               since: Optional[float] = None, before: Optional[int] = None,
+               after: Optional[int] = None, limit: int = PAGE_SIZE) -> List[HistoryRow]:
+        """新しい順に 1 ページぶん返す。
+
+        ``before`` は前のページの最後の id（より古いページ）、``after`` は最初の id
+        （より新しいページ）。``text`` の語はそれぞれ前方一致でパス・URL から探す。
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        terms = text.split()
+        with self._lock:
+            con = self._read()
+            use_fts = self.fts and bool(terms)
+            rowid = "files_fts.rowid" if use_fts else "f.id"
+            if use_fts:
+                # "語"* の並び = すべての語を前方一致で含む
+                where.append("files_fts MATCH ?")
+                params.append(" ".join('"' + t.replace('"', '""') + '"*' for t in terms))
+            else:
+                for t in terms:
+                    like = "%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    where.append("(f.path LIKE ? ESCAPE '\\' OR f.url LIKE ? ESCAPE '\\' "
+                                 "OR f.source LIKE ? ESCAPE '\\')")
+                    params += [like, like, like]
+            for column, value in (("f.site", site), ("f.kind", kind)):
+                if value:
+                    where.append(f"{column} = ?")
+                    params.append(value)
+            if since is not None:
+                where.append("f.time >= ?")
+                params.append(since)
+            if before is not None:
+                where.append(f"{rowid} < ?")
+                params.append(before)
+            if after is not None:
+                where.append(f"{rowid} > ?")
+                params.append(after)
+            # 新しいページへ戻るときは id の昇順で取ってから並べ直す
+            order = "ASC" if after is not None and before is None else "DESC"
+            source = ("files_fts JOIN files f ON f.id = files_fts.rowid" if use_fts else "files f")
+            sql = (f"SELECT f.id, f.time, f.kind, f.site, f.source, f.url, f.path, f.size, "
+                   f"f.duration, f.message, f.job FROM {source}"
+                   + (" WHERE " + " AND ".join(where) if where else "")
+                   + f" ORDER BY {rowid} {order} LIMIT ?")
+            rows = [HistoryRow(*r) for r in con.execute(sql, params + [limit])]
+        if order == "ASC":
+            rows.reverse()
+        return rows
+
+    def sites(self) -> List[Tuple[str, int]]:
+        """履歴にあるサイトとファイル数（多い順）。"""
+        with self._lock:
+            return list(self._read().execute("SELECT site, files FROM sites ORDER BY files DESC"))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._read().execute("SELECT COALESCE(SUM(files), 0) FROM sites").fetchone()[0]
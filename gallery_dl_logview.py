@@ -0,0 +1,260 @@
+"""
+gallery_dl_logview.py
+ログ表示用のリングバッファと仮想化ビュー。
+
+Tk の Text ウィジェットは挿入した行をすべて B-tree に保持し続けるため、長時間の
+実行ではメモリと描画コストが増え続ける。ここでは
+  - LogBuffer        : 直近 N 行だけをメモリに保持し、全履歴はローテーションする
+                       ファイルへ書き出す（スピルオーバー）
+  - VirtualLogView   : 画面に見えている行だけを Text に描画するビュー
+に分けて、実行時間に関係なくメモリ使用量を一定に保つ。
+"""
+import os
+import tkinter as tk
+from tkinter import ttk
+from tkinter import font as tkfont
+from collections import deque
+from itertools import islice
+from typing import Optional, List, Tuple, Iterable, Any
+
+LOG_RING_LINES     = 50000            # メモリに保持する行数
+LOG_SPILL_BYTES    = 8 * 1024 * 1024  # 1 ファイルあたりの上限
+LOG_SPILL_BACKUPS  = 5                # ローテーションで残す世代数
+
+LogLine = Tuple[str, str]   # (テキスト, タグ)
+
+
+class LogSpill:
+    """行をファイルへ追記し、サイズ上限でローテーションする（logging の RotatingFileHandler 相当）。"""
+
+    def __init__(self, path: str, max_bytes: int = LOG_SPILL_BYTES,
+                 backups: int = LOG_SPILL_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._fh: Any = None
+        self._size = 0
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._fh = open(self.path, "a", encoding="utf-8", newline="\n")
+        self._size = self._fh.tell()
+
+    def _rotate(self):
+        self.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if os.path.exists(self.path):
+            if self.backups > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+        self._open()
+
+    def write(self, text: str):
+        if not text:
+            return
+        try:
+            if self._fh is None:
+                self._open()
+            size = len(text.encode("utf-8"))
+            if self._size and self._size + size > self.max_bytes:
+                self._rotate()
+            self._fh.write(text)
+            self._size += size
+        except OSError:
+            # ディスクエラーで UI を止めない。表示側のリングバッファは生きている
+            self.close()
+
+    def flush(self):
+        if self._fh is not None:
+            try:
+                self._fh.flush()
+            except OSError:
+                pass
+
+    def close(self):
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            except OSError:
+                pass
+            self._fh = None
+
+
+class LogBuffer:
+    """固定長のリングバッファ。あふれた行はメモリから消えるがスピルファイルには残る。"""
+
+    def __init__(self, capacity: int = LOG_RING_LINES, spill: Optional[LogSpill] = None):
+        self._lines: "deque[LogLine]" = deque(maxlen=capacity)
+        self.capacity = capacity
+        self.spill = spill
+        self.total = 0      # これまでに追加された行数（破棄分も含む）
+        self.version = 0    # 内容が変わるたびに増える（ビューの再描画判定用）
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    @property
+    def dropped(self) -> int:
+        """メモリから押し出された行数。"""
+        return self.total - len(self._lines)
+
+    def extend(self, items: Iterable[LogLine]):
+        items = list(items)
+        if not items:
+            return
+        self._lines.extend(items)
+        self.total += len(items)
+        self.version += 1
+        if self.spill is not None:
+            self.spill.write("".join(text + "\n" for text, _tag in items))
+
+    def clear(self):
+        self._lines.clear()
+        self.total = 0
+        self.version += 1
+
+    def slice(self, start: int, stop: int) -> List[LogLine]:
+        start = max(0, start)
+        stop = min(len(self._lines), stop)
+        if start >= stop:
+            return []
+        # deque のランダムアクセスは O(n) なので、近い側の端から islice で切り出す
+        lines = self._lines
+        n = len(lines)
+        if start > n - stop:
+            out = list(islice(reversed(lines), n - stop, n - start))
+            out.reverse()
+            return out
+        return list(islice(lines, start, stop))
+
+    def text(self) -> str:
+        return "".join(text + "\n" for text, _tag in self._lines)
+
+
+class VirtualLogView(ttk.Frame):
+    """LogBuffer のうち画面に見えている行だけを描画する読み取り専用ビュー。
+
+    Text ウィジェットには常に表示行数ぶんしか入らないので、バッファが何行あっても
+    描画コストとウィジェットのメモリは一定。末尾を表示している間は自動で追従する。
+    """
+
+    def __init__(self, master, buffer: LogBuffer, **text_kw):
+        super().__init__(master)
+        self.buffer = buffer
+        self._top = 0            # 表示中の先頭行（バッファ内インデックス）
+        self._anchor = 0         # 追従していないときの先頭行（通算の行番号）
+        self._rows = 1
+        self._follow = True      # 末尾に追従中か
+        self._rendered: Tuple[int, int, int] = (-1, -1, -1)
+
+        text_kw.setdefault("wrap", "none")
+        text_kw.setdefault("state", "disabled")
+        self.text = tk.Text(self, **text_kw)
+        self.vbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.vbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self._linespace = tkfont.Font(font=self.text.cget("font")).metrics("linespace") or 1
+
+        self.text.bind("<Configure>", self._on_configure)
+        self.text.bind("<MouseWheel>", self._on_wheel)
+        self.text.bind("<Button-4>", lambda _e: self._scroll_lines(-3) or "break")
+        self.text.bind("<Button-5>", lambda _e: self._scroll_lines(3) or "break")
+        self.text.bind("<Prior>", lambda _e: self._scroll_lines(-self._rows) or "break")
+        self.text.bind("<Next>", lambda _e: self._scroll_lines(self._rows) or "break")
+        self.text.bind("<Control-Home>", lambda _e: self._scroll_to(0) or "break")
+        self.text.bind("<Control-End>", lambda _e: self._scroll_to_end() or "break")
+
+    # Text 互換の最低限の API
+    def tag_configure(self, tag: str, **kw):
+        self.text.tag_configure(tag, **kw)
+
+    def clear(self):
+        self.buffer.clear()
+        self._top = 0
+        self._follow = True
+        self.refresh()
+
+    # 描画
+    def refresh(self):
+        """必要なら表示範囲を再描画する。1 フレームに 1 回呼ばれる想定。"""
+        n = len(self.buffer)
+        max_top = max(0, n - self._rows)
+        if self._follow:
+            self._top = max_top
+        else:
+            # リングバッファからあふれた分だけインデックスがずれるので、通算の行番号で位置を保つ
+            self._top = max(0, min(self._anchor - self.buffer.dropped, max_top))
+
+        key = (self.buffer.version, self._top, self._rows)
+        if key == self._rendered:
+            return
+        self._rendered = key
+
+        args: List[str] = []
+        run: List[str] = []
+        run_tag: Optional[str] = None
+        for line, tag in self.buffer.slice(self._top, self._top + self._rows):
+            if tag != run_tag:
+                if run:
+                    args += ("".join(run), run_tag)
+                run, run_tag = [], tag
+            run.append(line + "\n")
+        if run:
+            args += ("".join(run), run_tag)
+
+        self.text.configure(state="normal")
+        self.text.delete("1.0", tk.END)
+        if args:
+            self.text.insert("1.0", *args)
+        self.text.configure(state="disabled")
+
+        if n:
+            self.vbar.set(self._top / n, min(1.0, (self._top + self._rows) / n))
+        else:
+            self.vbar.set(0.0, 1.0)
+
+    # スクロール
+    def _scroll_to(self, top: int):
+        max_top = max(0, len(self.buffer) - self._rows)
+        self._top = max(0, min(int(top), max_top))
+        self._anchor = self._top + self.buffer.dropped
+        self._follow = self._top >= max_top
+        self.refresh()
+
+    def _scroll_to_end(self):
+        self._follow = True
+        self.refresh()
+
+    def _scroll_lines(self, delta: int):
+        self._scroll_to(self._top + delta)
+
+    def _on_scrollbar(self, *args):
+        if not args:
+            return
+        if args[0] == "moveto":
+            self._scroll_to(float(args[1]) * len(self.buffer))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if len(args) > 2 and args[2] == "pages":
+                step *= self._rows
+            self._scroll_lines(step)
+
+    def _on_wheel(self, event):
+        # Windows は 1 ノッチ = 120。macOS（とタッチパッド）は ±1〜±10 程度の小さな値が
+        # 続けて届くので、120 未満は向きだけを見て 1 ノッチとして扱う
+        delta = event.delta
+        if delta:
+            notches = int(delta / 120) or (1 if delta > 0 else -1)
+            self._scroll_lines(-3 * notches)
+        return "break"
+
+    def _on_configure(self, event):
+        rows = max(1, event.height // self._linespace)
+        if rows != self._rows:
+            self._rows = rows
+            self.refresh()
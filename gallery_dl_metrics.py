@@ -0,0 +1,293 @@
+"""
+gallery_dl_metrics.py
+実行中の時間の使われ方を測るカウンタとレイテンシのヒストグラム。
+
+1 回の実行で時間がどこに使われているか（gallery-dl の出力を待っている時間、
+1 行の分類、ログへのディスパッチ、Tk の描画）を分けて見られるようにする。
+  - カウンタ（行数・イベント数・受信バイト数・終わったジョブ数）は常に数える
+    （読み取りループは行数を手元で数えて、一定間隔でまとめて足す）
+  - ヒストグラムは ``enabled`` の間だけ記録する。時刻を取る処理自体が 1 行あたりの
+    コストになるので、GUI ではメトリクスタブを開いている間、ヘッドレスでは
+    --metrics を指定したとき、API では /api/metrics を一度でも取得したあとに有効になる
+  - ゲージは書き出すときに関数を呼んで値を読むだけで、ホットパスには何も足さない
+書き出しは JSON（snapshot / to_json）と Prometheus のテキスト形式（to_prometheus）。
+Tk には依存しない。
+"""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from typing import Optional, List, Dict, Any, Callable, Tuple, Union
+
+# ヒストグラムのバケットの上限（秒）。1 行あたりの処理は µs 単位、出力待ちは秒単位まである
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+JOB_BUCKETS: Tuple[float, ...] = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600)
+DEPTH_BUCKETS: Tuple[float, ...] = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 20000)
+
+
+class Counter:
+    """単調に増える値。``label`` を付けると値ごとに別々に数える（jobs_total{state="done"} など）。"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1, label_value: str = ""):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + n
+
+    @property
+    def value(self) -> float:
+        """全ラベルの合計。"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def values(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge:
+    """書き出すときに ``fn()`` を呼んで読む現在値（キューの深さ、受信速度など）。"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+
+    @property
+    def value(self) -> Optional[float]:
+        try:
+            return float(self.fn())
+        except Exception:
+            return None
+
+    def reset(self):
+        pass
+
+
+class Histogram:
+    """固定バケットのヒストグラム。分位点はバケット内の線形補間で近似する。"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)   # 最後は +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def state(self) -> Tuple[List[int], int, float, float]:
+        with self._lock:
+            return list(self._counts), self.count, self.sum, self.max
+
+    def quantile(self, q: float, state: Optional[Tuple[List[int], int, float, float]] = None) -> Optional[float]:
+        counts, count, _total, largest = state or self.state()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else largest
+                upper = min(upper, largest)
+                lower = min(lower, upper)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return largest
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+def _prom_number(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, int) or float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _prom_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metrics:
+    """メトリクスの登録簿。エンジンが使うものは最初から作っておく。
+
+    GUI・ヘッドレスは自分の計測（Tk の描画時間など）を counter() / gauge() / histogram()
+    で足す。``enabled`` はヒストグラムの記録（時刻の取得）を行うかどうかで、
+    enable(owner) / disable(owner) を呼んだ側が 1 つでも残っていれば有効。
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._metrics: Dict[str, Metric] = {}
+        self._owners: set = set()
+        self.enabled = False
+
+        self.lines = self.counter("gallery_dl_lines_total", "Output lines read from gallery-dl")
+        self.events = self.counter("gallery_dl_events_total", "Line events dispatched to the log")
+        self.progress = self.counter("gallery_dl_progress_lines_total",
+                                     "Progress-only lines (ending in a bare CR) applied to the job, not logged")
+        self.coalesced = self.counter("gallery_dl_progress_coalesced_total",
+                                      "Progress-only lines dropped because a newer one was already read")
+        self.bytes = self.counter("gallery_dl_received_bytes_total", "Bytes received by downloads")
+        self.jobs = self.counter("gallery_dl_jobs_total", "Finished jobs by final state", label="state")
+        self.read_wait = self.histogram("gallery_dl_read_wait_seconds",
+                                        "Time the reader waited for the next line from gallery-dl")
+        self.parse = self.histogram("gallery_dl_parse_seconds",
+                                    "Time to classify one line and update the job counters")
+        self.dispatch = self.histogram("gallery_dl_dispatch_seconds",
+                                       "Time in the event callback, including log backpressure")
+        self.job_time = self.histogram("gallery_dl_job_seconds", "Wall time per job", JOB_BUCKETS)
+
+    # 登録
+    # ──────────────────────────────────────────────
+    def _register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if existing.kind != metric.kind:
+                raise ValueError(f"metric {metric.name} already registered as a {existing.kind}")
+            if isinstance(metric, Gauge):
+                existing.fn = metric.fn      # 作り直した側（新しいキューなど）の値を読む
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label: Optional[str] = None) -> Counter:
+        return self._register(Counter(name, help_text, label))
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help_text, fn))
+
+    def histogram(self, name: str, help_text: str,
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def __iter__(self):
+        return iter(list(self._metrics.values()))
+
+    # 記録の有効・無効
+    # ──────────────────────────────────────────────
+    def enable(self, owner: str):
+        self._owners.add(owner)
+        self.enabled = True
+
+    def disable(self, owner: str):
+        self._owners.discard(owner)
+        self.enabled = bool(self._owners)
+
+    def reset(self):
+        for metric in self:
+            metric.reset()
+        self.started = time.time()
+
+    # 書き出し
+    # ──────────────────────────────────────────────
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON にそのまま書けるスナップショット。"""
+        counters: Dict[str, Any] = {}
+        gauges: Dict[str, Any] = {}
+        histograms: Dict[str, Any] = {}
+        for m in self:
+            if isinstance(m, Counter):
+                counters[m.name] = m.values() if m.label else m.value
+            elif isinstance(m, Gauge):
+                gauges[m.name] = m.value
+            else:
+                state = m.state()
+                counts, count, total, largest = state
+                cumulative, running = [], 0
+                for le, n in zip(m.buckets + (math.inf,), counts):
+                    running += n
+                    cumulative.append(["+Inf" if le == math.inf else le, running])
+                histograms[m.name] = {
+                    "count": count, "sum": total, "max": largest,
+                    "mean": total / count if count else None,
+                    "p50": m.quantile(0.5, state), "p95": m.quantile(0.95, state),
+                    "p99": m.quantile(0.99, state),
+                    "buckets": cumulative,
+                }
+        return {"time": time.time(), "started": self.started, "collecting": self.enabled,
+                "counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=1)
+
+    def to_prometheus(self) -> str:
+        """Prometheus のテキスト形式（node_exporter の textfile collector にもそのまま置ける）。"""
+        out: List[str] = []
+        for m in self:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            if isinstance(m, Counter):
+                values = m.values()
+                if m.label:
+                    for label_value, v in sorted(values.items()):
+                        out.append(f'{m.name}{{{m.label}="{_prom_escape(label_value)}"}} {_prom_number(v)}')
+                else:
+                    out.append(f"{m.name} {_prom_number(sum(values.values()))}")
+            elif isinstance(m, Gauge):
+                v = m.value
+                if v is not None:
+                    out.append(f"{m.name} {_prom_number(v)}")
+            else:
+                counts, count, total, _largest = m.state()
+                running = 0
+                for le, n in zip(m.buckets + (math.inf,), counts):
+                    running += n
+                    out.append(f'{m.name}_bucket{{le="{_prom_number(le)}"}} {running}')
+                out.append(f"{m.name}_sum {_prom_number(total)}")
+                out.append(f"{m.name}_count {count}")
+        return "\n".join(out) + "\n"
+
+    def write(self, path: str, fmt: Optional[str] = None):
+        """``fmt`` が "json" なら JSON、"prom" なら Prometheus のテキスト形式で書く。
+
+        ``fmt`` を省くと拡張子で決める（.json なら JSON）。OSError は呼び出し側へ。
+        """
+        if fmt is None:
+            fmt = "json" if path.lower().endswith(".json") else "prom"
+        text = self.to_json() if fmt == "json" else self.to_prometheus()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            f.write(text)
+        os.replace(tmp, path)
@@ -0,0 +1,195 @@
+"""
+gallery_dl_parser.py
+gallery-dl の出力行を 1 回の走査で分類するパーサー。
+
+以前は 1 行ごとに URL / リトライ / スキップ / HTTP コード / 速度 / 引用符 の
+正規表現を別々に当て、さらに line.lower() で何度もキーワードを探していた。
+ここでは全トークンを 1 本のコンパイル済みパターンにまとめ、finditer 1 回で
+必要な情報をすべて拾ってから LineEvent にまとめる。
+"""
+import re
+from typing import NamedTuple, Optional, Tuple
+
+# イベント種別
+EV_INFO     = "info"
+EV_DOWNLOAD = "download"
+EV_RETRY    = "retry"
+EV_SKIP     = "skip"
+EV_ERROR    = "error"
+EV_WARNING  = "warning"
+
+_URL_CHARS = r"""[^\s'"<>{}|\\^~\[\]`]"""
+
+# 交互パターンは位置ごとに先頭から試されるので、長いトークン（URL・速度）を
+# 先に置き、その中の数字が HTTP コードとして拾われないようにしている。
+# 先頭の先読みは、どのトークンも始まり得ない位置で全候補を試すのを省くためのもの。
+# gallery-dl のエラーは "'404 Not Found' for 'https://...'" のように引用符で囲まれるので、
+# 引用符の中も URL・HTTP コードとして拾う（引用符そのものはトークンにしない）。
+# リトライは downloader.http の "... (1/6)"（行末）と、古い "Retrying 1/6" の両方。
+_TOKEN_RE = re.compile(
+    r"(?=[#hrsfe\[(0-9])(?:"
+    r"(?P<dl>^\#\s*\d+(?:\s+(?P<path>" + _URL_CHARS + r"+))?)"
+    r"|(?P<url>https?://" + _URL_CHARS + r"+)"
+    r"|Retrying\s+(?P<rcur>\d+)/(?P<rtot>\d+)"
+    r"|\((?P<tcur>\d+)/(?P<ttot>\d+)\)\s*$"
+    r"|(?<![\w.])(?P<speed>\d+(?:\.\d+)?\s?[kKMGT]?i?B/s)"
+    r"|(?P<skip>\bskipp(?:ing|ed)\b)"
+    r"|(?P<err>\[error\]|failed|exception)"
+    r"|(?P<warn>\[warning\])"
+    r"|\b(?P<http>[45]\d{2})\b)",
+    re.IGNORECASE,
+)
+_ERROR_SPLIT_RE = re.compile(r"\[error\]", re.IGNORECASE)
+_SPEED_RE = re.compile(r"(?<![\w.])\d+(?:\.\d+)?\s?[kKMGT]?i?B/s")
+# gallery-dl はダウンロードを終えたファイルのパスだけを 1 行で出す（"C:\\...\\a.jpg"、
+# "./gallery-dl/.../a.jpg" など）。URL の行は除き、最後の要素に拡張子があるものだけ
+_PATH_LINE_RE = re.compile(
+    r"(?!.*://)(?P<path>(?:[A-Za-z]:)?[^\s\[\]<>|\"*?#][^<>|\"*?]*[\\/][^\\/<>|\"*?]*\.\w{1,8})\s*$")
+_NOT_PATH_START = ("", "[", "#")
+
+
+class LineEvent(NamedTuple):
+    """1 行の分類結果。"""
+    kind: str                       # EV_*
+    tag: str                        # ログの色タグ
+    text: Optional[str]             # ログに表示する文字列（None なら表示しない）
+    url: Optional[str] = None       # 行中の URL
+    path: Optional[str] = None      # ダウンロード対象のパス
+    speed: Optional[str] = None     # "1.2 MB/s" など
+    http: Optional[int] = None      # 4xx / 5xx
+    retry: Optional[Tuple[int, int]] = None   # (現在, 最大)
+    failed_item: Optional[str] = None         # 失敗タブに出す文字列
+
+
+class LineClassifier:
+    """ジョブごとに 1 つ作る。直前に見た URL と HTTP コードを覚えておき、失敗行に添える。
+
+    gallery-dl はダウンロードの失敗を
+        [downloader.http][warning] '404 Not Found' for 'https://...'
+        [download][error] Failed to download a.jpg
+    の 2 行で出すので、エラー行にない URL・HTTP コードは直前の警告行から引き継ぐ。
+    """
+
+    __slots__ = ("last_url", "last_http")
+
+    def __init__(self):
+        self.last_url: Optional[str] = None
+        self.last_http: Optional[int] = None
+
+    def classify(self, line: str) -> LineEvent:
+        if line[:1] not in _NOT_PATH_START:
+            m = _PATH_LINE_RE.match(line)
+            if m is not None:
+                self.last_http = None
+                return LineEvent(EV_DOWNLOAD, "success", line, None, m.group("path"))
+
+        url = path = speed = None
+        http: Optional[int] = None
+        retry: Optional[Tuple[int, int]] = None
+        is_dl = has_skip = has_err = has_warn = False
+
+        for m in _TOKEN_RE.finditer(line):
+            group = m.lastgroup
+            if group == "url":
+                if url is None:
+                    url = m.group("url")
+            elif group == "rtot":
+                if retry is None:
+                    retry = (int(m.group("rcur")), int(m.group("rtot")))
+            elif group == "ttot":
+                if retry is None:
+                    retry = (int(m.group("tcur")), int(m.group("ttot")))
+            elif group == "http":
+                if http is None:
+                    http = int(m.group("http"))
+            elif group == "speed":
+                if speed is None:
+                    speed = m.group("speed")
+            elif group == "err":
+                has_err = True
+            elif group == "skip":
+                has_skip = True
+            elif group == "warn":
+                has_warn = True
+            elif group == "dl":
+                is_dl = True
+                path = m.group("path")
+
+        if url is not None:
+            self.last_url = url
+        cur_url = url or self.last_url
+
+        # パスっぽいものだけ拾う（拡張子のないトークンは無視）
+        if path is not None and "." not in path.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]:
+            path = None
+
+        # リトライ
+        if retry is not None:
+            self.last_http = http
+            code_str = f" (HTTP {http})" if http else ""
+            text = f"🔄 リトライ {retry[0]}/{retry[1]}{code_str} — {line.strip()}"
+            return LineEvent(EV_RETRY, "warning", text, url, path, speed, http, retry)
+
+        # スキップ（リトライ上限後に gallery-dl が自動スキップ）
+        if has_skip and "[" in line:
+            code_str = f" HTTP {http}" if http else ""
+            text = f"⏭ Skip{code_str}: {line.strip()}"
+            failed = f"{text} | URL: {cur_url}" if cur_url else text
+            return LineEvent(EV_SKIP, "error", text, url, path, speed, http, None, failed)
+
+        # HTTP エラーの警告（リトライしない 4xx）。失敗として数えるのは続くエラー行
+        if has_warn and http is not None and not has_err:
+            self.last_http = http
+            return LineEvent(EV_WARNING, "warning", line, url, path, speed, http)
+
+        # エラー（エラーキーワード or HTTP 4xx/5xx）
+        if has_err or http is not None:
+            if http is None:
+                http = self.last_http
+            self.last_http = None
+            if has_err and _ERROR_SPLIT_RE.search(line):
+                desc = _ERROR_SPLIT_RE.split(line, 1)[1].strip()
+            else:
+                desc = line.strip()
+            if http and str(http) not in desc:
+                desc += f" [HTTP {http}]"
+            if cur_url:
+                failed = desc if cur_url in desc else f"{desc} | URL: {cur_url}"
+            else:
+                failed = desc
+            return LineEvent(EV_ERROR, "error", line, url, path, speed, http, None, failed)
+
+        self.last_http = None
+        if is_dl:
+            return LineEvent(EV_DOWNLOAD, "success", line, url, path, speed)
+        if has_warn:
+            return LineEvent(EV_WARNING, "warning", line, url, path, speed)
+        if line.startswith("#"):
+            tag = "success"
+        elif line.startswith("─") or line.startswith("-"):
+            tag = "dim"
+        else:
+            tag = "info"
+        return LineEvent(EV_INFO, tag, line, url, path, speed)
+
+
+def display_event(line: str) -> LineEvent:
+    """構造化イベントを受け取っているときのテキスト行。表示用のタグだけ決めて数えない。
+
+    カウントはワーカーのイベントで行うので、ここでは正規表現も使わない。
+    """
+    if "[error]" in line:
+        tag = "error"
+    elif "[warning]" in line:
+        tag = "warning"
+    elif line.startswith("─") or line.startswith("-"):
+        tag = "dim"
+    else:
+        tag = "info"
+    return LineEvent(EV_INFO, tag, line)
+
+
+def progress_speed(line: str) -> Optional[str]:
+    """CR で上書きされる進捗行から速度だけを拾う（行の分類はしない）。"""
+    m = _SPEED_RE.search(line)
+    return m.group() if m else None
@@ -0,0 +1,216 @@
+"""
+gallery_dl_profiles.py
+サイト別プロファイルと、ジョブごとの gallery-dl 設定の生成。
+
+profiles.json にサイト（URL のホスト）ごとの設定をまとめておき、ジョブの URL から
+自動で選ぶ。
+  {
+    "profiles": {
+      "video": {
+        "hosts": ["redgifs.com", "vimeo.com"],       ホスト名（サブドメインも一致する）
+        "per_host": 1,                               このサイトの同時実行数（Per site の代わり）
+        "retries": 5,                                --retries の代わり
+        "sleep_request": 1.5,                        このサイトへのリクエスト間隔（秒）
+        "config": {"downloader": {"http": {"chunk-size": "4M"}}}
+      }
+    }
+  }
+"config" は gallery-dl の設定の断片で、基本の gallery-dl.conf に重ねる（辞書は再帰的に
+マージし、それ以外の値は置き換える）。ファイル名のテンプレート（extractor.filename）、
+速度の上限（downloader.rate）、アーカイブ、後処理（extractor.postprocessors）なども
+ここに書ける。
+
+合成した設定は内容のハッシュを名前にしたファイル（.configs/<プロファイル>-<ハッシュ>.json）に
+書き、基本の設定と profiles.json が変わるまでは JSON の読み込みもマージもせずに使い回す。
+Tk には依存しない。
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple, NamedTuple
+
+from gallery_dl_throttle import site_of, MAX_PER_HOST
+
+PROFILES_FILE = "profiles.json"
+CONFIG_DIR    = ".configs"   # 合成した設定の置き場（profiles.json と同じフォルダ内）
+RELOAD_SECONDS = 2.0         # profiles.json の変更を確かめる最短間隔（_pump から頻繁に呼ばれる）
+_UNSAFE_NAME_RE = re.compile(r"[^\w.-]+")
+
+
+class SiteProfile(NamedTuple):
+    name: str
+    hosts: Tuple[str, ...]
+    per_host: Optional[int]      # サイトごとの同時実行数（None なら全体の設定）
+    retries: Optional[int]       # --retries（None なら全体の設定）
+    sleep_request: Optional[float]   # --sleep-request（None なら間隔を空けない）
+    config: Dict[str, Any]       # gallery-dl の設定に重ねる断片
+
+
+def merge_config(base: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
+    """``base`` に ``extra`` を重ねた新しい辞書（辞書どうしは再帰的にマージする）。"""
+    out = dict(base)
+    for key, value in extra.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = merge_config(out[key], value)
+        else:
+            out[key] = copy.deepcopy(value)
+    return out
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _parse_profile(name: str, data: Any) -> Optional[SiteProfile]:
+    if not isinstance(data, dict):
+        return None
+    hosts = tuple(site_of("//" + str(h).strip().lstrip("*.")) for h in data.get("hosts") or ())
+    hosts = tuple(h for h in hosts if h)
+    if not hosts:
+        return None
+    per_host = data.get("per_host")
+    retries = data.get("retries")
+    sleep_request = data.get("sleep_request")
+    config = data.get("config")
+    return SiteProfile(
+        name, hosts,
+        max(1, min(MAX_PER_HOST, int(per_host))) if isinstance(per_host, (int, float)) else None,
+        max(0, int(retries)) if isinstance(retries, (int, float)) else None,
+        float(sleep_request) if isinstance(sleep_request, (int, float)) and sleep_request > 0 else None,
+        config if isinstance(config, dict) else {},
+    )
+
+
+class ProfileStore:
+    """profiles.json を読み、URL のサイトにプロファイルを割り当てる。
+
+    ワーカースレッド（引数の組み立て）と JobQueue._pump から呼ばれる。
+    profiles.json がなければ、どのサイトにもプロファイルを割り当てない。
+    """
+
+    def __init__(self, path: str, config_dir: Optional[str] = None):
+        self.path = os.path.abspath(path)
+        self.config_dir = config_dir or os.path.join(os.path.dirname(self.path), CONFIG_DIR)
+        self.error: Optional[str] = None            # 直近の profiles.json の読み込みエラー
+        self._profiles: List[SiteProfile] = []
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._checked = 0.0
+        self._sites: Dict[str, Optional[SiteProfile]] = {}    # サイト → 一致したプロファイル
+        self._bases: Dict[str, Tuple[Optional[Tuple[int, int]], Dict[str, Any]]] = {}
+        # (基本の設定, プロファイル名) → (基本の設定の stamp, profiles.json の stamp, 合成した設定)
+        self._configs: Dict[Tuple[str, str], Tuple[Optional[Tuple[int, int]],
+                                                   Optional[Tuple[int, int]], str]] = {}
+        self._lock = threading.Lock()
+
+    def profiles(self) -> List[SiteProfile]:
+        with self._lock:
+            self._reload()
+            return list(self._profiles)
+
+    def profile_for(self, url: str) -> Optional[SiteProfile]:
+        """URL のサイトのプロファイル（一致するホストが複数あれば長いほう）。"""
+        return self.site_profile(site_of(url))
+
+    def site_profile(self, site: str) -> Optional[SiteProfile]:
+        with self._lock:
+            self._reload()
+            if site in self._sites:
+                return self._sites[site]
+            best: Optional[SiteProfile] = None
+            best_len = 0
+            for profile in self._profiles:
+                for host in profile.hosts:
+                    if len(host) > best_len and (site == host or site.endswith("." + host)):
+                        best, best_len = profile, len(host)
+            self._sites[site] = best
+            return best
+
+    def per_host(self, site: str) -> Optional[int]:
+        """このサイトの同時実行数（プロファイルで指定していなければ None）。"""
+        profile = self.site_profile(site)
+        return profile.per_host if profile is not None else None
+
+    def sleep_request(self, site: str) -> Optional[float]:
+        """このサイトへのリクエスト間隔（秒。プロファイルで指定していなければ None）。"""
+        profile = self.site_profile(site)
+        return profile.sleep_request if profile is not None else None
+
+    def config_for(self, base_path: str, profile: SiteProfile) -> str:
+        """基本の設定に ``profile`` の断片を重ねた設定ファイルのパス。
+
+        断片が空なら ``base_path`` をそのまま返す。基本の設定が JSON として読めない
+        （YAML など）ときは ValueError、読めないときは OSError。
+        """
+        if not profile.config:
+            return base_path
+        base_path = os.path.abspath(base_path)
+        key = (base_path, profile.name)
+        base_stamp = _stamp(base_path)
+        with self._lock:
+            cached = self._configs.get(key)
+            if (cached is not None and cached[0] == base_stamp and cached[1] == self._stamp
+                    and os.path.exists(cached[2])):
+                return cached[2]
+            profiles_stamp = self._stamp
+            base = self._load_base(base_path, base_stamp)
+        text = json.dumps(merge_config(base, profile.config), ensure_ascii=False,
+                          indent=4, sort_keys=True) + "\n"
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        stem = _UNSAFE_NAME_RE.sub("_", profile.name).strip(".") or "profile"
+        out = os.path.join(self.config_dir, f"{stem}-{digest}.json")
+        if not os.path.exists(out):
+            # 同じ内容ならファイル名も同じなので、書くのは内容が変わったときだけ
+            os.makedirs(self.config_dir, exist_ok=True)
+            tmp = f"{out}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+                f.write(text)
+            os.replace(tmp, out)
+        with self._lock:
+            self._configs[key] = (base_stamp, profiles_stamp, out)
+        return out
+
+    # 内部処理（self._lock を持って呼ぶ）
+    # ──────────────────────────────────────────────
+    def _reload(self):
+        now = time.monotonic()
+        if self._checked and now - self._checked < RELOAD_SECONDS:
+            return
+        self._checked = now
+        stamp = _stamp(self.path)
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._sites.clear()
+        self._profiles = []
+        self.error = None
+        if stamp is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.get("profiles") or {}
+            for name, item in entries.items():
+                profile = _parse_profile(str(name), item)
+                if profile is not None:
+                    self._profiles.append(profile)
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            self.error = f"{os.path.basename(self.path)}: {e}"
+
+    def _load_base(self, base_path: str, stamp: Optional[Tuple[int, int]]) -> Dict[str, Any]:
+        cached = self._bases.get(base_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(base_path, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        if not isinstance(base, dict):
+            raise ValueError(f"{base_path}: not a JSON object")
+        self._bases[base_path] = (stamp, base)
+        return base
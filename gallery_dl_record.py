@@ -0,0 +1,209 @@
+"""
+gallery_dl_record.py
+ワーカーの出力の記録と再生。
+
+記録モード（JobQueue.set_record）では、ジョブごとに gallery-dl の出力をそのまま
+受け取った時刻付きで recordings/ に保存する。ファイルは JSON Lines で、
+  1 行目   {"version": 1, "url": ..., "args": [...], "started": エポック秒}
+  以降     [ジョブ開始からの秒数, "受け取った 1 行（改行を含む）"]
+  最終行   {"exit": 終了コード, "state": ..., "downloaded": ..., ...}（ジョブの結果）
+最終行の結果は、再生したときにパーサーが同じ数を数えたかの確認に使う。
+.gz で終わるファイルは gzip として読む（記録した後で圧縮してもよい）。
+
+ReplayProcess は subprocess.Popen の代わりに記録を流すオブジェクトで、
+JobQueue.launcher から返すと、ネットワークなしで同じ解析・描画の経路を通せる。
+Tk には依存しない。
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Optional, List, Dict, Any, Iterator, Tuple, NamedTuple
+
+RECORD_VERSION = 1
+RESULT_FIELDS = ("downloaded", "skipped", "failed", "retries")   # 再生後に比べるカウンタ
+REPLAY_CHUNK = 64 * 1024   # 待たずに流すとき、まとめて返すバイト数の目安（パイプに溜まった状態を再現する）
+
+
+class Recording(NamedTuple):
+    header: Dict[str, Any]
+    lines: List[Tuple[float, str]]    # (ジョブ開始からの秒数, 受け取った行)
+    result: Dict[str, Any]            # 記録の最終行（途中で切れた記録なら空）
+
+    @property
+    def url(self) -> str:
+        return self.header.get("url") or ""
+
+    @property
+    def duration(self) -> float:
+        return self.lines[-1][0] if self.lines else 0.0
+
+    @classmethod
+    def from_lines(cls, lines: List[str], url: str = "https://example.com/replay") -> "Recording":
+        """時刻のない行の列（キャプチャファイルなど）を、時刻 0 の記録として扱う。"""
+        return cls({"version": RECORD_VERSION, "url": url, "args": []},
+                   [(0.0, line if line.endswith("\n") else line + "\n") for line in lines], {})
+
+
+class SessionRecorder:
+    """ジョブ 1 つぶんの出力を記録する（読み取りスレッドから呼ばれる）。"""
+
+    def __init__(self, path: str, url: str, args: List[str]):
+        self.path = path
+        self._f = open(path, "w", encoding="utf-8", newline="\n")
+        self._started = time.monotonic()
+        self._f.write(json.dumps({"version": RECORD_VERSION, "url": url, "args": args,
+                                  "started": time.time()}, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def for_job(cls, directory: str, job_id: int, url: str, args: List[str]) -> "SessionRecorder":
+        os.makedirs(directory, exist_ok=True)
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-job{job_id}.jsonl"
+        return cls(os.path.join(directory, name), url, args)
+
+    def write(self, raw_line: str):
+        if self._f.closed:
+            return
+        t = time.monotonic() - self._started
+        try:
+            self._f.write(f"[{t:.4f},{json.dumps(raw_line, ensure_ascii=False)}]\n")
+        except OSError:
+            self._f.close()          # 空き容量がないなど: 記録だけやめてジョブは続ける
+
+    def close(self, result: Dict[str, Any]):
+        if self._f.closed:
+            return
+        try:
+            self._f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        finally:
+            self._f.close()
+
+
+def load_recording(path: str) -> Recording:
+    """記録ファイルを読む（壊れた行・途中で切れた最終行は無視する）。"""
+    opener = gzip.open if path.endswith(".gz") else open
+    header: Dict[str, Any] = {}
+    result: Dict[str, Any] = {}
+    lines: List[Tuple[float, str]] = []
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        for n, text in enumerate(f):
+            try:
+                item = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(item, list) and len(item) == 2:
+                lines.append((float(item[0]), str(item[1])))
+            elif isinstance(item, dict):
+                if n == 0:
+                    header = item
+                else:
+                    result = item
+    return Recording(header, lines, result)
+
+
+class _ReplayStream:
+    """記録した行を、記録どおりの間隔（speed 倍）か待たずに返す stdout の代わり。
+
+    本物の stdout と同じくバイト列を read1 で返すので、LineReader の区切り・復号も再生に含まれる。
+    """
+
+    def __init__(self, proc: "ReplayProcess"):
+        self._proc = proc
+        self._chunks = self._generate()
+        self._buf = b""
+
+    def _generate(self) -> Iterator[bytes]:
+        proc = self._proc
+        speed = proc.speed
+        started = time.monotonic()
+        batch: List[bytes] = []
+        size = 0
+        for t, line in proc.recording.lines:
+            if speed > 0:
+                delay = started + t / speed - time.monotonic()
+                if delay > 0:
+                    if batch:
+                        yield b"".join(batch)
+                        batch, size = [], 0
+                    if proc._killed.wait(delay):
+                        break
+            if proc._killed.is_set():
+                break
+            data = line.encode("utf-8")
+            batch.append(data)
+            size += len(data)
+            if size >= REPLAY_CHUNK:
+                yield b"".join(batch)
+                batch, size = [], 0
+        if batch and not proc._killed.is_set():
+            yield b"".join(batch)
+        proc._finish()
+
+    def read1(self, size: int = -1) -> bytes:
+        buf = self._buf or next(self._chunks, b"")
+        if 0 < size < len(buf):
+            self._buf = buf[size:]
+            return buf[:size]
+        self._buf = b""
+        return buf
+
+    read = read1
+
+    def close(self):
+        pass
+
+
+class ReplayProcess:
+    """記録を出力として返す、subprocess.Popen の代わり（poll / wait / terminate / kill）。
+
+    ``speed`` は 1.0 で記録どおりの速さ、2.0 で 2 倍速、0 以下なら待たずに流す。
+    """
+
+    def __init__(self, recording: Recording, speed: float = 0.0):
+        self.recording = recording
+        self.speed = speed
+        self.stdout = _ReplayStream(self)
+        self.returncode: Optional[int] = None
+        self._killed = threading.Event()
+        self._done = threading.Event()
+
+    def _finish(self):
+        if self.returncode is None:
+            self.returncode = -15 if self._killed.is_set() else int(self.recording.result.get("exit") or 0)
+        self._done.set()
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        if self._killed.is_set():
+            self._finish()
+        self._done.wait(timeout)
+        return self.returncode
+
+    def terminate(self):
+        self._killed.set()
+
+    kill = terminate
+
+
+class ReplayLauncher:
+    """JobQueue.launcher に渡す。ジョブの URL が同じ記録を、なければ未使用の記録を順に再生する。"""
+
+    def __init__(self, recordings: List[Recording], speed: float = 0.0):
+        self.recordings = list(recordings)
+        self.speed = speed
+        self.launched: Dict[int, Recording] = {}    # ジョブ ID → 再生した記録
+        self._unused = list(self.recordings)
+        self._lock = threading.Lock()
+
+    def __call__(self, job, args: List[str]) -> ReplayProcess:
+        with self._lock:
+            recording = next((r for r in self._unused if r.url == job.url), None)
+            if recording is None:
+                recording = self._unused[0] if self._unused else self.recordings[0]
+            if recording in self._unused:
+                self._unused.remove(recording)
+            self.launched[job.id] = recording
+        return ReplayProcess(recording, self.speed)
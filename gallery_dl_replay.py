@@ -0,0 +1,381 @@
+"""
+gallery_dl_replay.py
+記録した gallery-dl の出力（gallery_dl_record）をネットワークなしで再生するハーネス。
+
+  replay_gui(recordings, speed)      スタブの Tk の上で GalleryDLApp をそのまま動かし、
+                                     読み取り → 分類 → LogSink → _drain_log → ログビューの描画
+                                     まで本物のコードを通す（ディスプレイは不要）
+  replay_engine(recordings, speed)   JobQueue だけ（ヘッドレスと同じ経路）
+
+speed は 1.0 で記録どおりの速さ、0 以下なら待たずに流す。どちらも ReplayResult を返し、
+記録の最終行にあるカウンタ（ダウンロード数・失敗数など）と再生で数えた値が
+違うジョブを mismatches に入れる。benchmark.py replay から使う。
+
+スタブの Tk は描画せず、root.after の予定を本物と同じ時刻に実行するだけ
+（ログの描画間隔・予算・背圧は実際の GUI と同じに働く）。
+"""
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import List, Dict, Any, Callable, NamedTuple
+
+from gallery_dl_metrics import Metrics
+from gallery_dl_record import Recording, ReplayLauncher, RESULT_FIELDS
+from gallery_dl_engine import JobQueue, FINISHED_STATES
+from gallery_dl_throttle import HostScheduler
+
+REPLAY_TIMEOUT  = 3600.0   # 再生が終わらないときに打ち切るまでの秒数
+LOG_VIEW_HEIGHT = 420      # ログビューの高さ（px）。既定のウィンドウサイズでの値に合わせる
+
+
+class ReplayResult(NamedTuple):
+    seconds: float                   # 最初のジョブの開始から、すべてのログ行が描画されるまで
+    lines: int                       # 再生した行数
+    jobs: int
+    metrics: Dict[str, Any]          # Metrics.snapshot()
+    text_inserts: int                # ログビューへの insert 回数（GUI のみ）
+    mismatches: List[str]            # 記録と数が合わなかったジョブ
+
+
+# ──────────────────────────────────────────────
+# スタブの Tk
+# ──────────────────────────────────────────────
+class _StubWidget:
+    """どのメソッドを呼んでも何もしないウィジェット。オプションだけは覚えておく。"""
+
+    def __init__(self, master=None, *args, **kw):
+        self.master = master
+        self._options: Dict[str, Any] = dict(kw)
+        self._bindings: Dict[str, Callable] = {}
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _noop
+
+    def configure(self, cnf=None, **kw):
+        self._options.update(kw)
+
+    config = configure
+
+    def cget(self, key: str):
+        return self._options.get(key, "")
+
+    __getitem__ = cget
+
+    def __setitem__(self, key: str, value):
+        self._options[key] = value
+
+    def bind(self, sequence: str, func: Callable, add=None):
+        self._bindings[sequence] = func
+
+
+def _noop(*_args, **_kw):
+    return None
+
+
+class _StubVar:
+    default: Any = ""
+
+    def __init__(self, master=None, value=None, name=None):
+        self._value = self.default if value is None else value
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+    def trace_add(self, *_args):
+        return ""
+
+
+class _StubStringVar(_StubVar):
+    default = ""
+
+
+class _StubIntVar(_StubVar):
+    default = 0
+
+
+class _StubDoubleVar(_StubVar):
+    default = 0.0
+
+
+class _StubBooleanVar(_StubVar):
+    default = False
+
+
+class _StubText(_StubWidget):
+    def __init__(self, master=None, **kw):
+        super().__init__(master, **kw)
+        self.inserts = 0
+        self.chars = 0
+
+    def insert(self, index, *args):
+        self.inserts += 1
+        self.chars += sum(len(a) for a in args[0::2])
+
+
+class _StubNotebook(_StubWidget):
+    def __init__(self, master=None, **kw):
+        super().__init__(master, **kw)
+        self._tabs: List[Any] = []
+        self._current = 0
+
+    def add(self, child, **kw):
+        self._tabs.append(child)
+
+    def select(self, tab_id=None):
+        if tab_id is None:
+            return self._current
+        self._current = tab_id if isinstance(tab_id, int) else self._tabs.index(tab_id)
+        handler = self._bindings.get("<<NotebookTabChanged>>")
+        if handler is not None:
+            handler(None)
+        return None
+
+    def index(self, tab_id):
+        return tab_id if isinstance(tab_id, int) else self._tabs.index(tab_id)
+
+
+class _StubTreeview(_StubWidget):
+    def __init__(self, master=None, **kw):
+        super().__init__(master, **kw)
+        self._items: Dict[str, Dict[str, Any]] = {}
+
+    def insert(self, parent, index, iid=None, **kw):
+        iid = str(iid if iid is not None else len(self._items))
+        self._items[iid] = kw
+        return iid
+
+    def item(self, iid, **kw):
+        if kw:
+            self._items[iid].update(kw)
+        return self._items.get(iid, {})
+
+    def exists(self, iid) -> bool:
+        return iid in self._items
+
+    def delete(self, *iids):
+        for iid in iids:
+            self._items.pop(iid, None)
+
+    def get_children(self, item=None):
+        return tuple(self._items)
+
+    def selection(self):
+        return ()
+
+
+class _StubFont:
+    def __init__(self, *args, **kw):
+        pass
+
+    def metrics(self, *args):
+        return 15
+
+    def measure(self, text):
+        return 7 * len(text)
+
+
+class _StubTk(_StubWidget):
+    """root.after の予定を実時間どおりに実行するだけの Tk。ワーカースレッドからも呼べる。"""
+
+    def __init__(self, *args, **kw):
+        super().__init__(None)
+        self._queue: List[tuple] = []
+        self._seq = 0
+        self._cancelled: set = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.destroyed = False
+
+    def after(self, ms, func=None, *args):
+        with self._lock:
+            self._seq += 1
+            heapq.heappush(self._queue, (time.monotonic() + ms / 1000.0, self._seq, func, args))
+            seq = self._seq
+        self._wake.set()
+        return f"after#{seq}"
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        with self._lock:
+            self._cancelled.add(int(after_id.split("#")[1]))
+
+    def run_until(self, done: Callable[[], bool], timeout: float = REPLAY_TIMEOUT) -> bool:
+        """``done()`` が真になるまで予定を実行する（タイムアウトなら False）。"""
+        deadline = time.monotonic() + timeout
+        while not done():
+            now = time.monotonic()
+            if now >= deadline:
+                return False
+            with self._lock:
+                due = self._queue[0][0] if self._queue else now + 0.05
+                if due <= now:
+                    _due, seq, func, args = heapq.heappop(self._queue)
+                    if seq in self._cancelled:
+                        self._cancelled.discard(seq)
+                        continue
+                else:
+                    func = None
+            if func is None:
+                self._wake.clear()
+                self._wake.wait(min(due, deadline) - now)
+                continue
+            func(*args)
+        return True
+
+    def destroy(self):
+        self.destroyed = True
+
+
+def _stub_tk_modules() -> Dict[str, types.ModuleType]:
+    """tkinter・tkinter.ttk などの代わりのモジュール。"""
+    def module(name: str, **attrs) -> types.ModuleType:
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        # 定数（tk.END など）は名前の小文字、そのほかのクラスは何もしないウィジェット
+        def getattr_(attr: str):
+            if attr.startswith("__"):
+                raise AttributeError(attr)
+            return attr.lower() if attr.isupper() else _StubWidget
+        mod.__getattr__ = getattr_
+        return mod
+
+    font = module("tkinter.font", Font=_StubFont)
+    ttk = module("tkinter.ttk", Notebook=_StubNotebook, Treeview=_StubTreeview)
+    messagebox = module("tkinter.messagebox", showwarning=_noop, showerror=_noop,
+                        showinfo=_noop, askyesno=lambda *a, **k: False)
+    filedialog = module("tkinter.filedialog", askopenfilename=lambda *a, **k: "",
+                        asksaveasfilename=lambda *a, **k: "")
+    tk = module("tkinter", Tk=_StubTk, Text=_StubText, StringVar=_StubStringVar,
+                IntVar=_StubIntVar, DoubleVar=_StubDoubleVar, BooleanVar=_StubBooleanVar,
+                TclError=type("TclError", (Exception,), {}),
+                ttk=ttk, font=font, messagebox=messagebox, filedialog=filedialog)
+    return {"tkinter": tk, "tkinter.ttk": ttk, "tkinter.font": font,
+            "tkinter.messagebox": messagebox, "tkinter.filedialog": filedialog}
+
+
+def _import_gui_with_stub_tk():
+    """スタブの tkinter で gallery_dl_gui を読み込む。
+
+    sys.modules の tkinter を置き換えるので、このプロセスではもう本物の Tk は使えない
+    （本物の Tk で gallery_dl_gui を読み込み済みなら RuntimeError）。
+    """
+    gui = sys.modules.get("gallery_dl_gui")
+    if gui is not None:
+        if gui.tk.Tk is not _StubTk:
+            raise RuntimeError("gallery_dl_gui is already imported with the real tkinter; "
+                               "run the GUI replay in a fresh process")
+        return gui
+    sys.modules.pop("gallery_dl_logview", None)
+    sys.modules.update(_stub_tk_modules())
+    import gallery_dl_gui
+    return gallery_dl_gui
+
+
+# ──────────────────────────────────────────────
+# 再生
+# ──────────────────────────────────────────────
+class _UnthrottledHosts(HostScheduler):
+    """再生ではサイトごとの開始間隔で待たない（記録の時点で本番の間隔は反映されている）。"""
+
+    def admit(self, host, running, now=None, limit=None):
+        return True, None
+
+
+def _mismatches(jobs, launcher: ReplayLauncher) -> List[str]:
+    out = []
+    for job in jobs:
+        recording = launcher.launched.get(job.id)
+        if recording is None or not recording.result:
+            continue
+        for field in RESULT_FIELDS:
+            want = recording.result.get(field)
+            got = getattr(job, field)
+            if want is not None and want != got:
+                out.append(f"{recording.url}: {field} recorded {want}, replayed {got}")
+    return out
+
+
+def replay_gui(recordings: List[Recording], speed: float = 0.0, workers: int = 1,
+               timeout: float = REPLAY_TIMEOUT) -> ReplayResult:
+    """スタブの Tk の上の GalleryDLApp で記録を再生する。
+
+    GUI は作業ディレクトリに queue.json や履歴を作るので、一時ディレクトリで動かす。
+    """
+    gui = _import_gui_with_stub_tk()
+    tmp = tempfile.mkdtemp(prefix="gdl-replay-")
+    cwd = os.getcwd()
+    app_dir = gui.app_dir
+    gui.app_dir = lambda: tmp
+    try:
+        root = gui.tk.Tk()
+        app = gui.GalleryDLApp(root)
+        root.run_until(lambda: not app._startup_steps, timeout=30)
+        app.log_text._on_configure(types.SimpleNamespace(height=LOG_VIEW_HEIGHT))
+        launcher = ReplayLauncher(recordings, speed)
+        app.queue.launcher = launcher
+        app.queue.hosts = _UnthrottledHosts()
+        app.queue.set_workers(workers)
+        app.metrics.enable("replay")
+        jobs = app.queue.add([r.url for r in recordings])
+
+        started = time.monotonic()
+        app._start_download()
+
+        def done() -> bool:
+            return (all(j.state in FINISHED_STATES for j in jobs)
+                    and not app._log_sink.pending() and not app.queue.running())
+        finished = root.run_until(done, timeout)
+        seconds = time.monotonic() - started
+        if not finished:
+            app.queue.stop_all("replay timeout")
+        result = ReplayResult(seconds, sum(len(r.lines) for r in launcher.launched.values()),
+                              len(jobs), app.metrics.snapshot(), app.log_text.text.inserts,
+                              _mismatches(jobs, launcher) + ([] if finished else ["timed out"]))
+        app._on_close()
+        return result
+    finally:
+        gui.app_dir = app_dir
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def replay_engine(recordings: List[Recording], speed: float = 0.0, workers: int = 1,
+                  timeout: float = REPLAY_TIMEOUT) -> ReplayResult:
+    """JobQueue だけで記録を再生する（ヘッドレスと同じ経路。表示は数えるだけ）。"""
+    tmp = tempfile.mkdtemp(prefix="gdl-replay-")
+    idle = threading.Event()
+    try:
+        metrics = Metrics()
+        metrics.enable("replay")
+        launcher = ReplayLauncher(recordings, speed)
+        q = JobQueue(os.path.join(tmp, "queue.json"), build_args=lambda job: [job.url],
+                     on_event=lambda job, ev: None, on_message=lambda job, text, tag: None,
+                     on_state=lambda job: None, on_idle=idle.set, workers=workers,
+                     metrics=metrics, launcher=launcher)
+        q.hosts = _UnthrottledHosts()
+        jobs = q.add([r.url for r in recordings])
+        idle.clear()                 # 開始前の _pump でも on_idle が呼ばれる
+        started = time.monotonic()
+        q.start()
+        finished = idle.wait(timeout)
+        seconds = time.monotonic() - started
+        if not finished:
+            q.stop_all("replay timeout")
+        q.shutdown()
+        return ReplayResult(seconds, sum(len(r.lines) for r in launcher.launched.values()),
+                            len(jobs), metrics.snapshot(), 0,
+                            _mismatches(jobs, launcher) + ([] if finished else ["timed out"]))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
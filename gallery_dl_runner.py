@@ -1,11 +1,206 @@
 """
 gallery_dl_runner.py
 Thin subprocess entry point for gallery_dl.
-Called by the frozen GalleryDL-GUI.exe as a worker process:
-  GalleryDL-GUI.exe --run-gallery-dl <args...>
+Started by the GUI / headless runner as a worker process (see
+gallery_dl_command in gallery_dl_engine):
+  python\python.exe gallery_dl_runner.py <args...>    (portable build)
+  <sys.executable> gallery_dl_runner.py <args...>     (development, not frozen)
+
+Host mode (pre-warmed worker, see host_command):
+  python gallery_dl_runner.py --host
+imports gallery_dl and all extractor modules up front, then waits for one
+job on stdin (a single JSON line: {"args": [...]}) and runs it. The GUI
+keeps a few of these idle so a new job does not pay interpreter and
+extractor import time. Each host runs exactly one job and exits, so
+killing a job never affects another one.
+
+Structured events:
+Both modes hook gallery-dl's downloader output, logging and HTTP session
+and write one JSON object per line (prefixed with EVENT_PREFIX) for every
+file start / progress / done / skip (flagged when the download archive
+caused it), gallery item (with its position num/count when the extractor
+knows it), retry, HTTP error status and error record (with the exception
+class and, for a failed file, its target path), so the GUI does not have
+to scrape the human-readable text.
 """
 import sys
-from gallery_dl import main as gallery_dl_main
+import os
+import json
+import time
+import logging
+import threading
+
+# 構造化イベント行の接頭辞。この後ろに JSON が 1 つ続く
+EVENT_PREFIX = "@@gdl-event "
+PROTOCOL_VERSION = 1
+PROGRESS_INTERVAL = 0.25   # 1 ファイルあたりの progress イベントの最短間隔（秒）
+
+_emit_lock = threading.Lock()
+_archive_hit = False     # 直前のアイテムがダウンロードアーカイブでスキップされたか
+_pathfmt = None          # 処理中のアイテムの PathFormat（失敗時の保存先を送るため）
+
+
+def emit(event: str, **data):
+    """GUI 向けの構造化イベントを 1 行で出力する。"""
+    data["event"] = event
+    line = EVENT_PREFIX + json.dumps(data, ensure_ascii=False) + "\n"
+    with _emit_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+class EventOutput:
+    """gallery_dl.output の出力クラスの代わり。人間向けの表示の代わりにイベントを出す。"""
+
+    def __init__(self):
+        self._last_progress = 0.0
+        self._path = None
+
+    def start(self, path):
+        self._path = path
+        self._last_progress = 0.0
+        # 前回の .part が残っていれば、downloader はその続きから Range で取得する
+        try:
+            resume = os.path.getsize(path + ".part")
+        except OSError:
+            resume = 0
+        if resume:
+            emit("start", path=path, resume=resume)
+        else:
+            emit("start", path=path)
+
+    def skip(self, path):
+        if _archive_hit:
+            emit("skip", path=path, archive=True)
+        else:
+            emit("skip", path=path)
+
+    def success(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        emit("done", path=path, size=size)
+
+    def progress(self, bytes_total, bytes_downloaded, bytes_per_second):
+        now = time.monotonic()
+        if now - self._last_progress < PROGRESS_INTERVAL and bytes_downloaded != bytes_total:
+            return
+        self._last_progress = now
+        emit("progress", path=self._path, total=bytes_total,
+             downloaded=bytes_downloaded, bps=int(bytes_per_second or 0))
+
+
+class EventLogHandler(logging.Handler):
+    """警告・エラーのログレコードをイベントとしても送る（テキストのログはそのまま出る）。"""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+
+    def emit(self, record):
+        try:
+            # downloader.http のリトライ: log.warning("%s (%s/%s)", msg, tries, retries+1)
+            if record.msg == "%s (%s/%s)" and len(record.args or ()) == 3:
+                msg, attempt, total = record.args
+                emit("retry", attempt=int(attempt), max=int(total),
+                     message=str(msg), logger=record.name)
+            elif record.levelno >= logging.ERROR:
+                # log.error("%s: %s", exc.__class__.__name__, exc) の形なら例外クラス名も送る
+                kind = path = None
+                if record.msg == "%s: %s" and record.args and isinstance(record.args[0], str):
+                    kind = record.args[0]
+                # DownloadJob: log.error("Failed to download %s", ...) のときは保存先も送る
+                elif record.msg == "Failed to download %s" and _pathfmt is not None:
+                    path = getattr(_pathfmt, "path", None) or None
+                emit("error", message=record.getMessage(), logger=record.name, kind=kind, path=path)
+        except Exception:
+            pass
+
+
+def install_event_hooks():
+    """gallery_dl と requests にイベント出力用のフックを差し込む。"""
+    import requests
+    from gallery_dl import output, job
+
+    output.select = EventOutput
+
+    _initialize_logging = output.initialize_logging
+
+    def initialize_logging(loglevel):
+        # gallery-dl は root.handlers[0] を自分の StreamHandler とみなすので、その後ろに追加する
+        log = _initialize_logging(loglevel)
+        logging.getLogger().addHandler(EventLogHandler())
+        return log
+    output.initialize_logging = initialize_logging
+
+    _handle_url = job.DownloadJob.handle_url
+
+    def handle_url(self, url, kwdict):
+        global _archive_hit, _pathfmt
+        _archive_hit = False
+        _pathfmt = self.pathfmt
+        # 多くの抽出器は投稿・アルバム内の番号 (num) とファイル数 (count) を持っている
+        num, count = kwdict.get("num"), kwdict.get("count")
+        emit("item", url=url,
+             num=num if isinstance(num, int) else None,
+             count=count if isinstance(count, int) else None)
+        return _handle_url(self, url, kwdict)
+    job.DownloadJob.handle_url = handle_url
+
+    try:
+        from gallery_dl import archive
+    except ImportError:
+        archive = None      # 古い gallery-dl: ヒットの区別はしない
+    if archive is not None:
+        for cls in (archive.DownloadArchive, archive.DownloadArchiveMemory):
+            def check(self, kwdict, _check=cls.check):
+                global _archive_hit
+                hit = _check(self, kwdict)
+                _archive_hit = bool(hit)
+                return hit
+            cls.check = check
+
+    _send = requests.Session.send
+
+    def send(self, request, **kwargs):
+        response = _send(self, request, **kwargs)
+        if response.status_code >= 400:
+            emit("http", status=response.status_code, url=request.url)
+        return response
+    requests.Session.send = send
+
+
+def run(args) -> int:
+    from gallery_dl import main as gallery_dl_main, config
+    install_event_hooks()
+    # バイト単位の進捗を最初から受け取る（既定では 3 秒経つまで報告されない）。
+    # 設定ファイルで downloader.progress を指定していればそちらが優先される。
+    config.set(("downloader",), "progress", 0.0)
+    emit("hello", protocol=PROTOCOL_VERSION, pid=os.getpid())
+    sys.argv = ["gallery-dl"] + list(args)
+    return gallery_dl_main()
+
+
+def host() -> int:
+    started = time.perf_counter()
+    from gallery_dl import extractor
+    # 抽出器モジュールは URL 判定のたびに遅延 import されるので、先に全部読み込んでおく
+    for _cls in extractor.extractors():
+        pass
+    from gallery_dl import main as _preload, output, job  # noqa: F401
+    import requests  # noqa: F401
+    warmup_ms = (time.perf_counter() - started) * 1000.0
+
+    # テキストの sys.stdin から読むと、gallery-dl が後で stdin の encoding を設定し直せない
+    line = sys.stdin.buffer.readline()
+    if not line.strip():
+        return 0    # プールの終了（stdin が閉じられた）
+    job = json.loads(line.decode("utf-8"))
+    emit("host", warmup_ms=round(warmup_ms, 1))
+    return run(job.get("args", []))
+
 
 if __name__ == "__main__":
-    sys.exit(gallery_dl_main())
+    if sys.argv[1:2] == ["--host"]:
+        sys.exit(host())
+    sys.exit(run(sys.argv[1:]))
@@ -0,0 +1,88 @@
+"""
+gallery_dl_stream.py
+gallery-dl の出力をバイト列のまま受け取って行に分ける読み取り器。
+
+以前はテキストモードの Popen（text=True, bufsize=1, errors="replace"）を for 文で
+1 行ずつ読んでいた。ここでは
+  - パイプに届いている分だけ（read1）をバイト列で受け取り、LF・CR・CRLF で区切る
+    （CR で同じ行を上書きする進捗表示も 1 回ごとに届き、改行を待って止まらない）
+  - 行ごとに UTF-8 で復号する（不正なバイトは置き換え文字になり、前後の行は壊さない）
+  - 区切りの来ない行は MAX_LINE_BYTES ごとに切って渡す（バッファが際限なく伸びない）
+  - 1 回に読めた塊の中で CR だけで終わる行（進捗だけの行）が続いたら最後の 1 行だけを渡す。
+    表示が追いつかずにパイプに出力が溜まっているときほど 1 回に多く読めるので、
+    古い進捗から捨てられ、普通の行は 1 行も落とさない
+返す行は区切り文字を含む（CR で終わる行が進捗だけの行）。Tk には依存しない。
+"""
+from typing import Optional, Iterator
+
+CHUNK_SIZE     = 64 * 1024     # 1 回に読む最大バイト数
+MAX_LINE_BYTES = 64 * 1024     # 区切りのない行をこの長さで切る
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", "replace")
+
+
+class LineReader:
+    """バイト列のストリーム（Popen の stdout など）を行のイテレータにする。
+
+    ``stream`` は read1(n) か read(n) で、届いている分だけを返すものを渡す。
+    読み取りスレッド 1 本から使う。
+    """
+
+    def __init__(self, stream, chunk_size: int = CHUNK_SIZE, max_line: int = MAX_LINE_BYTES):
+        self._read = getattr(stream, "read1", None) or stream.read
+        self.chunk_size = chunk_size
+        self.max_line = max_line
+        self.bytes = 0          # 読んだバイト数
+        self.coalesced = 0      # 次の進捗行が届いていたので捨てた進捗行の数
+
+    def __iter__(self) -> Iterator[str]:
+        read = self._read
+        size = self.chunk_size
+        pending = b""                     # 区切りがまだ来ていない行の頭
+        last_cr: Optional[bytes] = None   # 塊の末尾で渡した進捗行（\r\n の \n が後から来たとき用）
+        while True:
+            chunk = read(size)
+            if not chunk:
+                break
+            self.bytes += len(chunk)
+            data = pending + chunk if pending else chunk
+            lines = data.splitlines(True)
+            if last_cr is not None and lines[0] == b"\n":
+                # \r\n が塊の境目で割れていた: 進捗として渡した行を普通の行として渡し直す
+                lines[0] = last_cr + b"\n"
+            last_cr = None
+
+            tail = lines[-1]
+            if tail.endswith(b"\n"):
+                pending = b""
+            elif tail.endswith(b"\r") and len(chunk) < size:
+                # 届いている分は読み切った: 進捗行はすぐ渡す（次が \n なら上で渡し直す）
+                pending = b""
+                last_cr = tail
+            else:
+                pending = lines.pop()
+                while len(pending) > self.max_line:
+                    cut = self.max_line
+                    while cut > 0 and (pending[cut] & 0xC0) == 0x80:
+                        cut -= 1          # UTF-8 の文字の途中では切らない
+                    cut = cut or self.max_line
+                    lines.append(pending[:cut] + b"\n")
+                    pending = pending[cut:]
+
+            held: Optional[bytes] = None  # 次も進捗行なら捨てる進捗行
+            for raw in lines:
+                if raw.endswith(b"\r"):
+                    if held is not None:
+                        self.coalesced += 1
+                    held = raw
+                    continue
+                if held is not None:
+                    yield _decode(held)
+                    held = None
+                yield _decode(raw)
+            if held is not None:
+                yield _decode(held)
+        if pending:
+            yield _decode(pending)
@@ -0,0 +1,173 @@
+"""
+gallery_dl_throttle.py
+サイトごとの同時実行数・リクエスト頻度の制御と、429/503 を受けたときのバックオフ。
+
+同じサイトのギャラリーを並列に落とすと、各 gallery-dl が自分の都合で
+リクエストを送るので 429 / 503 が連鎖しやすい。ここではジョブ層で
+  - サイトごとの同時実行数の上限（既定 DEFAULT_PER_HOST）
+  - ジョブ開始のトークンバケット（同じサイトで一斉にログイン・API 呼び出しをしない）
+  - 429 / 503 を受けたサイトのリクエスト予算（req/s）を半分にし、指数的に待つ
+    （成功が続けば少しずつ戻す AIMD）
+を管理し、予算は各ワーカーの --sleep-request / sleep-429 として渡す。
+
+gallery-dl の実行中に引数は変えられないので、予算が効くのはそれ以降に始めるジョブだけ。
+抑制していないときのリクエスト間隔は、サイト別プロファイルの sleep_request を
+すべてのジョブに渡して決める（指定がなければ gallery-dl の設定どおり）。
+"""
+import threading
+import time
+from typing import Optional, List, Dict, Tuple
+from urllib.parse import urlsplit
+
+DEFAULT_PER_HOST = 2        # 同じサイトで同時に動かすジョブ数
+MAX_PER_HOST     = 16
+HOST_START_RATE  = 0.5      # 同じサイトでジョブを開始する頻度（/秒）
+BACKOFF_CODES    = (429, 503)
+BACKOFF_BASE     = 30.0     # 最初のバックオフ（秒）。続けて受けるたびに 2 倍
+BACKOFF_MAX      = 600.0
+BACKOFF_DEBOUNCE = 5.0      # この秒数以内の 429/503 は同じ 1 回として数える
+RATE_INITIAL     = 1.0      # 初めて抑制するときのリクエスト予算（req/s）
+RATE_MIN         = 0.1
+RATE_STEP        = 0.05     # ファイル 1 つ成功するごとに戻す量
+RATE_MAX         = 4.0      # ここまで戻ったら抑制を解除する
+
+
+def site_of(url: str) -> str:
+    """URL のホスト名（www. を除く）。"""
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class TokenBucket:
+    """rate 個/秒で補充され、最大 burst 個までためられるトークン。"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: Optional[float] = None) -> float:
+        """トークンを 1 つ取る。取れれば 0、足りなければあと何秒待てばよいかを返す。"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class HostState:
+    """1 サイトぶんの抑制状態。"""
+
+    __slots__ = ("starts", "rate", "strikes", "backoff_until", "last_strike")
+
+    def __init__(self, per_host: int):
+        self.starts = TokenBucket(HOST_START_RATE, max(1, per_host))
+        self.rate: Optional[float] = None     # リクエスト予算（None なら制限なし）
+        self.strikes = 0                      # 連続して受けた 429/503 の回数
+        self.backoff_until = 0.0
+        self.last_strike = 0.0
+
+    @property
+    def backoff(self) -> float:
+        return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** max(0, self.strikes - 1)))
+
+
+class HostScheduler:
+    """サイトごとの状態をまとめて持つ。JobQueue のロックとは別に自分のロックを持つ。"""
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST):
+        self.per_host = max(1, min(MAX_PER_HOST, per_host))
+        self._hosts: Dict[str, HostState] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, host: str) -> HostState:
+        st = self._hosts.get(host)
+        if st is None:
+            st = self._hosts[host] = HostState(self.per_host)
+        return st
+
+    def set_per_host(self, n: int):
+        with self._lock:
+            self.per_host = max(1, min(MAX_PER_HOST, int(n)))
+            for st in self._hosts.values():
+                st.starts.burst = self.per_host
+
+    def admit(self, host: str, running: int, now: Optional[float] = None,
+              limit: Optional[int] = None) -> Tuple[bool, Optional[float]]:
+        """このサイトで新しいジョブを始めてよいか。
+
+        (True, None) なら開始してよい。(False, 秒数) ならその時間が経てば再判定できる。
+        (False, None) は同時実行数の上限なので、実行中のジョブが終われば再判定する。
+        ``limit`` はこのサイトだけの同時実行数（サイト別プロファイルの per_host）。
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            st = self._get(host)
+            if now < st.backoff_until:
+                return False, st.backoff_until - now
+            # 抑制中は 1 本ずつ（予算をそのまま 1 つのワーカーに渡す）
+            limit = 1 if st.rate is not None else (limit or self.per_host)
+            if running >= limit:
+                return False, None
+            wait = st.starts.take(now)
+            if wait > 0:
+                return False, wait
+            return True, None
+
+    def options(self, host: str, sleep: Optional[float] = None) -> List[str]:
+        """このサイトのジョブに付ける gallery-dl のオプション。
+
+        ``sleep`` はサイトのいつものリクエスト間隔（秒）。抑制中はそれと予算の
+        長いほうを使い、sleep-429 も付ける。
+        """
+        with self._lock:
+            st = self._hosts.get(host)
+            if st is None or st.rate is None:
+                return ["--sleep-request", f"{sleep:.2f}"] if sleep else []
+            return ["--sleep-request", f"{max(sleep or 0.0, 1.0 / st.rate):.2f}",
+                    "-o", f"sleep-429={st.backoff:.0f}"]
+
+    def backoff_for(self, host: str) -> float:
+        """抑制中のサイトで gallery-dl が 429 のあと黙って待つ時間（停止検知の猶予に使う）。"""
+        with self._lock:
+            st = self._hosts.get(host)
+            return st.backoff if st is not None and st.rate is not None else 0.0
+
+    def on_http(self, host: str, status: int, now: Optional[float] = None) -> Optional[Tuple[float, float]]:
+        """HTTP エラーを受けた。バックオフを始めたら (待ち秒数, 新しい予算) を返す。"""
+        if status not in BACKOFF_CODES:
+            return None
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            st = self._get(host)
+            if now - st.last_strike < BACKOFF_DEBOUNCE:
+                return None
+            st.last_strike = now
+            st.strikes += 1
+            st.rate = RATE_INITIAL if st.rate is None else max(RATE_MIN, st.rate / 2.0)
+            delay = st.backoff
+            st.backoff_until = max(st.backoff_until, now + delay)
+            return delay, st.rate
+
+    def on_success(self, host: str):
+        """ファイルを 1 つ取得できた。抑制中なら予算を少し戻す。"""
+        with self._lock:
+            st = self._hosts.get(host)
+            if st is None or st.rate is None:
+                return
+            st.strikes = 0
+            st.rate += RATE_STEP
+            if st.rate >= RATE_MAX:
+                st.rate = None
+
+    def throttled(self, now: Optional[float] = None) -> List[Tuple[str, float, float]]:
+        """抑制中のサイト: (サイト, 予算 req/s, バックオフ残り秒数)。"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [(host, st.rate, max(0.0, st.backoff_until - now))
+                    for host, st in sorted(self._hosts.items()) if st.rate is not None]
@@ -0,0 +1,223 @@
+"""
+gallery_dl_watch.py
+cookies/ と json_input/ の監視（"Reload List" や "Convert" を押さなくても反映する）。
+
+Linux では inotify（ctypes 経由、追加の依存なし）で名前の変化だけを受け取る。
+それ以外の OS や inotify が使えない場合は、ディレクトリ自体の更新時刻を
+POLL_INTERVAL ごとに stat し、変わったときだけ scandir で差分を取る。
+どちらもファイルが数千あるディレクトリを定期的に全走査することはない。
+
+新しいファイルは書き込みが終わってから通知する（inotify は IN_CLOSE_WRITE /
+IN_MOVED_TO、ポーリングはサイズと更新時刻が 1 周期変わらなかったとき）。
+コールバックは監視スレッドから呼ばれる。Tk には依存しない。
+"""
+import functools
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Optional, Callable, Dict, Set, Tuple
+
+POLL_INTERVAL = 1.0      # ポーリング方式の周期（秒）
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ISDIR        = 0x40000000
+IN_NONBLOCK     = 0o4000
+IN_CLOEXEC      = 0o2000000
+_EVENT = struct.Struct("iIII")   # wd, mask, cookie, len（この後に name が len バイト）
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+              | IN_DELETE_SELF | IN_MOVE_SELF
+
+
+@functools.lru_cache(maxsize=None)
+def _load_inotify():
+    """libc（inotify 用）。find_library は ldconfig を起動するので 1 回だけ調べる。"""
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    import ctypes.util
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DirWatcher:
+    """ディレクトリ 1 つの中の ``suffix`` で終わるファイルの追加・削除を通知する。
+
+    ``on_added(name)`` / ``on_removed(name)`` はファイル名（パスなし）で呼ばれる。
+    起動時にすでにあるファイルは ``files`` に入るだけで通知しない。
+    """
+
+    def __init__(self, path: str, suffix: str,
+                 on_added: Optional[Callable[[str], None]] = None,
+                 on_removed: Optional[Callable[[str], None]] = None,
+                 poll_interval: float = POLL_INTERVAL, use_inotify: bool = True):
+        self.path = os.path.abspath(path)
+        self.suffix = suffix.lower()
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.files: Set[str] = set()
+        self.mode = "stopped"               # "inotify" / "poll"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.files = self._scan()
+        self._thread = threading.Thread(target=self._run, name=f"watch:{self.path}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.mode = "stopped"
+
+    # 内部処理
+    # ──────────────────────────────────────────────
+    def _match(self, name: str) -> bool:
+        return name.lower().endswith(self.suffix) and not name.startswith(".")
+
+    def _scan(self) -> Set[str]:
+        try:
+            with os.scandir(self.path) as it:
+                # d_type を使うので、エントリごとの stat はしない
+                return {e.name for e in it if self._match(e.name) and e.is_file()}
+        except OSError:
+            return set()
+
+    def _added(self, name: str):
+        if name in self.files:
+            return
+        self.files.add(name)
+        if self.on_added is not None:
+            self.on_added(name)
+
+    def _removed(self, name: str):
+        if name not in self.files:
+            return
+        self.files.discard(name)
+        if self.on_removed is not None:
+            self.on_removed(name)
+
+    def _resync(self):
+        """取りこぼしがありうるとき（キューのあふれ・監視のやり直し）に全体の差分を取る。"""
+        current = self._scan()
+        for name in sorted(self.files - current):
+            self._removed(name)
+        for name in sorted(current - self.files):
+            self._added(name)
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.use_inotify and self._run_inotify():
+                continue            # ディレクトリが作り直された: 監視し直す
+            self._run_poll()
+
+    def _run_inotify(self) -> bool:
+        """inotify で監視する。使えなければ False（ポーリングに切り替える）。"""
+        libc = _load_inotify()
+        if libc is None or not os.path.isdir(self.path):
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            self.use_inotify = False    # 上限（max_user_instances）など: 以後はポーリング
+            return False
+        try:
+            if libc.inotify_add_watch(fd, os.fsencode(self.path), _WATCH_MASK) < 0:
+                self.use_inotify = not os.path.isdir(self.path)
+                return False
+            self.mode = "inotify"
+            self._resync()          # 監視を始めるまでの変化
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                if not self._dispatch(data):
+                    return os.path.isdir(self.path)
+            return True
+        finally:
+            os.close(fd)
+
+    def _dispatch(self, data: bytes) -> bool:
+        """inotify のイベント列を処理する。監視が外れたら False。"""
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._resync()
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                return False
+            if mask & IN_ISDIR or not self._match(name):
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._removed(name)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._added(name)
+            # IN_CREATE だけでは通知しない（書き込み中）。空のファイルを作っただけの
+            # 場合も IN_CLOSE_WRITE が来る
+        return True
+
+    def _run_poll(self):
+        """ディレクトリの更新時刻が変わったときだけ差分を取る。"""
+        self.mode = "poll"
+        last_stamp = None
+        settling: Dict[str, Tuple[int, int]] = {}    # 書き込み中かもしれない新しいファイル
+        while not self._stop.wait(self.poll_interval):
+            try:
+                st = os.stat(self.path)
+                stamp = (st.st_mtime_ns, st.st_ino)
+            except OSError:
+                stamp = None
+            if stamp != last_stamp:
+                last_stamp = stamp
+                current = self._scan() if stamp is not None else set()
+                for name in sorted(self.files - current):
+                    self._removed(name)
+                for name in current - self.files:
+                    settling.setdefault(name, (-1, -1))
+                for name in list(settling):
+                    if name not in current:
+                        del settling[name]
+            # 新しいファイルはサイズと更新時刻が 1 周期変わらなかったら通知する
+            for name, prev in list(settling.items()):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    del settling[name]
+                    continue
+                now = (st.st_size, st.st_mtime_ns)
+                if now == prev:
+                    del settling[name]
+                    self._added(name)
+                else:
+                    settling[name] = now
+            if self.use_inotify and _load_inotify() is not None and os.path.isdir(self.path):
+                return              # ディレクトリができたので inotify に戻る
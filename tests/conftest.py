@@ -0,0 +1,14 @@
+"""
+tests/conftest.py
+テストからリポジトリ直下のモジュール（gallery_dl_*.py）を読み込めるようにする。
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "startup: GUI startup time and deferred work checks")
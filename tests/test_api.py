@@ -0,0 +1,304 @@
+"""
+tests/test_api.py
+ローカル制御 API（gallery_dl_api.ApiServer）のテスト。
+
+gallery-dl は起動せず、JobQueue の launcher に出力を返すだけのスタブを渡す。
+URL に "hold" を含むジョブは止められるまで終わらない。
+"""
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from gallery_dl_api import ApiServer
+from gallery_dl_engine import (JobQueue, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_STOPPED,
+                               FINISHED_STATES)
+from gallery_dl_throttle import HostScheduler
+
+TOKEN = "test-token"
+
+
+class _StubProc:
+    """subprocess.Popen の代わり。パイプに 1 行書き、hold でなければすぐ終わる。"""
+
+    def __init__(self, url: str, hold: bool):
+        r, w = os.pipe()
+        self.stdout = os.fdopen(r, "rb")
+        self.returncode = None
+        self._w = w
+        self._lock = threading.Lock()
+        os.write(w, f"{url}/file.jpg\n".encode("utf-8"))
+        if not hold:
+            self._close(0)
+
+    def _close(self, code: int):
+        with self._lock:
+            if self._w is not None:
+                os.close(self._w)
+                self._w = None
+            if self.returncode is None:
+                self.returncode = code
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def terminate(self):
+        self._close(-15)
+
+    kill = terminate
+
+
+class _UnthrottledHosts(HostScheduler):
+    def admit(self, host, running, now=None, limit=None):
+        return True, None
+
+
+def _launcher(job, args):
+    return _StubProc(job.url, "hold" in job.url)
+
+
+@pytest.fixture
+def api(tmp_path):
+    holder = {}
+    q = JobQueue(str(tmp_path / "queue.json"),
+                 build_args=lambda job: [job.url],
+                 on_event=lambda job, ev: None,
+                 on_message=lambda job, text, tag: holder["api"].message(job, text, tag),
+                 on_state=lambda job: holder["api"].job_changed(job),
+                 on_idle=lambda: None,
+                 launcher=_launcher)
+    q.hosts = _UnthrottledHosts(q.hosts.per_host)
+    cookie_dir = tmp_path / "cookies"
+    cookie_dir.mkdir()
+    (cookie_dir / "site.txt").write_text("# Netscape HTTP Cookie File\n", encoding="utf-8")
+    server = ApiServer(q, port=0, token=TOKEN, cookie_dir=str(cookie_dir))
+    holder["api"] = server
+    server.start()
+    yield server
+    server.stop()
+    q.stop_all()
+
+
+def _call(api, method, path, body=None, content_type="application/json", token=TOKEN):
+    headers = {}
+    if token is not None:
+        headers["Authorization"] = f"Bearer {token}"
+    data = None
+    if body is not None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        headers["Content-Type"] = content_type
+    req = urllib.request.Request(f"http://127.0.0.1:{api.port}{path}", data=data,
+                                 headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as res:
+            return res.status, json.loads(res.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+
+
+def _wait_state(api, job_id, states, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = api.queue.get(job_id)
+        if job is not None and job.state in states:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not reach {states}: {api.queue.get(job_id).state}")
+
+
+# 認証
+# ──────────────────────────────────────────────
+def test_missing_token_is_rejected(api):
+    status, data = _call(api, "GET", "/api/status", token=None)
+    assert status == 401
+    assert "token" in data["error"]
+
+
+def test_wrong_token_is_rejected(api):
+    assert _call(api, "GET", "/api/jobs", token="wrong")[0] == 401
+    assert _call(api, "POST", "/api/jobs", {"urls": ["https://a.example/1"]}, token="wrong")[0] == 401
+    assert len(api.queue.jobs) == 0
+
+
+def test_token_in_query(api):
+    status, data = _call(api, "GET", f"/api/status?token={TOKEN}", token=None)
+    assert status == 200
+    assert data["version"] >= 1
+
+
+# 投入
+# ──────────────────────────────────────────────
+def test_submit_many_urls_as_json(api):
+    urls = [f"https://a.example/post/{i}" for i in range(500)]
+    status, data = _call(api, "POST", "/api/jobs", {"urls": urls, "start": False})
+    assert status == 201
+    assert len(data["jobs"]) == 500
+    assert [j.url for j in api.queue.jobs] == urls
+    assert api.submitted == 500
+    assert not api.queue.active
+
+
+def test_submit_many_urls_as_text(api):
+    urls = [f"https://b.example/post/{i}" for i in range(300)]
+    body = ("# comment\n" + "\n".join(urls) + "\n").encode("utf-8")
+    status, data = _call(api, "POST", "/api/jobs", body, content_type="text/plain")
+    assert status == 201
+    assert len(data["jobs"]) == 300
+    assert [j.url for j in api.queue.jobs] == urls
+    # text/plain の投入はそのまま開始する
+    assert api.queue.active
+    for job_id in data["jobs"]:
+        assert _wait_state(api, job_id, FINISHED_STATES).state == JOB_DONE
+
+
+def test_submit_rejects_bad_bodies(api):
+    assert _call(api, "POST", "/api/jobs", {"urls": []})[0] == 400
+    assert _call(api, "POST", "/api/jobs", b"{not json", content_type="application/json")[0] == 400
+    assert _call(api, "POST", "/api/jobs", [1, 2])[0] == 400
+
+
+@pytest.mark.parametrize("cookie", [".", "..", "../site.txt", "sub/site.txt", "sub\\site.txt",
+                                    "missing.txt", 5])
+def test_submit_rejects_bad_cookie(api, cookie):
+    status, data = _call(api, "POST", "/api/jobs",
+                         {"urls": ["https://a.example/1"], "cookie": cookie, "start": False})
+    assert status == 400, data
+    assert len(api.queue.jobs) == 0
+
+
+def test_submit_with_cookie(api):
+    status, data = _call(api, "POST", "/api/jobs",
+                         {"urls": ["https://a.example/1"], "cookie": "site.txt", "start": False})
+    assert status == 201
+    assert api.queue.get(data["jobs"][0]).cookie == "site.txt"
+
+
+# 一覧と操作
+# ──────────────────────────────────────────────
+def test_jobs_filtered_by_state(api):
+    _, data = _call(api, "POST", "/api/jobs",
+                    {"urls": ["https://a.example/done", "https://b.example/queued"], "start": False})
+    done_id, queued_id = data["jobs"]
+    api.queue.stop(queued_id)             # 待機中 → 停止
+    api.queue.requeue(queued_id)
+    api.queue.get(done_id).state = JOB_DONE
+    status, data = _call(api, "GET", "/api/jobs?state=queued")
+    assert status == 200
+    assert [j["id"] for j in data["jobs"]] == [queued_id]
+    _, data = _call(api, "GET", "/api/jobs?state=done")
+    assert [j["id"] for j in data["jobs"]] == [done_id]
+    _, data = _call(api, "GET", "/api/jobs?state=running")
+    assert data["jobs"] == []
+    _, data = _call(api, "GET", "/api/jobs")
+    assert len(data["jobs"]) == 2
+
+
+def test_cancel_requeue_and_delete(api):
+    _, data = _call(api, "POST", "/api/jobs", {"urls": ["https://hold.example/1"]})
+    job_id = data["jobs"][0]
+    _wait_state(api, job_id, (JOB_RUNNING,))
+
+    # 実行中のジョブは待機中に戻せない
+    status, data = _call(api, "POST", f"/api/jobs/{job_id}/requeue")
+    assert status == 409
+
+    status, data = _call(api, "POST", f"/api/jobs/{job_id}/cancel")
+    assert status == 202
+    job = _wait_state(api, job_id, FINISHED_STATES)
+    assert job.state == JOB_STOPPED
+
+    # 終わったジョブはもう止められない
+    status, data = _call(api, "POST", f"/api/jobs/{job_id}/cancel")
+    assert status == 409
+    assert JOB_STOPPED in data["error"]
+
+    api.queue.stop_all()
+    status, data = _call(api, "POST", f"/api/jobs/{job_id}/requeue")
+    assert status == 200
+    assert data["state"] == JOB_QUEUED
+
+    status, data = _call(api, "DELETE", f"/api/jobs/{job_id}")
+    assert status == 200
+    assert data == {"removed": job_id}
+    assert _call(api, "GET", f"/api/jobs/{job_id}")[0] == 404
+    assert _call(api, "POST", f"/api/jobs/{job_id}/cancel")[0] == 404
+
+
+def test_finished_job_runs_to_done(api):
+    _, data = _call(api, "POST", "/api/jobs", {"urls": ["https://a.example/quick"]})
+    job = _wait_state(api, data["jobs"][0], FINISHED_STATES)
+    assert job.state == JOB_DONE
+    status, info = _call(api, "GET", f"/api/jobs/{job.id}")
+    assert status == 200
+    assert info["state"] == JOB_DONE
+
+
+def test_unknown_routes(api):
+    assert _call(api, "GET", "/api/nothing")[0] == 404
+    assert _call(api, "GET", "/api/jobs/999")[0] == 404
+    _, data = _call(api, "POST", "/api/jobs", {"urls": ["https://a.example/1"], "start": False})
+    assert _call(api, "DELETE", f"/api/jobs/{data['jobs'][0]}/cancel")[0] == 405
+
+
+# イベント
+# ──────────────────────────────────────────────
+def _read_events(res, count):
+    events = []
+    event, data = None, []
+    while len(events) < count:
+        line = res.fp.readline().decode("utf-8")
+        if not line:
+            break
+        line = line.rstrip("\n")
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: "):
+            data.append(line[6:])
+        elif not line and event is not None:
+            events.append((event, json.loads("\n".join(data))))
+            event, data = None, []
+    return events
+
+
+def test_events_stream(api):
+    _, data = _call(api, "POST", "/api/jobs", {"urls": ["https://a.example/1"], "start": False})
+    queued_id = data["jobs"][0]
+
+    conn = http.client.HTTPConnection("127.0.0.1", api.port, timeout=10)
+    conn.request("GET", f"/api/events?token={TOKEN}")
+    res = conn.getresponse()
+    try:
+        assert res.status == 200
+        assert res.getheader("Content-Type").startswith("text/event-stream")
+        # 接続直後: 全体の状態と既存のジョブ
+        (ev1, status), (ev2, job) = _read_events(res, 2)
+        assert ev1 == "status"
+        assert status["counts"][JOB_QUEUED] == 1
+        assert ev2 == "job"
+        assert job["id"] == queued_id
+
+        # その後は変化したジョブが流れる
+        assert _call(api, "POST", f"/api/jobs/{queued_id}/cancel")[0] == 202
+        (ev3, job), = _read_events(res, 1)
+        assert ev3 == "job"
+        assert job["id"] == queued_id
+        assert job["state"] == JOB_STOPPED
+    finally:
+        conn.close()
+
+
+def test_events_require_token(api):
+    conn = http.client.HTTPConnection("127.0.0.1", api.port, timeout=10)
+    try:
+        conn.request("GET", "/api/events")
+        assert conn.getresponse().status == 401
+    finally:
+        conn.close()
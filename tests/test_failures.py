@@ -0,0 +1,40 @@
+"""
+tests/test_failures.py
+失敗アイテムのストア（gallery_dl_failures.FailureStore）が書く再試行用の入力ファイル。
+"""
+import json
+
+from gallery_dl_failures import FailureStore
+
+
+def _options(path):
+    """入力ファイルの行ごとのオプションを {名前: 値} にする。"""
+    opts = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("-"):
+                key, _, value = line[1:].rstrip("\n").partition("=")
+                opts[key] = json.loads(value)
+    return opts
+
+
+def test_input_file_restores_location(tmp_path):
+    store = FailureStore(str(tmp_path / "failures.json"))
+    saved = str(tmp_path / "dl" / "a.jpg")
+    store.record("https://ex.com/a.jpg", "https://ex.com/gallery", None, saved, 404, "Not Found")
+    store.write_input_file(store.due(force=True), str(tmp_path / "retry.txt"))
+    opts = _options(tmp_path / "retry.txt")
+    assert opts["base-directory"] == str(tmp_path / "dl")
+    assert opts["directory"] == []
+    assert opts["filename"] == "a.jpg"
+
+
+def test_input_file_escapes_format_braces(tmp_path):
+    """filename は gallery-dl の書式文字列なので、ファイル名の { } を二重にする。"""
+    store = FailureStore(str(tmp_path / "failures.json"))
+    saved = str(tmp_path / "dl" / "post {id} }x{.jpg")
+    store.record("https://ex.com/b.jpg", "https://ex.com/gallery", None, saved, 404, "Not Found")
+    store.write_input_file(store.due(force=True), str(tmp_path / "retry.txt"))
+    name = _options(tmp_path / "retry.txt")["filename"]
+    assert name == "post {{id}} }}x{{.jpg"
+    assert name.format() == "post {id} }x{.jpg"
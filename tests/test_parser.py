@@ -0,0 +1,107 @@
+"""
+tests/test_parser.py
+テキスト出力の分類（gallery_dl_parser.LineClassifier）のテスト。
+
+入力は gallery-dl 1.32 が実際に出す行（ログ形式 "[{name}][{levelname}] {message}"）。
+"""
+import pytest
+
+from gallery_dl_parser import (
+    LineClassifier, EV_DOWNLOAD, EV_ERROR, EV_INFO, EV_RETRY, EV_WARNING,
+)
+
+
+@pytest.mark.parametrize("line, kind, url, http", [
+    # downloader.http: リトライしない 4xx / リトライ後に諦めた最後の応答
+    ("[downloader.http][warning] '429 Too Many Requests' for 'https://ex.com/a.jpg'",
+     EV_WARNING, "https://ex.com/a.jpg", 429),
+    ("[downloader.http][warning] '404 Not Found' for 'https://ex.com/a.jpg'",
+     EV_WARNING, "https://ex.com/a.jpg", 404),
+    # downloader.http のリトライ（"%s (%s/%s)"）
+    ("[downloader.http][warning] '503 Service Unavailable' for 'https://ex.com/a.jpg' (1/6)",
+     EV_RETRY, "https://ex.com/a.jpg", 503),
+    # 抽出器の HttpError
+    ("[twitter][error] HttpError: '404 Not Found' for 'https://x.com/i/api'",
+     EV_ERROR, "https://x.com/i/api", 404),
+    ("[download][error] Failed to download a.jpg", EV_ERROR, None, None),
+    ("[twitter][info] Requesting https://x.com/i/api/graphql/1/UserMedia",
+     EV_INFO, "https://x.com/i/api/graphql/1/UserMedia", None),
+])
+def test_classify_real_lines(line, kind, url, http):
+    ev = LineClassifier().classify(line)
+    assert ev.kind == kind
+    assert ev.url == url
+    assert ev.http == http
+
+
+def test_retry_counter():
+    ev = LineClassifier().classify(
+        "[downloader.http][warning] '503 Service Unavailable' for 'https://ex.com/a.jpg' (6/6)")
+    assert ev.retry == (6, 6)
+    assert ev.failed_item is None
+
+
+def test_http_error_keeps_full_description():
+    c = LineClassifier()
+    ev = c.classify("[twitter][error] HttpError: '404 Not Found' for 'https://x.com/i/api'")
+    assert ev.failed_item == "HttpError: '404 Not Found' for 'https://x.com/i/api'"
+    assert c.last_url == "https://x.com/i/api"
+
+
+def test_failed_download_takes_url_and_status_from_warning():
+    """"Failed to download" は直前の警告行の URL と HTTP コードを引き継ぐ。"""
+    c = LineClassifier()
+    warn = c.classify("[downloader.http][warning] '404 Not Found' for 'https://ex.com/a.jpg'")
+    assert warn.failed_item is None
+    ev = c.classify("[download][error] Failed to download a.jpg")
+    assert ev.kind == EV_ERROR
+    assert ev.http == 404
+    assert ev.failed_item == "Failed to download a.jpg [HTTP 404] | URL: https://ex.com/a.jpg"
+
+
+def test_failed_download_after_retries():
+    c = LineClassifier()
+    for n in range(1, 7):
+        ev = c.classify(f"[downloader.http][warning] '503 Service Unavailable' "
+                        f"for 'https://ex.com/b.jpg' ({n}/6)")
+        assert ev.kind == EV_RETRY
+    ev = c.classify("[download][error] Failed to download b.jpg")
+    assert ev.http == 503
+    assert ev.failed_item == "Failed to download b.jpg [HTTP 503] | URL: https://ex.com/b.jpg"
+
+
+def test_status_is_not_carried_past_other_lines():
+    c = LineClassifier()
+    c.classify("[downloader.http][warning] '404 Not Found' for 'https://ex.com/a.jpg'")
+    c.classify("# 1 gallery-dl/ex/b.jpg")
+    ev = c.classify("[download][error] Failed to download c.jpg")
+    assert ev.http is None
+    assert ev.failed_item == "Failed to download c.jpg | URL: https://ex.com/a.jpg"
+
+
+@pytest.mark.parametrize("line", [
+    "/tmp/dl/127.0.0.1:8767__ok-2.jpg",
+    "./gallery-dl/twitter/user/1234_1.jpg",
+    "C:\\Users\\me\\DownloadData\\pixiv\\5678_p0.png",
+])
+def test_downloaded_path_line(line):
+    """gallery-dl はダウンロードしたファイルのパスだけを 1 行で出す。"""
+    ev = LineClassifier().classify(line)
+    assert ev.kind == EV_DOWNLOAD
+    assert ev.path == line
+
+
+@pytest.mark.parametrize("line", [
+    "https://ex.com/a.jpg",
+    "# ./gallery-dl/twitter/user/1234_1.jpg",
+    "[twitter][info] Requesting https://x.com/i/api/graphql/1/UserMedia",
+])
+def test_not_a_downloaded_path(line):
+    assert LineClassifier().classify(line).kind != EV_DOWNLOAD
+
+
+def test_download_line():
+    ev = LineClassifier().classify("# 3 gallery-dl/ex/c.jpg  1.5 MB/s")
+    assert ev.kind == EV_DOWNLOAD
+    assert ev.path == "gallery-dl/ex/c.jpg"
+    assert ev.speed == "1.5 MB/s"
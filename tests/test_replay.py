@@ -0,0 +1,41 @@
+"""
+tests/test_replay.py
+記録した本物の gallery-dl 1.32 の出力（tests/data/replay/*.jsonl）を replay_engine で再生し、
+記録の最終行のカウンタ（ダウンロード数・失敗数・リトライ数）と同じ数を数えることを確かめる。
+
+  runner-*.jsonl   gallery_dl_runner.py 経由（構造化イベントあり）。ヘッドレスの --record で記録
+  text-*.jsonl     PATH 上の gallery-dl（テキストだけ）。カウンタは実際の結果
+                   （保存されたファイル・終了コード）から書いたもの
+どちらもローカルの HTTP サーバーに対して記録した: 200 / 503 を 2 回返してから 200 / 404。
+"""
+import glob
+import os
+
+import pytest
+
+from gallery_dl_record import load_recording
+from gallery_dl_replay import replay_engine
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "replay")
+
+
+def _recordings(pattern):
+    paths = sorted(glob.glob(os.path.join(DATA, pattern)))
+    assert paths, f"no recordings match {pattern}"
+    return [load_recording(p) for p in paths]
+
+
+@pytest.mark.parametrize("pattern", ["runner-*.jsonl", "text-*.jsonl"])
+def test_replay_matches_recorded_counts(pattern):
+    recordings = _recordings(pattern)
+    assert all(r.result for r in recordings)
+    result = replay_engine(recordings, timeout=60)
+    assert result.jobs == len(recordings)
+    assert result.mismatches == []
+
+
+def test_replay_all_recordings_in_parallel():
+    recordings = _recordings("*.jsonl")
+    result = replay_engine(recordings, workers=4, timeout=60)
+    assert result.mismatches == []
+    assert result.lines == sum(len(r.lines) for r in recordings)
@@ -0,0 +1,88 @@
+"""
+tests/test_startup.py
+GUI の起動: ウィンドウを出すまでに重いモジュールを読み込まず、ファイルやデータベースを
+開かないこと（それらは _startup_steps で、最初のフレームの後に行う）。
+
+ディスプレイがなくても動くように、GalleryDLApp はスタブの Tk（gallery_dl_replay）で作る。
+本物の Tk での最初のフレームまでの時間は ``python benchmark.py startup --max-frame-ms`` で計る。
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from benchmark import DEFERRED_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 上限は遅い CI でも通るように実測（import 約 20 ms、__init__ 数 ms）の数倍にしてある
+MAX_IMPORT_MS = 250.0
+MAX_INIT_MS   = 150.0
+SAVED_JOBS    = 3000
+
+pytestmark = pytest.mark.startup
+
+_IMPORT_CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import gallery_dl_gui
+print(json.dumps({"import_ms": (time.perf_counter() - t0) * 1000,
+                  "loaded": [m for m in sys.argv[1:] if m in sys.modules]}))
+'''
+
+
+def test_import_defers_heavy_modules():
+    """gallery_dl_gui の import（新しいプロセス）で DEFERRED_MODULES を読み込まない。"""
+    best = None
+    for _ in range(3):
+        out = subprocess.run([sys.executable, "-c", _IMPORT_CHILD, *DEFERRED_MODULES],
+                             cwd=ROOT, capture_output=True, text=True, timeout=60, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        assert result["loaded"] == [], f"imported at startup: {result['loaded']}"
+        best = result["import_ms"] if best is None else min(best, result["import_ms"])
+    assert best < MAX_IMPORT_MS, f"import gallery_dl_gui took {best:.1f} ms"
+
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    """保存済みのキューと失敗アイテムがある作業ディレクトリ。"""
+    jobs = [{"id": i, "url": f"https://example.com/post/{i}", "state": "done"}
+            for i in range(1, SAVED_JOBS + 1)]
+    (tmp_path / "queue.json").write_text(
+        json.dumps({"workers": 5, "per_host": 3, "jobs": jobs}), encoding="utf-8")
+    (tmp_path / "failures.json").write_text(json.dumps({"failures": []}), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_init_defers_stores_and_queue_load(app_dir, monkeypatch):
+    from gallery_dl_replay import _import_gui_with_stub_tk
+
+    gui = _import_gui_with_stub_tk()
+    monkeypatch.setattr(gui, "app_dir", lambda: str(app_dir))
+    root = gui.tk.Tk()
+    started = time.perf_counter()
+    app = gui.GalleryDLApp(root)
+    init_ms = (time.perf_counter() - started) * 1000
+    try:
+        # 最初のフレームまで: キューは空で、ストアも監視もまだない
+        assert app.queue.jobs == []
+        for name in ("archive", "failures", "dedup", "history", "disk", "profiles"):
+            assert getattr(app.queue, name) is None, name
+        assert app.failures is None and app.cookie_jars is None and app.profiles is None
+        assert app._startup_steps[0] == app._open_stores
+        assert init_ms < MAX_INIT_MS, f"GalleryDLApp.__init__ took {init_ms:.1f} ms"
+
+        # 起動の手順が終われば、保存済みのジョブと設定が読み込まれている
+        assert root.run_until(lambda: not app._startup_steps, timeout=30)
+        assert len(app.queue.jobs) == SAVED_JOBS
+        assert app.queue.workers == 5
+        assert app.queue.hosts.per_host == 3
+        for name in ("archive", "failures", "dedup", "history", "disk", "profiles"):
+            assert getattr(app.queue, name) is not None, name
+        assert app.queue.failures is app.failures
+    finally:
+        app._on_close()
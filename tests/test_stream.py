@@ -0,0 +1,74 @@
+"""
+tests/test_stream.py
+gallery-dl の出力を行に分ける読み取り器（gallery_dl_stream.LineReader）のテスト。
+
+パイプの代わりに、決めておいた塊を 1 つずつ返すストリームを使う。
+"""
+from gallery_dl_stream import LineReader
+
+
+class _Chunks:
+    """read1 のたびに次の塊を返す（パイプに届いた分だけを返す read1 の代わり）。"""
+
+    def __init__(self, *chunks: bytes):
+        self._chunks = list(chunks)
+
+    def read1(self, size: int = -1) -> bytes:
+        return self._chunks.pop(0) if self._chunks else b""
+
+
+def _lines(*chunks: bytes, chunk_size: int = 1024):
+    reader = LineReader(_Chunks(*chunks), chunk_size=chunk_size)
+    return list(reader), reader
+
+
+def test_lf_cr_and_crlf():
+    lines, reader = _lines(b"a\nb\r\nc\r")
+    assert lines == ["a\n", "b\r\n", "c\r"]
+    assert reader.bytes == 7
+
+
+def test_crlf_split_after_short_read():
+    """届いた分を読み切った塊が \\r で終わる: 進捗として渡し、\\n が来たら普通の行として渡し直す。"""
+    lines, _ = _lines(b"first\r", b"\nsecond\n")
+    assert lines == ["first\r", "first\r\n", "second\n"]
+
+
+def test_crlf_split_after_full_read():
+    """塊がいっぱいまで読めた（まだ続きがある）ときは \\r の後を待ってから渡す。"""
+    lines, reader = _lines(b"line\r", b"\nnext\n", chunk_size=5)
+    assert lines == ["line\r\n", "next\n"]
+    assert reader.coalesced == 0
+
+
+def test_multibyte_character_split_across_chunks():
+    text = "ダウンロード完了 ✓\n".encode("utf-8")
+    cut = text.index("ロ".encode("utf-8")) + 1       # 「ロ」の 1 バイト目の後で割る
+    lines, _ = _lines(text[:cut], text[cut:])
+    assert lines == ["ダウンロード完了 ✓\n"]
+
+
+def test_long_line_is_not_cut_inside_a_character():
+    reader = LineReader(_Chunks(("あ" * 10 + "\n").encode("utf-8")), max_line=8)
+    lines = list(reader)
+    assert "".join(lines) == "あ" * 10 + "\n"
+    assert all("�" not in line for line in lines)
+
+
+def test_progress_lines_in_one_chunk_are_coalesced():
+    lines, reader = _lines(b"10%\r20%\r30%\rdone\n")
+    assert lines == ["30%\r", "done\n"]
+    assert reader.coalesced == 2
+
+
+def test_ordinary_lines_are_never_dropped():
+    lines, reader = _lines(b"10%\rfile-1.jpg\n20%\r30%\r40%\rfile-2.jpg\n50%\r")
+    assert lines == ["10%\r", "file-1.jpg\n", "40%\r", "file-2.jpg\n", "50%\r"]
+    assert reader.coalesced == 2
+
+
+def test_progress_lines_in_separate_chunks_are_kept():
+    """別々の塊で届いた進捗行は表示が追いついているので、どれも捨てない。"""
+    lines, reader = _lines(b"10%\r", b"20%\r", b"30%\r")
+    assert lines == ["10%\r", "20%\r", "30%\r"]
+    assert reader.coalesced == 0
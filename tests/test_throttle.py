@@ -0,0 +1,26 @@
+"""
+tests/test_throttle.py
+サイトごとの抑制（gallery_dl_throttle.HostScheduler）がジョブに付けるオプション。
+"""
+from gallery_dl_throttle import HostScheduler, RATE_INITIAL
+
+
+def test_no_options_without_profile_or_backoff():
+    assert HostScheduler().options("ex.com") == []
+
+
+def test_profile_spacing_on_every_job():
+    hosts = HostScheduler()
+    assert hosts.options("ex.com", 1.5) == ["--sleep-request", "1.50"]
+
+
+def test_backoff_uses_the_longer_interval():
+    hosts = HostScheduler()
+    delay, rate = hosts.on_http("ex.com", 429, now=100.0)
+    assert rate == RATE_INITIAL
+    opts = hosts.options("ex.com", 0.2)
+    assert opts[:2] == ["--sleep-request", f"{1.0 / RATE_INITIAL:.2f}"]
+    assert opts[2:] == ["-o", f"sleep-429={delay:.0f}"]
+    assert hosts.options("ex.com", 5.0)[:2] == ["--sleep-request", "5.00"]
+    # 他のサイトには影響しない
+    assert hosts.options("other.com") == []